@@ -0,0 +1 @@
+Add an optional `caches.global_max_bytes` setting which limits the estimated total memory used by the in-memory caches, evicting the least recently used entries across all caches.
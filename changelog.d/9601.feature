@@ -0,0 +1 @@
+Add an optional `caches.expiry_time` setting, and a per-cache `expiry_ms` option, to drop cache entries which have not been accessed recently.
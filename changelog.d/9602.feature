@@ -0,0 +1 @@
+Add an opt-in `caches.redis_second_level_cache` option to use Redis as a shared second-level cache for some `@cached` store methods, starting with `get_users_in_room`.
@@ -0,0 +1 @@
+Add an option for `@cachedList` methods to coalesce cache misses from concurrent callers into a single database query.
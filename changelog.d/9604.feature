@@ -0,0 +1 @@
+Add an option to save the keys of selected caches on shutdown and fetch them again on startup, to avoid starting with cold caches after a restart.
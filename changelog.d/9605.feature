@@ -0,0 +1 @@
+Add an option to automatically adjust the sizes of the caches based on how often they miss recently evicted entries.
@@ -0,0 +1 @@
+Serve requests to fetch events from clients ahead of those from background jobs, and make the number of event fetch threads configurable.
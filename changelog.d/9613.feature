@@ -0,0 +1 @@
+Add an option to check the signatures and hashes of events received over federation on the reactor's thread pool.
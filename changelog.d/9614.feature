@@ -0,0 +1 @@
+Remember which events received over federation have had their signatures checked, so they aren't checked again.
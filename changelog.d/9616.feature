@@ -0,0 +1 @@
+Add an option to run frequently used queries as server-side prepared statements on Postgres.
@@ -0,0 +1 @@
+Add support for sending some read-only queries to PostgreSQL read replicas.
@@ -0,0 +1 @@
+Reserve database connections for user-facing requests, and throttle background jobs while requests are waiting for connections.
@@ -0,0 +1 @@
+Add admin APIs listing database query timings by transaction and query fingerprint, and the slowest queries with their query plans.
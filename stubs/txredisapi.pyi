@@ -32,6 +32,10 @@ class RedisProtocol:
         only_if_exists: bool = False,
     ) -> None: ...
     async def get(self, key: str) -> Any: ...
+    async def mget(self, keys: List[str]) -> List[Any]: ...
+    async def delete(self, keys: Union[str, List[str]]) -> int: ...
+    async def incr(self, key: str, amount: int = 1) -> int: ...
+    async def pexpire(self, key: str, time: int) -> bool: ...
 
 class SubscriberProtocol(RedisProtocol):
     def __init__(self, *args, **kwargs): ...
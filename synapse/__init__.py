@@ -17,7 +17,6 @@
 """ This is a reference implementation of a Matrix homeserver.
 """
 
-import json
 import os
 import sys
 
@@ -40,11 +39,17 @@ try:
 except ImportError:
     pass
 
-# Use the standard library json implementation instead of simplejson.
+# Use the standard library json implementation instead of simplejson, with an
+# encoder which understands the read-only views used for frozen events.
 try:
     from canonicaljson import set_json_library
 
-    set_json_library(json)
+    from synapse.util.frozenutils import ViewAwareJSONEncoder
+
+    class _ViewAwareJsonLibrary:
+        JSONEncoder = ViewAwareJSONEncoder
+
+    set_json_library(_ViewAwareJsonLibrary)
 except ImportError:
     pass
 
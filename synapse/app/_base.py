@@ -36,6 +36,11 @@ from synapse.crypto import context_factory
 from synapse.logging.context import PreserveLoggingContext
 from synapse.metrics.background_process_metrics import wrap_as_background_process
 from synapse.util.async_helpers import Linearizer
+from synapse.util.caches.autotune import setup_cache_auto_tuning
+from synapse.util.caches.lrucache import (
+    setup_cache_memory_limit,
+    setup_expire_lru_cache_entries,
+)
 from synapse.util.daemonize import daemonize_process
 from synapse.util.rlimit import change_resource_limit
 from synapse.util.versionstring import get_version_string
@@ -315,6 +320,12 @@ async def start(hs: "synapse.server.HomeServer", listeners: Iterable[ListenerCon
     # Start the tracer
     synapse.logging.opentracing.init_tracer(hs)  # type: ignore[attr-defined] # noqa
 
+    # Warm up the caches from the snapshot saved at the last shutdown (if any),
+    # and save a new one when we shut down.
+    cache_snapshotter = hs.get_cache_snapshotter()
+    await cache_snapshotter.restore()
+    hs.get_reactor().addSystemEventTrigger("before", "shutdown", cache_snapshotter.save)
+
     # It is now safe to start your Synapse.
     hs.start_listening(listeners)
     hs.get_datastore().db_pool.start_profiling()
@@ -328,6 +339,12 @@ async def start(hs: "synapse.server.HomeServer", listeners: Iterable[ListenerCon
     setup_sentry(hs)
     setup_sdnotify(hs)
 
+    # Start enforcing the global cache memory limit, if one is configured, and
+    # expiring cache entries which haven't been used recently.
+    setup_cache_memory_limit(hs)
+    setup_expire_lru_cache_entries(hs)
+    setup_cache_auto_tuning(hs)
+
     # If background tasks are running on the main process, start collecting the
     # phone home stats.
     if hs.config.run_background_tasks:
@@ -16,7 +16,7 @@
 import os
 import re
 import threading
-from typing import Callable, Dict
+from typing import Callable, Dict, List, Optional
 
 from ._base import Config, ConfigError
 
@@ -31,6 +31,12 @@ _CACHES_LOCK = threading.Lock()
 
 _DEFAULT_FACTOR_SIZE = 0.5
 _DEFAULT_EVENT_CACHE_SIZE = "10K"
+_DEFAULT_SERIALIZED_EVENT_CACHE_SIZE = "5K"
+_DEFAULT_SNAPSHOT_MAX_KEYS_PER_CACHE = 10000
+_DEFAULT_SNAPSHOT_RESTORE_TIMEOUT = "1m"
+_DEFAULT_AUTO_TUNE_INTERVAL = "5m"
+_DEFAULT_AUTO_TUNE_MIN_FACTOR = 0.1
+_DEFAULT_AUTO_TUNE_MAX_FACTOR = 5.0
 
 
 class CacheProperties:
@@ -41,6 +47,11 @@ class CacheProperties:
         )
         self.resize_all_caches_func = None
 
+        # Cache factors chosen by the cache auto-tuner, by canonicalised cache
+        # name. These are used for caches which don't have a factor set in the
+        # config.
+        self.auto_tuned_factors = {}  # type: Dict[str, float]
+
 
 properties = CacheProperties()
 
@@ -83,6 +94,22 @@ def add_resizable_cache(cache_name: str, cache_resize_callback: Callable):
         properties.resize_all_caches_func()
 
 
+def set_auto_tuned_cache_factors(factors: Dict[str, float]):
+    """Update the cache factors chosen by the cache auto-tuner, and resize the
+    caches accordingly.
+
+    Args:
+        factors: A map from cache name to its new cache factor. Caches which
+            aren't included keep their current factor.
+    """
+    properties.auto_tuned_factors.update(
+        {_canonicalise_cache_name(name): factor for name, factor in factors.items()}
+    )
+
+    if properties.resize_all_caches_func:
+        properties.resize_all_caches_func()
+
+
 class CacheConfig(Config):
     section = "caches"
     _environ = os.environ
@@ -94,6 +121,7 @@ class CacheConfig(Config):
             os.environ.get(_CACHE_PREFIX, _DEFAULT_FACTOR_SIZE)
         )
         properties.resize_all_caches_func = None
+        properties.auto_tuned_factors.clear()
         with _CACHES_LOCK:
             _CACHES.clear()
 
@@ -112,6 +140,13 @@ class CacheConfig(Config):
         #
         #event_cache_size: 10K
 
+        # The number of events whose JSON encoding for clients is cached in
+        # memory, so that it can be reused when the same event is sent to
+        # several clients. Like other caches, this is scaled by the cache
+        # factors below, under the name `serialized_event_json`.
+        #
+        #serialized_event_cache_size: 5K
+
         caches:
            # Controls the global cache factor, which is the default cache factor
            # for all caches if a specific factor for that cache is not otherwise
@@ -142,12 +177,98 @@ class CacheConfig(Config):
            #
            per_cache_factors:
              #get_users_who_share_room_with_user: 2.0
+
+           # An approximate limit on the total amount of memory used by the
+           # in-memory caches. If set, Synapse estimates the size of each
+           # cache entry and periodically evicts the least recently used
+           # entries, across all caches, until the total is within the limit.
+           # This is applied in addition to the per-cache size limits above.
+           #
+           # Estimating entry sizes has a small CPU cost, so this is disabled
+           # by default.
+           #
+           #global_max_bytes: 1G
+
+           # Entries which have not been read or written for this long are
+           # dropped from the in-memory caches, so that memory usage shrinks
+           # back down after a spike in traffic. Individual caches may use a
+           # different expiry time. Expired entries are removed by a background
+           # job which runs every 30 seconds.
+           #
+           # By default, entries are only dropped when a cache is full.
+           #
+           #expiry_time: 30m
+
+           # If Redis is enabled, share the results of selected caches between
+           # workers via Redis, so that a worker which misses in its in-memory
+           # cache can use another worker's result rather than fetching it from
+           # the database. This adds a round trip to Redis to each miss in those
+           # caches, and uses memory on the Redis server. Defaults to false.
+           #
+           #redis_second_level_cache: true
+
+           # Save the keys of the most recently used entries of selected caches
+           # to a file on shutdown, and fetch them again on startup before
+           # serving traffic, so that restarts don't start with cold caches.
+           # Only the keys are saved: the values are always fetched from the
+           # database, so they can't be stale. Each worker should use its own
+           # file.
+           #
+           snapshot:
+             # The file to save the snapshot to. Snapshots are disabled if this
+             # is not set.
+             #
+             #path: /path/to/cache_snapshot.json
+
+             # The names of the caches to snapshot. These are the names of
+             # cached storage methods, or `*getEvent*` for the event cache.
+             #
+             #caches:
+             #  - "*getEvent*"
+             #  - get_rooms_for_user_with_stream_ordering
+             #  - get_users_in_room
+
+             # The maximum number of keys to save for each cache. Defaults to
+             # 10000.
+             #
+             #max_keys_per_cache: 10000
+
+             # Startup waits for the snapshot to be restored, so that the caches
+             # are warm before serving traffic. Give up on restoring the
+             # remaining entries after this long. Defaults to 1m.
+             #
+             #restore_timeout: 5m
+
+           # Periodically move space from caches which rarely need entries they
+           # have evicted to caches which often do, keeping the total number of
+           # cache entries the same. Only caches which don't have a factor set
+           # in per_cache_factors (or an environment variable) are adjusted.
+           #
+           auto_tune:
+             # Set to true to enable cache auto-tuning. Defaults to false.
+             #
+             #enabled: true
+
+             # How often to adjust the cache sizes. Defaults to 5m.
+             #
+             #interval: 10m
+
+             # The smallest and largest cache factors the auto-tuner will give
+             # a cache. Default to 0.1 and 5.0.
+             #
+             #min_factor: 0.2
+             #max_factor: 2.0
         """
 
     def read_config(self, config, **kwargs):
         self.event_cache_size = self.parse_size(
             config.get("event_cache_size", _DEFAULT_EVENT_CACHE_SIZE)
         )
+        self.serialized_event_cache_size = self.parse_size(
+            config.get(
+                "serialized_event_cache_size", _DEFAULT_SERIALIZED_EVENT_CACHE_SIZE
+            )
+        )
         self.cache_factors = {}  # type: Dict[str, float]
 
         cache_config = config.get("caches") or {}
@@ -160,6 +281,63 @@ class CacheConfig(Config):
         # Set the global one so that it's reflected in new caches
         properties.default_factor_size = self.global_factor
 
+        self.global_max_bytes = None  # type: Optional[int]
+        global_max_bytes = cache_config.get("global_max_bytes")
+        if global_max_bytes is not None:
+            self.global_max_bytes = self.parse_size(global_max_bytes)
+
+        self.expiry_time_msec = None  # type: Optional[int]
+        expiry_time = cache_config.get("expiry_time")
+        if expiry_time is not None:
+            self.expiry_time_msec = self.parse_duration(expiry_time)
+
+        self.redis_second_level_cache = bool(
+            cache_config.get("redis_second_level_cache", False)
+        )
+
+        snapshot_config = cache_config.get("snapshot") or {}
+        self.snapshot_path = snapshot_config.get("path")  # type: Optional[str]
+        if self.snapshot_path is not None:
+            self.snapshot_path = self.abspath(self.snapshot_path)
+
+        self.snapshot_caches = snapshot_config.get("caches") or []  # type: List[str]
+        if not isinstance(self.snapshot_caches, list) or not all(
+            isinstance(name, str) for name in self.snapshot_caches
+        ):
+            raise ConfigError("caches.snapshot.caches must be a list of cache names")
+
+        self.snapshot_max_keys_per_cache = snapshot_config.get(
+            "max_keys_per_cache", _DEFAULT_SNAPSHOT_MAX_KEYS_PER_CACHE
+        )
+        if not isinstance(self.snapshot_max_keys_per_cache, int):
+            raise ConfigError("caches.snapshot.max_keys_per_cache must be an integer")
+
+        self.snapshot_restore_timeout_msec = self.parse_duration(
+            snapshot_config.get("restore_timeout", _DEFAULT_SNAPSHOT_RESTORE_TIMEOUT)
+        )
+
+        auto_tune_config = cache_config.get("auto_tune") or {}
+        self.auto_tune_enabled = bool(auto_tune_config.get("enabled", False))
+        self.auto_tune_interval_msec = self.parse_duration(
+            auto_tune_config.get("interval", _DEFAULT_AUTO_TUNE_INTERVAL)
+        )
+        self.auto_tune_min_factor = auto_tune_config.get(
+            "min_factor", _DEFAULT_AUTO_TUNE_MIN_FACTOR
+        )
+        self.auto_tune_max_factor = auto_tune_config.get(
+            "max_factor", _DEFAULT_AUTO_TUNE_MAX_FACTOR
+        )
+        if not isinstance(self.auto_tune_min_factor, (int, float)) or not isinstance(
+            self.auto_tune_max_factor, (int, float)
+        ):
+            raise ConfigError(
+                "caches.auto_tune.min_factor and max_factor must be numbers"
+            )
+        if self.auto_tune_min_factor > self.auto_tune_max_factor:
+            raise ConfigError(
+                "caches.auto_tune.min_factor must not be greater than max_factor"
+            )
+
         # Load cache factors from the config
         individual_factors = cache_config.get("per_cache_factors") or {}
         if not isinstance(individual_factors, dict):
@@ -204,5 +382,14 @@ class CacheConfig(Config):
         # block other threads from modifying _CACHES while we iterate it.
         with _CACHES_LOCK:
             for cache_name, callback in _CACHES.items():
-                new_factor = self.cache_factors.get(cache_name, self.global_factor)
+                new_factor = self.cache_factors.get(
+                    cache_name,
+                    properties.auto_tuned_factors.get(cache_name, self.global_factor),
+                )
                 callback(new_factor)
+
+    def has_cache_factor(self, cache_name: str) -> bool:
+        """Whether a cache factor has been set for the given cache in the config or
+        through an environment variable.
+        """
+        return _canonicalise_cache_name(cache_name) in self.cache_factors
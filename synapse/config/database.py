@@ -15,6 +15,7 @@
 # limitations under the License.
 import logging
 import os
+from typing import List
 
 from synapse.config._base import Config, ConfigError
 
@@ -62,6 +63,71 @@ DEFAULT_CONFIG = """\
 #    cp_min: 5
 #    cp_max: 10
 #
+# 'event_fetch_threads' sets the maximum number of database connections used
+# at once to fetch events. Requests from background jobs, and very large
+# requests, are limited to all but one of them so that requests from clients
+# aren't held up behind them. Defaults to 3.
+#
+#database:
+#  name: psycopg2
+#  event_fetch_threads: 5
+#  args:
+#    ...
+#
+# 'prepared_statement_cache_size', for Postgres only, enables server-side
+# prepared statements for frequently run queries, so that they aren't parsed
+# and planned each time. It sets the number of statements kept prepared on
+# each connection. Don't enable it if connecting through a pooler which
+# doesn't support prepared statements, such as PgBouncer in transaction
+# pooling mode. Defaults to 0 (disabled).
+#
+#database:
+#  name: psycopg2
+#  prepared_statement_cache_size: 100
+#  args:
+#    ...
+#
+# 'replicas', for Postgres only, lists read replicas of the database. Some
+# read-only queries, such as room pagination and searches, are sent to a replica
+# which has caught up far enough, rather than the primary. Each replica's 'args'
+# override the primary's.
+#
+#database:
+#  name: psycopg2
+#  args:
+#    ...
+#  replicas:
+#    - args:
+#        host: replica1.example.com
+#    - args:
+#        host: replica2.example.com
+#
+# 'reserved_foreground_connections', for Postgres only, sets how many of the
+# connections in the pool background jobs such as background updates, purges
+# and notification rotation can't use, so that they are kept free for requests
+# from clients. Defaults to 2.
+#
+# 'background_throttle_ms', for Postgres only: while other database work has
+# been waiting longer than this for a connection, background jobs are limited to
+# one connection. Defaults to 50.
+#
+#database:
+#  name: psycopg2
+#  reserved_foreground_connections: 4
+#  background_throttle_ms: 100
+#  args:
+#    ...
+#
+# 'slow_query_threshold_ms' sets how long a query has to take for it to be
+# logged and captured, along with its query plan, for the slow queries admin
+# API. By default slow queries aren't captured.
+#
+#database:
+#  name: psycopg2
+#  slow_query_threshold_ms: 500
+#  args:
+#    ...
+#
 # For more information on using Synapse with Postgres, see `docs/postgres.md`.
 #
 database:
@@ -79,8 +145,11 @@ class DatabaseConnectionConfig:
         db_config: The config for a particular database, as per `database`
             section of main config. Has three fields: `name` for database
             module name, `args` for the args to give to the database
-            connector, and optional `data_stores` that is a list of stores to
-            provision on this database (defaulting to all).
+            connector, optional `data_stores` that is a list of stores to
+            provision on this database (defaulting to all), and optional
+            `event_fetch_threads`, `prepared_statement_cache_size`,
+            `replicas`, `reserved_foreground_connections`,
+            `background_throttle_ms` and `slow_query_threshold_ms`.
     """
 
     def __init__(self, name: str, db_config: dict):
@@ -98,8 +167,75 @@ class DatabaseConnectionConfig:
         if data_stores is None:
             data_stores = ["main", "state"]
 
+        event_fetch_threads = db_config.get("event_fetch_threads", 3)
+        if not isinstance(event_fetch_threads, int) or event_fetch_threads < 1:
+            raise ConfigError("'event_fetch_threads' must be a positive integer")
+
+        prepared_statement_cache_size = db_config.get(
+            "prepared_statement_cache_size", 0
+        )
+        if (
+            not isinstance(prepared_statement_cache_size, int)
+            or prepared_statement_cache_size < 0
+        ):
+            raise ConfigError(
+                "'prepared_statement_cache_size' must be a non-negative integer"
+            )
+
+        reserved_foreground_connections = db_config.get(
+            "reserved_foreground_connections", 2
+        )
+        if (
+            not isinstance(reserved_foreground_connections, int)
+            or reserved_foreground_connections < 0
+        ):
+            raise ConfigError(
+                "'reserved_foreground_connections' must be a non-negative integer"
+            )
+
+        background_throttle_ms = db_config.get("background_throttle_ms", 50)
+        if (
+            not isinstance(background_throttle_ms, (int, float))
+            or background_throttle_ms < 0
+        ):
+            raise ConfigError("'background_throttle_ms' must be a non-negative number")
+
+        slow_query_threshold_ms = db_config.get("slow_query_threshold_ms")
+        if slow_query_threshold_ms is not None and (
+            not isinstance(slow_query_threshold_ms, (int, float))
+            or slow_query_threshold_ms < 0
+        ):
+            raise ConfigError("'slow_query_threshold_ms' must be a non-negative number")
+
+        replicas = db_config.get("replicas") or []
+        if replicas and db_engine != "psycopg2":
+            raise ConfigError("Read replicas are only supported on PostgreSQL")
+
+        self.replicas = []  # type: List[DatabaseConnectionConfig]
+        for i, replica_config in enumerate(replicas):
+            if not isinstance(replica_config, dict) or not isinstance(
+                replica_config.get("args", {}), dict
+            ):
+                raise ConfigError(
+                    "Invalid database replica config: %r" % (replica_config,)
+                )
+
+            replica_args = dict(db_config.get("args", {}))
+            replica_args.update(replica_config.get("args", {}))
+            self.replicas.append(
+                DatabaseConnectionConfig(
+                    "%s-replica-%d" % (name, i),
+                    {"name": db_engine, "args": replica_args},
+                )
+            )
+
         self.name = name
         self.config = db_config
+        self.event_fetch_threads = event_fetch_threads
+        self.prepared_statement_cache_size = prepared_statement_cache_size
+        self.reserved_foreground_connections = reserved_foreground_connections
+        self.background_throttle_ms = background_throttle_ms
+        self.slow_query_threshold_ms = slow_query_threshold_ms
 
         # The `data_stores` config is actually talking about `databases` (we
         # changed the name).
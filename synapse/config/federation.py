@@ -45,6 +45,26 @@ class FederationConfig(Config):
             "allow_profile_lookup_over_federation", True
         )
 
+        verification_config = config.get("federation_verification") or {}
+        validate_config(
+            _VERIFICATION_SCHEMA, verification_config, ("federation_verification",)
+        )
+        self.federation_verification_use_threads = verification_config.get(
+            "use_threads", False
+        )
+        self.federation_verification_batch_size = verification_config.get(
+            "batch_size", 50
+        )
+        self.federation_verification_max_concurrent_batches = verification_config.get(
+            "max_concurrent_batches", 4
+        )
+        self.federation_verification_signature_cache_size = verification_config.get(
+            "signature_cache_size", 10000
+        )
+        self.federation_verification_persist_signature_cache = verification_config.get(
+            "persist_signature_cache", False
+        )
+
     def generate_config_section(self, config_dir_path, server_name, **kwargs):
         return """\
         ## Federation ##
@@ -76,7 +96,51 @@ class FederationConfig(Config):
         # on this homeserver. Defaults to 'true'.
         #
         #allow_profile_lookup_over_federation: false
+
+        # Settings for checking the signatures and hashes of events received over
+        # federation.
+        #
+        federation_verification:
+          # Uncomment to run the checks on the reactor's thread pool rather than
+          # the main thread, so that large responses (for example when joining a
+          # big room) don't hold up other requests. Defaults to 'false'.
+          #
+          #use_threads: true
+
+          # The number of events checked in one go by each thread. Defaults
+          # to 50.
+          #
+          #batch_size: 100
+
+          # The maximum number of threads used for the checks at once. This
+          # should be less than the size of the reactor's thread pool (10 by
+          # default), which is also used for DNS lookups. Defaults to 4.
+          #
+          #max_concurrent_batches: 2
+
+          # The number of events to remember having checked the signatures of, so
+          # that they aren't checked again when they are received again. Set to 0
+          # to check every event every time. Defaults to 10000.
+          #
+          #signature_cache_size: 50000
+
+          # Uncomment to also remember which events' signatures have been
+          # checked in the database, for a week, so that workers share them and
+          # they survive a restart. Defaults to 'false'.
+          #
+          #persist_signature_cache: true
         """
 
 
 _METRICS_FOR_DOMAINS_SCHEMA = {"type": "array", "items": {"type": "string"}}
+
+_VERIFICATION_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "use_threads": {"type": "boolean"},
+        "batch_size": {"type": "integer", "minimum": 1},
+        "max_concurrent_batches": {"type": "integer", "minimum": 1},
+        "signature_cache_size": {"type": "integer", "minimum": 0},
+        "persist_signature_cache": {"type": "boolean"},
+    },
+}
@@ -28,7 +28,7 @@ from unpaddedbase64 import decode_base64, encode_base64
 from synapse.api.errors import Codes, SynapseError
 from synapse.api.room_versions import RoomVersion
 from synapse.events import EventBase
-from synapse.events.utils import prune_event, prune_event_dict
+from synapse.events.utils import prune_event_dict
 from synapse.types import JsonDict
 
 logger = logging.getLogger(__name__)
@@ -40,7 +40,11 @@ def check_event_content_hash(
     event: EventBase, hash_algorithm: Hasher = hashlib.sha256
 ) -> bool:
     """Check whether the hash for this PDU matches the contents"""
-    name, expected_hash = compute_content_hash(event.get_pdu_json(), hash_algorithm)
+    name, expected_hash = _get_cached_hash(
+        event,
+        ("content", hash_algorithm),
+        lambda: compute_content_hash(event.get_pdu_json(), hash_algorithm),
+    )
     logger.debug(
         "Verifying content hash on %s (expecting: %s)",
         event.event_id,
@@ -114,14 +118,45 @@ def compute_event_reference_hash(
     Returns:
         A tuple of the name of hash and the hash as raw bytes.
     """
-    tmp_event = prune_event(event)
-    event_dict = tmp_event.get_pdu_json()
-    event_dict.pop("signatures", None)
-    event_dict.pop("age_ts", None)
-    event_dict.pop("unsigned", None)
-    event_json_bytes = encode_canonical_json(event_dict)
-    hashed = hash_algorithm(event_json_bytes)
-    return hashed.name, hashed.digest()
+
+    def compute() -> Tuple[str, bytes]:
+        event_dict = prune_event_dict(event.room_version, event.get_pdu_json())
+        event_dict.pop("signatures", None)
+        event_dict.pop("age_ts", None)
+        event_dict.pop("unsigned", None)
+        event_json_bytes = encode_canonical_json(event_dict)
+        hashed = hash_algorithm(event_json_bytes)
+        return hashed.name, hashed.digest()
+
+    return _get_cached_hash(event, ("reference", hash_algorithm), compute)
+
+
+def _get_cached_hash(
+    event: EventBase,
+    cache_key: Tuple[str, Hasher],
+    compute: Callable[[], Tuple[str, bytes]],
+) -> Tuple[str, bytes]:
+    """Get a hash of the event, computing it if it hasn't been already.
+
+    Events aren't modified once they have been built (the builder hashes and
+    signs the event dict before the event is created), so the hashes can be
+    cached on the event. Only the hashes are kept, not the canonical JSON they
+    were computed from, as events are kept in memory for a long time.
+
+    Args:
+        event: The event to hash.
+        cache_key: The kind of hash and the hash algorithm.
+        compute: Computes the hash, if it isn't cached.
+
+    Returns:
+        A tuple of the name of hash and the hash as raw bytes.
+    """
+    hashes = event.computed_hashes
+    result = hashes.get(cache_key)
+    if result is None:
+        result = compute()
+        hashes[cache_key] = result
+    return result
 
 
 def compute_event_signature(
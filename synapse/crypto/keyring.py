@@ -58,6 +58,7 @@ from synapse.util.retryutils import NotRetryingDestination
 
 if TYPE_CHECKING:
     from synapse.app.homeserver import HomeServer
+    from synapse.crypto.verification_executor import VerificationExecutor
 
 logger = logging.getLogger(__name__)
 
@@ -108,6 +109,7 @@ class Keyring:
         self, hs: "HomeServer", key_fetchers: "Optional[Iterable[KeyFetcher]]" = None
     ):
         self.clock = hs.get_clock()
+        self._verification_executor = hs.get_verification_executor()
 
         if key_fetchers is None:
             key_fetchers = (
@@ -230,7 +232,7 @@ class Keyring:
             #
             # We want _handle_key_request to log to the right context, so we
             # wrap it with preserve_fn (aka run_in_background)
-            return handle(verify_request)
+            return handle(verify_request, self._verification_executor)
 
         results = [process(r) for r in verify_requests]
 
@@ -880,11 +882,14 @@ class ServerKeyFetcher(BaseV2KeyFetcher):
         return keys
 
 
-async def _handle_key_deferred(verify_request: VerifyJsonRequest) -> None:
+async def _handle_key_deferred(
+    verify_request: VerifyJsonRequest, verification_executor: "VerificationExecutor"
+) -> None:
     """Waits for the key to become available, and then performs a verification
 
     Args:
         verify_request:
+        verification_executor: Where to run the signature check.
 
     Raises:
         SynapseError if there was a problem performing the verification
@@ -896,7 +901,9 @@ async def _handle_key_deferred(verify_request: VerifyJsonRequest) -> None:
     json_object = verify_request.json_object
 
     try:
-        verify_signed_json(json_object, server_name, verify_key)
+        await verification_executor.run(
+            verify_signed_json, json_object, server_name, verify_key
+        )
     except SignatureVerifyException as e:
         logger.debug(
             "Error verifying signature for %s:%s:%s with key %s: %s",
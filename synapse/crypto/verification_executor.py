@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+# Copyright 2021 The Matrix.org Foundation C.I.C.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import logging
+from typing import TYPE_CHECKING, Any, Callable, List, Tuple, TypeVar
+
+from prometheus_client import Histogram
+
+from twisted.internet import defer
+from twisted.python.failure import Failure
+
+from synapse.logging.context import (
+    PreserveLoggingContext,
+    defer_to_thread,
+    make_deferred_yieldable,
+)
+from synapse.metrics.background_process_metrics import run_as_background_process
+from synapse.util.async_helpers import Linearizer
+from synapse.util.iterutils import batch_iter
+
+if TYPE_CHECKING:
+    from synapse.server import HomeServer
+
+logger = logging.getLogger(__name__)
+
+R = TypeVar("R")
+
+verification_batch_size = Histogram(
+    "synapse_crypto_verification_batch_size",
+    "Number of checks run in each batch on the verification thread pool",
+    buckets=(1, 2, 5, 10, 20, 50, 100, 200, 500),
+)
+
+
+class VerificationExecutor:
+    """Runs signature and hash checks on events, optionally on the reactor's
+    thread pool.
+
+    Checks requested in the same reactor tick are gathered into batches, so
+    that a large federation response is checked by a few threads at once
+    rather than by the main thread one event at a time. The ed25519 checks
+    release the GIL, so run in parallel with the reactor.
+
+    If `federation_verification.use_threads` is off, checks run inline.
+    """
+
+    def __init__(self, hs: "HomeServer"):
+        self._reactor = hs.get_reactor()
+
+        config = hs.config.federation
+        self._use_threads = config.federation_verification_use_threads
+        self._batch_size = config.federation_verification_batch_size
+
+        self._limiter = Linearizer(
+            name="verification_executor",
+            max_count=config.federation_verification_max_concurrent_batches,
+            clock=hs.get_clock(),
+        )
+
+        # Checks waiting to be batched up, along with the deferreds to resolve
+        # with their results. These are regular, logcontext-agnostic Deferreds.
+        self._pending = []  # type: List[Tuple[Callable, Tuple, defer.Deferred]]
+
+    async def run(self, f: Callable[..., R], *args: Any) -> R:
+        """Run a check, and return its result.
+
+        Args:
+            f: The check to run. It must be safe to run on another thread, so
+                mustn't modify its arguments or use the database.
+            *args: Arguments to pass to f.
+        """
+        if not self._use_threads:
+            return f(*args)
+
+        d = defer.Deferred()  # type: defer.Deferred
+        if not self._pending:
+            self._reactor.callLater(0, self._flush)
+        self._pending.append((f, args, d))
+
+        return await make_deferred_yieldable(d)
+
+    def _flush(self) -> None:
+        pending = self._pending
+        self._pending = []
+
+        for batch in batch_iter(pending, self._batch_size):
+            run_as_background_process("verify_batch", self._run_batch, batch)
+
+    async def _run_batch(
+        self, batch: Tuple[Tuple[Callable, Tuple, defer.Deferred], ...]
+    ) -> None:
+        verification_batch_size.observe(len(batch))
+
+        try:
+            with (await self._limiter.queue(())):
+                results = await defer_to_thread(
+                    self._reactor, _run_checks, [(f, args) for f, args, _ in batch]
+                )
+        except Exception:
+            failure = Failure()
+            results = [failure] * len(batch)
+
+        with PreserveLoggingContext():
+            for (_, _, d), result in zip(batch, results):
+                if isinstance(result, Failure):
+                    d.errback(result)
+                else:
+                    d.callback(result)
+
+
+def _run_checks(checks: List[Tuple[Callable, Tuple]]) -> List[Any]:
+    """Runs the given checks, returning the result of each or the Failure it
+    raised.
+    """
+    results = []  # type: List[Any]
+    for f, args in checks:
+        try:
+            results.append(f(*args))
+        except Exception:
+            results.append(Failure())
+    return results
@@ -17,19 +17,21 @@
 
 import abc
 import os
-from typing import Dict, Optional, Tuple, Type
+from typing import Any, Dict, Iterator, MutableMapping, Optional, Tuple, Type
 
 from unpaddedbase64 import encode_base64
 
 from synapse.api.room_versions import EventFormatVersions, RoomVersion, RoomVersions
 from synapse.types import JsonDict, RoomStreamToken
+from synapse.util import json_decoder
 from synapse.util.caches import intern_dict
-from synapse.util.frozenutils import freeze
+from synapse.util.frozenutils import FrozenDictView
 from synapse.util.stringutils import strtobool
 
-# Whether we should use frozen_dict in FrozenEvent. Using frozen_dicts prevents
-# bugs where we accidentally share e.g. signature dicts. However, converting a
-# dict to frozen_dicts is expensive.
+# Whether we should wrap the dicts of FrozenEvents in read-only views. This
+# prevents bugs where we accidentally modify e.g. the content of a cached event.
+# The views don't copy the dicts, but they do add a little overhead to reading
+# nested fields.
 #
 # NOTE: This is overridden by the configuration by the Synapse worker apps, but
 # for the sake of tests, it is set here while it cannot be configured on the
@@ -97,6 +99,96 @@ class DefaultDictProperty(DictProperty):
         return instance._dict.get(self.key, self.default)
 
 
+class _LazyEventDict(MutableMapping[str, Any]):
+    """The dict of an event which was loaded from the database, which holds the
+    event's JSON and only decodes it when a field is needed which we didn't get
+    from the indexed columns.
+
+    Most of the events in the event cache are only looked at for their type, state
+    key, sender and room, and a JSON string takes a fraction of the memory of the
+    decoded dicts, so this lets us cache far more events.
+
+    Once the JSON has been decoded we keep the decoded dict and drop the JSON.
+    """
+
+    __slots__ = ["_json", "_known_fields", "_decoded", "_signatures", "_unsigned"]
+
+    def __init__(self, json: str, known_fields: Dict[str, Any]):
+        """
+        Args:
+            json: The JSON of the event.
+            known_fields: Top-level fields of the event which we already know.
+                A field which maps to None is known not to be in the event.
+        """
+        self._json = json  # type: Optional[str]
+        self._known_fields = known_fields  # type: Optional[Dict[str, Any]]
+        self._decoded = None  # type: Optional[JsonDict]
+        self._signatures = None  # type: Optional[Dict[str, Dict[str, str]]]
+        self._unsigned = None  # type: Optional[JsonDict]
+
+    def _decode(self) -> JsonDict:
+        if self._decoded is None:
+            assert self._json is not None
+            event_dict = json_decoder.decode(self._json)
+
+            self._signatures = event_dict.pop("signatures", {})
+            self._unsigned = event_dict.pop("unsigned", {})
+
+            # We intern these strings because they turn up a lot (especially when
+            # caching).
+            event_dict = intern_dict(event_dict)
+            if USE_FROZEN_DICTS:
+                event_dict = FrozenDictView(event_dict)
+
+            self._decoded = event_dict
+            self._json = None
+            self._known_fields = None
+
+        return self._decoded
+
+    def is_decoded(self) -> bool:
+        return self._decoded is not None
+
+    def get_decoded(self) -> JsonDict:
+        return self._decode()
+
+    def get_signatures(self) -> Dict[str, Dict[str, str]]:
+        self._decode()
+        assert self._signatures is not None
+        return self._signatures
+
+    def get_unsigned(self) -> JsonDict:
+        self._decode()
+        assert self._unsigned is not None
+        return self._unsigned
+
+    def freeze(self) -> None:
+        decoded = self._decode()
+        if not isinstance(decoded, FrozenDictView):
+            self._decoded = FrozenDictView(decoded)
+
+    def __getitem__(self, key: str) -> Any:
+        if self._known_fields is not None and key in self._known_fields:
+            value = self._known_fields[key]
+            if value is None:
+                raise KeyError(key)
+            return value
+
+        return self._decode()[key]
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        self._decode()[key] = value
+
+    def __delitem__(self, key: str) -> None:
+        del self._decode()[key]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._decode())
+
+    def __len__(self) -> int:
+        return len(self._decode())
+
+
 class _EventInternalMetadata:
     __slots__ = ["_dict", "stream_ordering"]
 
@@ -214,22 +306,25 @@ class EventBase(metaclass=abc.ABCMeta):
         self,
         event_dict: JsonDict,
         room_version: RoomVersion,
-        signatures: Dict[str, Dict[str, str]],
-        unsigned: JsonDict,
+        signatures: Optional[Dict[str, Dict[str, str]]],
+        unsigned: Optional[JsonDict],
         internal_metadata_dict: JsonDict,
         rejected_reason: Optional[str],
     ):
         assert room_version.event_format == self.format_version
 
         self.room_version = room_version
-        self.signatures = signatures
-        self.unsigned = unsigned
+        self._signatures = signatures
+        self._unsigned = unsigned
         self.rejected_reason = rejected_reason
 
         self._dict = event_dict
 
         self.internal_metadata = _EventInternalMetadata(internal_metadata_dict)
 
+        # The hashes of the event, as computed by `synapse.crypto.event_signing`.
+        self.computed_hashes = {}  # type: Dict[Tuple[str, Any], Tuple[str, bytes]]
+
     auth_events = DictProperty("auth_events")
     depth = DictProperty("depth")
     content = DictProperty("content")
@@ -244,6 +339,60 @@ class EventBase(metaclass=abc.ABCMeta):
     type = DictProperty("type")
     user_id = DictProperty("sender")
 
+    @classmethod
+    def from_json(
+        cls,
+        json: str,
+        event_id: str,
+        known_fields: Dict[str, Any],
+        room_version: RoomVersion,
+        internal_metadata_dict: JsonDict,
+        rejected_reason: Optional[str],
+    ) -> "EventBase":
+        """Build an event from its JSON, which is only decoded when a field other
+        than those given in `known_fields` is needed.
+
+        Args:
+            json: The JSON of the event.
+            event_id: The ID of the event.
+            known_fields: Top-level fields of the event which we already know, and
+                so can be read without decoding the JSON. A field which maps to
+                None is known not to be in the event.
+            room_version: The room version of the event.
+            internal_metadata_dict: The internal metadata of the event.
+            rejected_reason: The reason the event was rejected, if it was.
+        """
+        event = cls.__new__(cls)
+        EventBase.__init__(
+            event,
+            _LazyEventDict(json, known_fields),
+            room_version=room_version,
+            signatures=None,
+            unsigned=None,
+            internal_metadata_dict=internal_metadata_dict,
+            rejected_reason=rejected_reason,
+        )
+        event._event_id = event_id
+        return event
+
+    @property
+    def signatures(self) -> Dict[str, Dict[str, str]]:
+        if self._signatures is None:
+            assert isinstance(self._dict, _LazyEventDict)
+            self._signatures = self._dict.get_signatures()
+        return self._signatures
+
+    @property
+    def unsigned(self) -> JsonDict:
+        if self._unsigned is None:
+            assert isinstance(self._dict, _LazyEventDict)
+            self._unsigned = self._dict.get_unsigned()
+        return self._unsigned
+
+    @unsigned.setter
+    def unsigned(self, unsigned: JsonDict) -> None:
+        self._unsigned = unsigned
+
     @property
     def event_id(self) -> str:
         raise NotImplementedError()
@@ -256,7 +405,13 @@ class EventBase(metaclass=abc.ABCMeta):
         return hasattr(self, "state_key") and self.state_key is not None
 
     def get_dict(self) -> JsonDict:
-        d = dict(self._dict)
+        d = self._dict
+        if isinstance(d, _LazyEventDict):
+            d = d.get_decoded()
+
+        # If the event is frozen, the values are read-only views of the event's
+        # own dicts, so can't be modified.
+        d = dict(d)
         d.update({"signatures": self.signatures, "unsigned": dict(self.unsigned)})
 
         return d
@@ -316,8 +471,10 @@ class EventBase(metaclass=abc.ABCMeta):
     def freeze(self):
         """'Freeze' the event dict, so it cannot be modified by accident"""
 
-        # this will be a no-op if the event dict is already frozen.
-        self._dict = freeze(self._dict)
+        if isinstance(self._dict, _LazyEventDict):
+            self._dict.freeze()
+        elif not isinstance(self._dict, FrozenDictView):
+            self._dict = FrozenDictView(self._dict)
 
 
 class FrozenEvent(EventBase):
@@ -346,7 +503,7 @@ class FrozenEvent(EventBase):
         event_dict = intern_dict(event_dict)
 
         if USE_FROZEN_DICTS:
-            frozen_dict = freeze(event_dict)
+            frozen_dict = FrozenDictView(event_dict)
         else:
             frozen_dict = event_dict
 
@@ -404,7 +561,7 @@ class FrozenEventV2(EventBase):
         event_dict = intern_dict(event_dict)
 
         if USE_FROZEN_DICTS:
-            frozen_dict = freeze(event_dict)
+            frozen_dict = FrozenDictView(event_dict)
         else:
             frozen_dict = event_dict
 
@@ -510,3 +667,26 @@ def make_event_from_dict(
     """Construct an EventBase from the given event dict"""
     event_type = _event_type_from_format_version(room_version.event_format)
     return event_type(event_dict, room_version, internal_metadata_dict, rejected_reason)
+
+
+def make_event_from_json(
+    json: str,
+    event_id: str,
+    known_fields: Dict[str, Any],
+    room_version: RoomVersion,
+    internal_metadata_dict: JsonDict = {},
+    rejected_reason: Optional[str] = None,
+) -> EventBase:
+    """Construct an EventBase from the given event JSON, which is decoded lazily.
+
+    See `EventBase.from_json`.
+    """
+    event_type = _event_type_from_format_version(room_version.event_format)
+    return event_type.from_json(
+        json,
+        event_id,
+        known_fields,
+        room_version,
+        internal_metadata_dict,
+        rejected_reason,
+    )
@@ -14,14 +14,17 @@
 # limitations under the License.
 import collections.abc
 import re
-from typing import Any, Mapping, Union
+from typing import Any, Hashable, Mapping, Optional, Union
 
 from frozendict import frozendict
 
 from synapse.api.constants import EventTypes, RelationTypes
 from synapse.api.errors import Codes, SynapseError
 from synapse.api.room_versions import RoomVersion
+from synapse.util import json_encoder
 from synapse.util.async_helpers import yieldable_gather_results
+from synapse.util.caches.lrucache import LruCache
+from synapse.util.frozenutils import FrozenDictView
 
 from . import EventBase
 
@@ -170,7 +173,9 @@ def _copy_field(src, dst, field):
     key_to_move = field.pop(-1)
     sub_dict = src
     for sub_field in field:  # e.g. sub_field => "content"
-        if sub_field in sub_dict and type(sub_dict[sub_field]) in [dict, frozendict]:
+        if sub_field in sub_dict and isinstance(
+            sub_dict[sub_field], (dict, frozendict, FrozenDictView)
+        ):
             sub_dict = sub_dict[sub_field]
         else:
             return
@@ -269,6 +274,98 @@ def format_event_for_client_v2_without_room_id(d):
     return d
 
 
+# The keys of a serialized event which can differ between requests for the same
+# event, and so can't be taken from the cached encoding of the event.
+_PER_REQUEST_KEYS = frozenset(
+    (
+        "unsigned",
+        # format_event_for_client_v1 copies these out of the unsigned dict.
+        "age",
+        "redacted_because",
+        "replaces_state",
+        "prev_content",
+        "invite_room_state",
+    )
+)
+
+
+class SerializedEvent(dict):
+    """An event which has been serialized for clients.
+
+    The JSON encoding of the parts of the event which are the same for every
+    request is cached, so that responses which include the event only need to
+    encode the unsigned data afresh. If the dict is changed after it is created
+    the cached encoding isn't used.
+    """
+
+    __slots__ = ["_encoding_cache", "_encoding_cache_key"]
+
+    def __init__(
+        self,
+        d: Mapping[str, Any],
+        encoding_cache: "LruCache[Hashable, bytes]",
+        encoding_cache_key: Hashable,
+    ):
+        super().__init__(d)
+        self._encoding_cache = encoding_cache  # type: Optional[LruCache]
+        self._encoding_cache_key = encoding_cache_key
+
+    def encode_json(self) -> bytes:
+        """Returns the JSON encoding of the event, as encoded by `json_encoder`."""
+        if self._encoding_cache is None:
+            return json_encoder.encode(self).encode("utf-8")
+
+        static_json = self._encoding_cache.get(self._encoding_cache_key)
+        if static_json is None:
+            static_json = json_encoder.encode(
+                {k: v for k, v in self.items() if k not in _PER_REQUEST_KEYS}
+            ).encode("utf-8")
+            self._encoding_cache.set(self._encoding_cache_key, static_json)
+
+        per_request = {k: self[k] for k in _PER_REQUEST_KEYS if k in self}
+        if not per_request:
+            return static_json
+
+        per_request_json = json_encoder.encode(per_request).encode("utf-8")
+        if static_json == b"{}":
+            return per_request_json
+
+        # Splice the two objects together.
+        return static_json[:-1] + b"," + per_request_json[1:]
+
+    def _changed(self) -> None:
+        self._encoding_cache = None
+
+    def __setitem__(self, key, value):
+        self._changed()
+        super().__setitem__(key, value)
+
+    def __delitem__(self, key):
+        self._changed()
+        super().__delitem__(key)
+
+    def clear(self):
+        self._changed()
+        super().clear()
+
+    def pop(self, *args):
+        self._changed()
+        return super().pop(*args)
+
+    def popitem(self):
+        self._changed()
+        return super().popitem()
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self._changed()
+        return super().setdefault(key, default)
+
+    def update(self, *args, **kwargs):
+        self._changed()
+        super().update(*args, **kwargs)
+
+
 def serialize_event(
     e,
     time_now_ms,
@@ -277,6 +374,7 @@ def serialize_event(
     token_id=None,
     only_event_fields=None,
     is_invite=False,
+    encoding_cache=None,
 ):
     """Serialize event for clients
 
@@ -289,6 +387,9 @@ def serialize_event(
         only_event_fields
         is_invite (bool): Whether this is an invite that is being sent to the
             invitee
+        encoding_cache (LruCache|None): If given, a cache to hold the JSON
+            encodings of serialized events, in which case a `SerializedEvent`
+            is returned.
 
     Returns:
         dict
@@ -335,6 +436,16 @@ def serialize_event(
         ):
             raise TypeError("only_event_fields must be a list of strings")
         d = only_fields(d, only_event_fields)
+    elif encoding_cache is not None:
+        d = SerializedEvent(
+            d,
+            encoding_cache,
+            (
+                e.event_id,
+                event_format if as_client_event else None,
+                e.internal_metadata.is_redacted(),
+            ),
+        )
 
     return d
 
@@ -352,6 +463,13 @@ class EventClientSerializer:
             hs.config.experimental_msc1849_support_enabled
         )
 
+        # The JSON encodings of the events we have serialized, which are spliced
+        # into responses by the JSON encoder.
+        self._encoding_cache = LruCache(
+            cache_name="serialized_event_json",
+            max_size=hs.config.caches.serialized_event_cache_size,
+        )  # type: LruCache[Hashable, bytes]
+
     async def serialize_event(
         self, event, time_now, bundle_aggregations=True, **kwargs
     ):
@@ -371,7 +489,9 @@ class EventClientSerializer:
             return event
 
         event_id = event.event_id
-        serialized_event = serialize_event(event, time_now, **kwargs)
+        serialized_event = serialize_event(
+            event, time_now, encoding_cache=self._encoding_cache, **kwargs
+        )
 
         # If MSC1849 is enabled then we need to look if there are any relations
         # we need to bundle in with the event.
@@ -485,7 +605,7 @@ def validate_canonicaljson(value: Any):
         # Note that Infinity, -Infinity, and NaN are also considered floats.
         raise SynapseError(400, "Bad JSON value: float", Codes.BAD_JSON)
 
-    elif isinstance(value, (dict, frozendict)):
+    elif isinstance(value, (dict, frozendict, FrozenDictView)):
         for v in value.values():
             validate_canonicaljson(v)
 
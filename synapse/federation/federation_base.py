@@ -13,9 +13,13 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
+import hashlib
 import logging
 from collections import namedtuple
-from typing import Iterable, List
+from typing import TYPE_CHECKING, Iterable, List, Optional, Set
+
+from canonicaljson import encode_canonical_json
+from unpaddedbase64 import encode_base64
 
 from twisted.internet import defer
 from twisted.internet.defer import Deferred, DeferredList
@@ -33,8 +37,14 @@ from synapse.logging.context import (
     PreserveLoggingContext,
     current_context,
     make_deferred_yieldable,
+    run_in_background,
 )
+from synapse.metrics.background_process_metrics import run_as_background_process
 from synapse.types import JsonDict, get_domain_from_id
+from synapse.util.caches.lrucache import LruCache
+
+if TYPE_CHECKING:
+    from synapse.server import HomeServer
 
 logger = logging.getLogger(__name__)
 
@@ -48,6 +58,11 @@ class FederationBase:
         self.spam_checker = hs.get_spam_checker()
         self.store = hs.get_datastore()
         self._clock = hs.get_clock()
+        self._verification_executor = hs.get_verification_executor()
+
+        self._signature_cache = None  # type: Optional[VerifiedSignatureCache]
+        if hs.config.federation.federation_verification_signature_cache_size:
+            self._signature_cache = hs.get_verified_signature_cache()
 
     def _check_sigs_and_hash(
         self, room_version: RoomVersion, pdu: EventBase
@@ -74,14 +89,19 @@ class FederationBase:
               * throws a SynapseError if the signature check failed.
             The deferreds run their callbacks in the sentinel
         """
-        deferreds = _check_sigs_on_pdus(self.keyring, room_version, pdus)
+        deferreds = _check_sigs_on_pdus(
+            self.keyring, room_version, pdus, self._signature_cache
+        )
 
         ctx = current_context()
 
         @defer.inlineCallbacks
         def callback(_, pdu: EventBase):
             with PreserveLoggingContext(ctx):
-                if not check_event_content_hash(pdu):
+                hash_ok = yield defer.ensureDeferred(
+                    self._verification_executor.run(check_event_content_hash, pdu)
+                )
+                if not hash_ok:
                     # let's try to distinguish between failures because the event was
                     # redacted (which are somewhat expected) vs actual ball-tampering
                     # incidents.
@@ -138,6 +158,65 @@ class FederationBase:
         return deferreds
 
 
+class VerifiedSignatureCache:
+    """Remembers which events received over federation have had their signatures
+    checked, so that they aren't checked again when they are received again.
+
+    Events are identified by a hash of the room version and the redacted event,
+    including its signatures, so a copy of an event with different signatures is
+    checked again. Only successful checks are remembered.
+    """
+
+    def __init__(self, hs: "HomeServer"):
+        config = hs.config.federation
+        self._store = hs.get_datastore()
+        self._persist = config.federation_verification_persist_signature_cache
+
+        self._cache = LruCache(
+            max_size=config.federation_verification_signature_cache_size,
+            cache_name="verified_event_signatures",
+        )  # type: LruCache[str, bool]
+
+    @staticmethod
+    def get_cache_key(room_version: RoomVersion, redacted_pdu_json: JsonDict) -> str:
+        hashed = hashlib.sha256(room_version.identifier.encode("utf-8"))
+        hashed.update(encode_canonical_json(redacted_pdu_json))
+        return encode_base64(hashed.digest())
+
+    def get_verified(self, cache_keys: List[str]) -> Deferred:
+        """Find which of the given events have had their signatures checked.
+
+        Returns:
+            Deferred[Set[str]]: the subset of `cache_keys` which have been checked.
+                The deferred runs its callbacks in the sentinel logcontext.
+        """
+        verified = {cache_key for cache_key in cache_keys if self._cache.get(cache_key)}
+
+        unknown = [cache_key for cache_key in cache_keys if cache_key not in verified]
+        if not self._persist or not unknown:
+            return defer.succeed(verified)
+
+        async def get_persisted() -> Set[str]:
+            persisted = await self._store.get_verified_event_signatures(unknown)
+            for cache_key in persisted:
+                self._cache.set(cache_key, True)
+            return verified | persisted
+
+        return run_in_background(get_persisted)
+
+    def mark_verified(self, cache_keys: List[str]) -> None:
+        """Record that the signatures of the given events have been checked."""
+        for cache_key in cache_keys:
+            self._cache.set(cache_key, True)
+
+        if self._persist and cache_keys:
+            run_as_background_process(
+                "store_verified_event_signatures",
+                self._store.store_verified_event_signatures,
+                cache_keys,
+            )
+
+
 class PduToCheckSig(
     namedtuple(
         "PduToCheckSig", ["pdu", "redacted_pdu_json", "sender_domain", "deferreds"]
@@ -147,7 +226,10 @@ class PduToCheckSig(
 
 
 def _check_sigs_on_pdus(
-    keyring: Keyring, room_version: RoomVersion, pdus: Iterable[EventBase]
+    keyring: Keyring,
+    room_version: RoomVersion,
+    pdus: Iterable[EventBase],
+    signature_cache: Optional[VerifiedSignatureCache] = None,
 ) -> List[Deferred]:
     """Check that the given events are correctly signed
 
@@ -155,6 +237,8 @@ def _check_sigs_on_pdus(
         keyring: keyring object to do the checks
         room_version: the room version of the PDUs
         pdus: the events to be checked
+        signature_cache: if given, events whose signatures have already been
+            checked are skipped, and events which pass are added to it.
 
     Returns:
         A Deferred for each event in pdus, which will either succeed if
@@ -192,6 +276,56 @@ def _check_sigs_on_pdus(
         for p in pdus
     ]
 
+    if signature_cache is None:
+        return _verify_sigs_on_pdus(keyring, room_version, pdus_to_check)
+
+    cache_keys = [
+        signature_cache.get_cache_key(room_version, p.redacted_pdu_json)
+        for p in pdus_to_check
+    ]
+    results = [Deferred() for _ in pdus_to_check]  # type: List[Deferred]
+
+    def verify_unchecked(verified: Set[str]) -> None:
+        unchecked = []
+        for p, cache_key, d in zip(pdus_to_check, cache_keys, results):
+            if cache_key in verified:
+                d.callback(None)
+            else:
+                unchecked.append((p, cache_key, d))
+
+        newly_verified = []  # type: List[str]
+
+        def on_verified(res, cache_key: str):
+            newly_verified.append(cache_key)
+            return res
+
+        deferreds = _verify_sigs_on_pdus(
+            keyring, room_version, [p for p, _, _ in unchecked]
+        )
+        for (_, cache_key, d), verify_d in zip(unchecked, deferreds):
+            verify_d.addCallback(on_verified, cache_key)
+            verify_d.chainDeferred(d)
+
+        DeferredList(deferreds).addCallback(
+            lambda _: signature_cache.mark_verified(newly_verified)
+        )
+
+    def check_all(failure: Failure) -> Set[str]:
+        logger.warning("Failed to look up verified event signatures: %s", failure.value)
+        return set()
+
+    signature_cache.get_verified(cache_keys).addErrback(check_all).addCallback(
+        verify_unchecked
+    )
+
+    return results
+
+
+def _verify_sigs_on_pdus(
+    keyring: Keyring, room_version: RoomVersion, pdus_to_check: List[PduToCheckSig]
+) -> List[Deferred]:
+    """Does the work of _check_sigs_on_pdus, checking every event."""
+
     # First we check that the sender event is signed by the sender's domain
     # (except if its a 3pid invite, in which case it may be sent by any server)
     pdus_to_check_sender = [p for p in pdus_to_check if not _is_invite_via_3pid(p.pdu)]
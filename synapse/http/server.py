@@ -56,6 +56,7 @@ from synapse.api.errors import (
     SynapseError,
     UnrecognizedRequestError,
 )
+from synapse.events.utils import SerializedEvent
 from synapse.http.site import SynapseRequest
 from synapse.logging.context import preserve_fn
 from synapse.logging.opentracing import trace_servlet
@@ -624,9 +625,42 @@ class _ByteProducer:
 def _encode_json_bytes(json_object: Any) -> Iterator[bytes]:
     """
     Encode an object into JSON. Returns an iterator of bytes.
+
+    Events which were serialized with a `SerializedEvent` are spliced in from
+    their cached encodings. Everything else is encoded as `json_encoder` would.
     """
-    for chunk in json_encoder.iterencode(json_object):
-        yield chunk.encode("utf-8")
+    if isinstance(json_object, SerializedEvent):
+        yield json_object.encode_json()
+    elif isinstance(json_object, dict):
+        if not all(isinstance(k, str) for k in json_object) or not any(
+            isinstance(v, (dict, list, tuple)) for v in json_object.values()
+        ):
+            # Leave dicts with non-string keys, and those which we wouldn't recurse
+            # into anyway, to the (much faster) C encoder.
+            yield json_encoder.encode(json_object).encode("utf-8")
+            return
+
+        separator = b"{"
+        for key, value in json_object.items():
+            yield separator
+            yield json_encoder.encode(key).encode("utf-8")
+            yield b":"
+            yield from _encode_json_bytes(value)
+            separator = b","
+        yield b"}"
+    elif isinstance(json_object, (list, tuple)):
+        if not any(isinstance(v, (dict, list, tuple)) for v in json_object):
+            yield json_encoder.encode(json_object).encode("utf-8")
+            return
+
+        separator = b"["
+        for value in json_object:
+            yield separator
+            yield from _encode_json_bytes(value)
+            separator = b","
+        yield b"]"
+    else:
+        yield json_encoder.encode(json_object).encode("utf-8")
 
 
 def respond_with_json(
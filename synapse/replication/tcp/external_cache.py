@@ -14,7 +14,7 @@
 # limitations under the License.
 
 import logging
-from typing import TYPE_CHECKING, Any, Optional
+from typing import TYPE_CHECKING, Any, Collection, Dict, Optional
 
 from prometheus_client import Counter
 
@@ -36,6 +36,12 @@ get_counter = Counter(
     labelnames=["cache_name", "hit"],
 )
 
+delete_counter = Counter(
+    "synapse_external_cache_delete",
+    "Number of times we delete a key from a cache",
+    labelnames=["cache_name"],
+)
+
 
 logger = logging.getLogger(__name__)
 
@@ -103,3 +109,70 @@ class ExternalCache:
             return result
 
         return json_decoder.decode(result)
+
+    async def get_many(self, cache_name: str, keys: Collection[str]) -> Dict[str, Any]:
+        """Look up several keys in the named cache at once.
+
+        Returns:
+            A map from key to value for the keys which were found.
+        """
+
+        if self._redis_connection is None or not keys:
+            return {}
+
+        keys = list(keys)
+        results = await make_deferred_yieldable(
+            self._redis_connection.mget(
+                [self._get_redis_key(cache_name, key) for key in keys]
+            )
+        )
+
+        logger.debug("Got cache results %s %s: %r", cache_name, keys, results)
+
+        found = {}
+        for key, result in zip(keys, results):
+            get_counter.labels(cache_name, result is not None).inc()
+
+            if not result:
+                continue
+
+            if isinstance(result, int):
+                found[key] = result
+            else:
+                found[key] = json_decoder.decode(result)
+
+        return found
+
+    async def incr(
+        self, cache_name: str, key: str, expiry_ms: Optional[int] = None
+    ) -> int:
+        """Increment a counter in the named cache, optionally setting the time
+        after which it expires.
+
+        Returns:
+            The new value of the counter, or zero if there is no external cache.
+        """
+
+        if self._redis_connection is None:
+            return 0
+
+        redis_key = self._get_redis_key(cache_name, key)
+        value = await make_deferred_yieldable(self._redis_connection.incr(redis_key))
+        if expiry_ms is not None:
+            await make_deferred_yieldable(
+                self._redis_connection.pexpire(redis_key, expiry_ms)
+            )
+
+        return value
+
+    async def delete(self, cache_name: str, key: str) -> None:
+        """Remove a key from the named cache."""
+
+        if self._redis_connection is None:
+            return
+
+        delete_counter.labels(cache_name).inc()
+
+        await make_deferred_yieldable(
+            self._redis_connection.delete(self._get_redis_key(cache_name, key))
+        )
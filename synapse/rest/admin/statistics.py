@@ -120,3 +120,77 @@ class UserMediaStatisticsRestServlet(RestServlet):
             ret["next_token"] = start + len(users_media)
 
         return 200, ret
+
+
+class DatabaseQueryStatisticsRestServlet(RestServlet):
+    """
+    Get statistics about the time taken by database queries.
+    """
+
+    PATTERNS = admin_patterns("/statistics/database/queries$")
+
+    def __init__(self, hs: "HomeServer"):
+        self.auth = hs.get_auth()
+        self.databases = hs.get_datastores().databases
+
+    async def on_GET(self, request: SynapseRequest) -> Tuple[int, JsonDict]:
+        await assert_requester_is_admin(self.auth, request)
+
+        order_by = parse_string(request, "order_by", default="total_sec")
+        if order_by not in ("total_sec", "mean_sec", "max_sec", "count"):
+            raise SynapseError(
+                400,
+                "Unknown value for order_by: %s" % (order_by,),
+                errcode=Codes.INVALID_PARAM,
+            )
+
+        limit = parse_integer(request, "limit", default=100)
+        if limit < 0:
+            raise SynapseError(
+                400,
+                "Query parameter limit must be a string representing a positive integer.",
+                errcode=Codes.INVALID_PARAM,
+            )
+
+        queries = [
+            query
+            for database in self.databases
+            for query in database.query_profiler.get_query_stats()
+        ]
+
+        queries.sort(key=lambda query: query[order_by], reverse=True)
+
+        return 200, {"queries": queries[:limit], "total": len(queries)}
+
+
+class DatabaseSlowQueriesRestServlet(RestServlet):
+    """
+    Get the slowest database queries, with their query plans.
+    """
+
+    PATTERNS = admin_patterns("/statistics/database/slow_queries$")
+
+    def __init__(self, hs: "HomeServer"):
+        self.auth = hs.get_auth()
+        self.databases = hs.get_datastores().databases
+
+    async def on_GET(self, request: SynapseRequest) -> Tuple[int, JsonDict]:
+        await assert_requester_is_admin(self.auth, request)
+
+        limit = parse_integer(request, "limit", default=100)
+        if limit < 0:
+            raise SynapseError(
+                400,
+                "Query parameter limit must be a string representing a positive integer.",
+                errcode=Codes.INVALID_PARAM,
+            )
+
+        queries = [
+            query
+            for database in self.databases
+            for query in database.query_profiler.get_slow_queries()
+        ]
+
+        queries.sort(key=lambda query: query["duration_sec"], reverse=True)
+
+        return 200, {"queries": queries[:limit], "total": len(queries)}
@@ -50,10 +50,12 @@ from synapse.config.homeserver import HomeServerConfig
 from synapse.crypto import context_factory
 from synapse.crypto.context_factory import RegularPolicyForHTTPS
 from synapse.crypto.keyring import Keyring
+from synapse.crypto.verification_executor import VerificationExecutor
 from synapse.events.builder import EventBuilderFactory
 from synapse.events.spamcheck import SpamChecker
 from synapse.events.third_party_rules import ThirdPartyEventRules
 from synapse.events.utils import EventClientSerializer
+from synapse.federation.federation_base import VerifiedSignatureCache
 from synapse.federation.federation_client import FederationClient
 from synapse.federation.federation_server import (
     FederationHandlerRegistry,
@@ -131,6 +133,7 @@ from synapse.storage import Databases, DataStore, Storage
 from synapse.streams.events import EventSources
 from synapse.types import DomainSpecificString, ISynapseReactor
 from synapse.util import Clock
+from synapse.util.caches.snapshot import CacheSnapshotter
 from synapse.util.distributor import Distributor
 from synapse.util.ratelimitutils import FederationRateLimiter
 from synapse.util.stringutils import random_string
@@ -534,6 +537,14 @@ class HomeServer(metaclass=abc.ABCMeta):
     def get_keyring(self) -> Keyring:
         return Keyring(self)
 
+    @cache_in_self
+    def get_verification_executor(self) -> VerificationExecutor:
+        return VerificationExecutor(self)
+
+    @cache_in_self
+    def get_verified_signature_cache(self) -> VerifiedSignatureCache:
+        return VerifiedSignatureCache(self)
+
     @cache_in_self
     def get_event_builder_factory(self) -> EventBuilderFactory:
         return EventBuilderFactory(self)
@@ -727,6 +738,10 @@ class HomeServer(metaclass=abc.ABCMeta):
     def get_external_cache(self) -> ExternalCache:
         return ExternalCache(self)
 
+    @cache_in_self
+    def get_cache_snapshotter(self) -> CacheSnapshotter:
+        return CacheSnapshotter(self)
+
     @cache_in_self
     def get_outbound_redis_connection(self) -> Optional["RedisProtocol"]:
         if not self.config.redis.redis_enabled:
@@ -98,6 +98,26 @@ class SQLBaseStore(metaclass=ABCMeta):
         else:
             cache.invalidate(tuple(key))
 
+    def _attempt_to_invalidate_cache_prefix(
+        self, cache_name: str, prefix: Collection[Any]
+    ) -> None:
+        """Attempts to invalidate all the entries of the cache of the given name
+        whose keys start with the given prefix, ignoring if the cache doesn't exist.
+
+        Args:
+            cache_name
+            prefix: The prefix of the keys of the entries to invalidate.
+        """
+
+        try:
+            cache = getattr(self, cache_name)
+        except AttributeError:
+            # We probably haven't pulled in the cache in this worker,
+            # which is fine.
+            return
+
+        cache.invalidate_many(tuple(prefix))
+
 
 def db_to_json(db_content: Union[memoryview, bytes, bytearray, str]) -> Any:
     """
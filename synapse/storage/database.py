@@ -14,18 +14,27 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
+import itertools
 import logging
+import random
+import re
+import threading
 import time
+import weakref
+from collections import OrderedDict, deque
+from functools import lru_cache
 from sys import intern
 from time import monotonic as monotonic_time
 from typing import (
     Any,
     Callable,
+    Deque,
     Dict,
     Iterable,
     Iterator,
     List,
     Optional,
+    Set,
     Tuple,
     TypeVar,
     cast,
@@ -33,23 +42,29 @@ from typing import (
 )
 
 import attr
-from prometheus_client import Histogram
+from constantly import NamedConstant, Names
+from prometheus_client import Counter, Histogram
 from typing_extensions import Literal
 
 from twisted.enterprise import adbapi
+from twisted.internet import defer
 
 from synapse.api.errors import StoreError
 from synapse.config.database import DatabaseConnectionConfig
 from synapse.logging.context import (
     LoggingContext,
+    PreserveLoggingContext,
     current_context,
     make_deferred_yieldable,
 )
-from synapse.metrics.background_process_metrics import run_as_background_process
+from synapse.metrics.background_process_metrics import (
+    BackgroundProcessLoggingContext,
+    run_as_background_process,
+)
 from synapse.storage.background_updates import BackgroundUpdater
 from synapse.storage.engines import BaseDatabaseEngine, PostgresEngine, Sqlite3Engine
 from synapse.storage.types import Connection, Cursor
-from synapse.types import Collection
+from synapse.types import Collection, JsonDict
 
 # python 3 does not have a maximum int value
 MAX_TXN_ID = 2 ** 63 - 1
@@ -61,10 +76,30 @@ transaction_logger = logging.getLogger("synapse.storage.txn")
 perf_logger = logging.getLogger("synapse.storage.TIME")
 
 sql_scheduling_timer = Histogram("synapse_storage_schedule_time", "sec")
+sql_queue_wait_timer = Histogram(
+    "synapse_storage_queue_wait_time",
+    "Time interactions waited for a database connection, by priority",
+    ["priority"],
+)
 
 sql_query_timer = Histogram("synapse_storage_query_time", "sec", ["verb"])
 sql_txn_timer = Histogram("synapse_storage_transaction_time", "sec", ["desc"])
 
+replica_interactions = Counter(
+    "synapse_storage_replica_interactions",
+    "Number of read-only interactions, by the database they were run on",
+    ["database"],
+)
+
+prepared_statement_hits = Counter(
+    "synapse_storage_prepared_statement_hits",
+    "Number of queries run using an existing prepared statement",
+)
+prepared_statement_prepare_timer = Histogram(
+    "synapse_storage_prepared_statement_prepare_time",
+    "Time taken to prepare a statement, which is saved each time it is reused",
+)
+
 
 # Unique indexes which have been added in background updates. Maps from table name
 # to the name of the background update which added the unique index to that table.
@@ -135,6 +170,8 @@ class LoggingDatabaseConnection:
     conn = attr.ib(type=Connection)
     engine = attr.ib(type=BaseDatabaseEngine)
     default_txn_name = attr.ib(type=str)
+    prepared_statements = attr.ib(type=Optional["PreparedStatementCache"], default=None)
+    query_profiler = attr.ib(type=Optional["QueryProfiler"], default=None)
 
     def cursor(
         self, *, txn_name=None, after_callbacks=None, exception_callbacks=None
@@ -148,6 +185,8 @@ class LoggingDatabaseConnection:
             database_engine=self.engine,
             after_callbacks=after_callbacks,
             exception_callbacks=exception_callbacks,
+            prepared_statements=self.prepared_statements,
+            query_profiler=self.query_profiler,
         )
 
     def close(self) -> None:
@@ -198,6 +237,9 @@ class LoggingTransaction:
             to that have been added by `call_on_exception` which should be run
             if transaction ends with an error. None indicates that no callbacks
             should be allowed to be scheduled to run.
+        prepared_statements: If given, frequently run queries are run as
+            prepared statements.
+        query_profiler: If given, the time taken by each query is recorded.
     """
 
     __slots__ = [
@@ -206,6 +248,9 @@ class LoggingTransaction:
         "database_engine",
         "after_callbacks",
         "exception_callbacks",
+        "prepared_statements",
+        "query_profiler",
+        "_newly_prepared",
     ]
 
     def __init__(
@@ -215,12 +260,19 @@ class LoggingTransaction:
         database_engine: BaseDatabaseEngine,
         after_callbacks: Optional[List[_CallbackListEntry]] = None,
         exception_callbacks: Optional[List[_CallbackListEntry]] = None,
+        prepared_statements: Optional["PreparedStatementCache"] = None,
+        query_profiler: Optional["QueryProfiler"] = None,
     ):
         self.txn = txn
         self.name = name
         self.database_engine = database_engine
         self.after_callbacks = after_callbacks
         self.exception_callbacks = exception_callbacks
+        self.prepared_statements = prepared_statements
+        self.query_profiler = query_profiler
+
+        # The SQL of the statements prepared during this transaction.
+        self._newly_prepared = []  # type: List[str]
 
     def call_after(self, callback: "Callable[..., None]", *args: Any, **kwargs: Any):
         """Call the given callback on the main twisted thread after the
@@ -291,7 +343,25 @@ class LoggingTransaction:
         )
 
     def execute(self, sql: str, *args: Any) -> None:
-        self._do_execute(self.txn.execute, sql, *args)
+        if self.prepared_statements is not None and args:
+            self._do_execute(self._execute_prepared, sql, *args)
+        else:
+            self._do_execute(self.txn.execute, sql, *args)
+
+    def _execute_prepared(self, sql: str, args: Any) -> None:
+        assert self.prepared_statements is not None
+        if not self.prepared_statements.execute(self, sql, args):
+            self.txn.execute(sql, args)
+
+    def discard_newly_prepared(self) -> None:
+        """Forget the statements prepared during this transaction, as it failed.
+
+        Postgres may or may not have kept them, so we prepare them afresh (under
+        new names) next time.
+        """
+        if self.prepared_statements is not None and self._newly_prepared:
+            self.prepared_statements.discard(self.txn, self._newly_prepared)
+            self._newly_prepared = []
 
     def executemany(self, sql: str, *args: Any) -> None:
         self._do_execute(self.txn.executemany, sql, *args)
@@ -317,7 +387,7 @@ class LoggingTransaction:
         start = time.time()
 
         try:
-            return func(sql, *args)
+            result = func(sql, *args)
         except Exception as e:
             sql_logger.debug("[SQL FAIL] {%s} %s", self.name, e)
             raise
@@ -326,6 +396,11 @@ class LoggingTransaction:
             sql_logger.debug("[SQL time] {%s} %f sec", self.name, secs)
             sql_query_timer.labels(sql.split()[0]).observe(secs)
 
+        if self.query_profiler is not None:
+            self.query_profiler.record(self, sql, args, secs)
+
+        return result
+
     def close(self) -> None:
         self.txn.close()
 
@@ -336,6 +411,512 @@ class LoggingTransaction:
         self.close()
 
 
+class PreparedStatementCache:
+    """Runs frequently run queries as server-side prepared statements, so that
+    Postgres doesn't parse and analyse them every time.
+
+    A query is prepared on a connection once it has been run `min_executions`
+    times on any connection, and the least recently used statements on each
+    connection are deallocated to keep at most `max_per_connection`. Only
+    queries with parameters, run with `LoggingTransaction.execute`, are
+    prepared.
+
+    Only used on Postgres.
+
+    Args:
+        engine: The database engine.
+        max_per_connection: The maximum number of statements to keep prepared on
+            each connection.
+        min_executions: The number of times a query has to be run before it is
+            prepared.
+    """
+
+    # The number of queries we count the executions of before starting again,
+    # in case the SQL varies a lot (e.g. a variable number of rows inserted).
+    _MAX_COUNTED = 10000
+
+    def __init__(
+        self,
+        engine: BaseDatabaseEngine,
+        max_per_connection: int,
+        min_executions: int = 10,
+    ):
+        self._engine = engine
+        self._max_per_connection = max_per_connection
+        self._min_executions = min_executions
+
+        self._lock = threading.Lock()
+
+        # The number of times each query has been run, until it is prepared.
+        self._execution_counts = {}  # type: Dict[str, int]
+
+        # Queries which Postgres couldn't prepare, e.g. as it couldn't work out the
+        # type of a parameter.
+        self._unpreparable = set()  # type: Set[str]
+
+        # Map from the underlying connection to the statements prepared on it, as
+        # a map from query to statement name, in least recently used order. A
+        # connection is only used by one thread at a time, so its statements can
+        # be used without holding the lock.
+        self._statements = (
+            weakref.WeakKeyDictionary()
+        )  # type: weakref.WeakKeyDictionary[Any, OrderedDict[str, str]]
+
+        self._statement_ids = itertools.count()
+
+    def execute(self, txn: LoggingTransaction, sql: str, args: Any) -> bool:
+        """Run the query as a prepared statement, if it is worth preparing.
+
+        Args:
+            txn: The transaction to run the query in.
+            sql: The query, in the engine's parameter style.
+            args: The parameters of the query.
+
+        Returns:
+            Whether the query was run. If not, it should be run as usual.
+        """
+        if not isinstance(args, (list, tuple)) or sql in self._unpreparable:
+            return False
+
+        with self._lock:
+            statements = self._statements.setdefault(txn.txn.connection, OrderedDict())
+
+        name = statements.get(sql)
+        if name is not None:
+            statements.move_to_end(sql)
+            prepared_statement_hits.inc()
+        else:
+            with self._lock:
+                if len(self._execution_counts) >= self._MAX_COUNTED:
+                    self._execution_counts.clear()
+                count = self._execution_counts.get(sql, 0) + 1
+                self._execution_counts[sql] = count
+
+            if count < self._min_executions:
+                return False
+
+            name = self._prepare(txn, sql, len(args))
+            if name is None:
+                return False
+
+            with self._lock:
+                self._execution_counts.pop(sql, None)
+            statements[sql] = name
+            txn._newly_prepared.append(sql)
+
+            if len(statements) > self._max_per_connection:
+                _, old_name = statements.popitem(last=False)
+                txn.txn.execute("DEALLOCATE %s" % (old_name,))
+
+        if args:
+            txn.txn.execute(
+                "EXECUTE %s (%s)" % (name, ", ".join(["%s"] * len(args))), args
+            )
+        else:
+            txn.txn.execute("EXECUTE %s" % (name,))
+
+        return True
+
+    def discard(self, txn: Cursor, sqls: Iterable[str]) -> None:
+        """Forget that the given queries are prepared on the cursor's connection."""
+        with self._lock:
+            statements = self._statements.get(txn.connection)
+
+        if statements is not None:
+            for sql in sqls:
+                statements.pop(sql, None)
+
+    def _prepare(
+        self, txn: LoggingTransaction, sql: str, num_args: int
+    ) -> Optional[str]:
+        """Prepare the query on the transaction's connection.
+
+        Returns:
+            The name of the prepared statement, or None if it couldn't be prepared.
+        """
+        # Replace the parameters with Postgres' numbered parameters. We give up on
+        # queries with any other `%`, as they would be escaped for the driver.
+        parts = sql.split("%s")
+        if len(parts) != num_args + 1 or any("%" in part for part in parts):
+            self._unpreparable.add(sql)
+            return None
+
+        prepared_sql = parts[0] + "".join(
+            "$%d%s" % (i, part) for i, part in enumerate(parts[1:], start=1)
+        )
+
+        name = "synapse_stmt_%d" % (next(self._statement_ids),)
+
+        # A failed PREPARE aborts the transaction, so we wrap it in a savepoint
+        # unless in autocommit mode.
+        in_transaction = not txn.txn.connection.autocommit
+
+        start = time.time()
+        try:
+            if in_transaction:
+                txn.txn.execute("SAVEPOINT synapse_prepare")
+            txn.txn.execute("PREPARE %s AS %s" % (name, prepared_sql))
+            if in_transaction:
+                txn.txn.execute("RELEASE SAVEPOINT synapse_prepare")
+        except self._engine.module.DatabaseError as e:
+            if in_transaction:
+                txn.txn.execute("ROLLBACK TO SAVEPOINT synapse_prepare")
+            sql_logger.debug("[SQL] {%s} Unable to prepare %s: %s", txn.name, sql, e)
+            self._unpreparable.add(sql)
+            return None
+        finally:
+            prepared_statement_prepare_timer.observe(time.time() - start)
+
+        return name
+
+
+# The upper bounds of the buckets the time taken by queries is counted in, in
+# seconds.
+QUERY_TIME_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, float("inf"))
+
+# The statements which we can get the query plan of.
+_EXPLAINABLE_STATEMENTS = ("SELECT", "WITH", "INSERT", "UPDATE", "DELETE")
+
+# The suffix `new_transaction` adds to transaction names to make them unique.
+_TXN_ID_SUFFIX_RE = re.compile(r"-[0-9a-f]+$")
+
+_FINGERPRINT_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_FINGERPRINT_NUMBER_RE = re.compile(r"\b\d+\b")
+_FINGERPRINT_PARAMS_RE = re.compile(r"(?:\?|%s)(?:\s*,\s*(?:\?|%s))+")
+_FINGERPRINT_ROWS_RE = re.compile(
+    r"(\(\?(?:, \.\.\.)?\))(?:\s*,\s*\(\?(?:, \.\.\.)?\))+"
+)
+
+
+@lru_cache(maxsize=10000)
+def query_fingerprint(sql: str) -> str:
+    """Normalise a query, so that queries which only differ in their literals or
+    how many parameters or rows of parameters are in a list are counted
+    together.
+    """
+    sql = _FINGERPRINT_STRING_RE.sub("?", sql)
+    sql = _FINGERPRINT_NUMBER_RE.sub("?", sql)
+    sql = _FINGERPRINT_PARAMS_RE.sub("?, ...", sql.replace("%s", "?"))
+    return _FINGERPRINT_ROWS_RE.sub(r"\1, ...", sql)
+
+
+def _describe_query_args(args: Any) -> Any:
+    """Describe the shape of a query's parameters without including their
+    values, which may be sensitive.
+    """
+    if isinstance(args, (list, tuple)):
+        return [_describe_query_args(arg) for arg in args[:10]] + (
+            ["... %d more" % (len(args) - 10,)] if len(args) > 10 else []
+        )
+    if isinstance(args, (str, bytes)):
+        return "%s(%d)" % (type(args).__name__, len(args))
+    return type(args).__name__
+
+
+@attr.s(slots=True)
+class _QueryStats:
+    """The time taken by a query in a given transaction."""
+
+    count = attr.ib(default=0, type=int)
+    total_sec = attr.ib(default=0.0, type=float)
+    max_sec = attr.ib(default=0.0, type=float)
+    bucket_counts = attr.ib(
+        factory=lambda: [0] * len(QUERY_TIME_BUCKETS), type=List[int]
+    )
+
+
+class QueryProfiler:
+    """Records how long each query takes, by transaction name and query
+    fingerprint, and captures the slowest queries.
+
+    The query plan of captured queries is fetched with `EXPLAIN` (or
+    `EXPLAIN QUERY PLAN` on SQLite), without running them again.
+
+    Args:
+        engine: The database engine.
+        database_name: The name of the database, for reporting.
+        slow_query_threshold_ms: How long a query has to take to be captured,
+            or None to not capture queries.
+    """
+
+    # The most combinations of transaction name and fingerprint we keep stats for.
+    _MAX_QUERIES = 5000
+
+    # The most slow queries we keep, with the slowest one for each fingerprint.
+    _MAX_SLOW_QUERIES = 100
+
+    def __init__(
+        self,
+        engine: BaseDatabaseEngine,
+        database_name: str,
+        slow_query_threshold_ms: Optional[float],
+    ):
+        self._engine = engine
+        self._database_name = database_name
+        self._slow_query_threshold_ms = slow_query_threshold_ms
+
+        self._lock = threading.Lock()
+
+        self._stats = {}  # type: Dict[Tuple[str, str], _QueryStats]
+        self._slow_queries = {}  # type: Dict[str, Dict[str, Any]]
+
+    def record(
+        self, txn: LoggingTransaction, sql: str, args: Tuple, duration_sec: float
+    ) -> None:
+        """Record that a query ran successfully.
+
+        Args:
+            txn: The transaction the query ran in.
+            sql: The query, in the engine's parameter style.
+            args: The arguments the query was run with.
+            duration_sec: How long the query took.
+        """
+        fingerprint = query_fingerprint(sql)
+        txn_name = _TXN_ID_SUFFIX_RE.sub("", txn.name)
+        key = (txn_name, fingerprint)
+
+        with self._lock:
+            stats = self._stats.get(key)
+            if stats is None:
+                if len(self._stats) >= self._MAX_QUERIES:
+                    return
+                stats = self._stats[key] = _QueryStats()
+
+            stats.count += 1
+            stats.total_sec += duration_sec
+            stats.max_sec = max(stats.max_sec, duration_sec)
+            for i, bound in enumerate(QUERY_TIME_BUCKETS):
+                if duration_sec <= bound:
+                    stats.bucket_counts[i] += 1
+                    break
+
+        if (
+            self._slow_query_threshold_ms is not None
+            and duration_sec * 1000 >= self._slow_query_threshold_ms
+            and self._is_slowest(fingerprint, duration_sec)
+        ):
+            self._capture(txn, txn_name, sql, fingerprint, args, duration_sec)
+
+    def _is_slowest(self, fingerprint: str, duration_sec: float) -> bool:
+        """Whether a query would be kept as one of the slowest queries."""
+        with self._lock:
+            existing = self._slow_queries.get(fingerprint)
+            if existing is not None:
+                return duration_sec > existing["duration_sec"]
+            if len(self._slow_queries) < self._MAX_SLOW_QUERIES:
+                return True
+            return duration_sec > min(
+                q["duration_sec"] for q in self._slow_queries.values()
+            )
+
+    def _capture(
+        self,
+        txn: LoggingTransaction,
+        txn_name: str,
+        sql: str,
+        fingerprint: str,
+        args: Tuple,
+        duration_sec: float,
+    ) -> None:
+        # `executemany` and friends are given a list of rows of parameters,
+        # which we can't explain the query with.
+        params = args[0] if args else ()
+        explain = None
+        if isinstance(params, (list, tuple)) and not any(
+            isinstance(param, tuple) for param in params
+        ):
+            explain = self._explain(txn, sql, params)
+
+        sql_logger.warning(
+            "[SQL] {%s} Slow query took %f sec: %s", txn.name, duration_sec, sql
+        )
+
+        with self._lock:
+            self._slow_queries[fingerprint] = {
+                "database": self._database_name,
+                "txn_name": txn_name,
+                "fingerprint": fingerprint,
+                "sql": sql,
+                "args": _describe_query_args(params),
+                "duration_sec": duration_sec,
+                "ts": int(time.time() * 1000),
+                "explain": explain,
+            }
+            if len(self._slow_queries) > self._MAX_SLOW_QUERIES:
+                fastest = min(
+                    self._slow_queries.values(), key=lambda q: q["duration_sec"]
+                )
+                del self._slow_queries[fastest["fingerprint"]]
+
+    def _explain(
+        self, txn: LoggingTransaction, sql: str, params: Any
+    ) -> Optional[List[str]]:
+        """Get the query plan of a query, without running it.
+
+        Returns:
+            The lines of the query plan, or None if it couldn't be explained.
+        """
+        if not sql.lstrip().upper().startswith(_EXPLAINABLE_STATEMENTS):
+            return None
+
+        cursor = txn.txn.connection.cursor()
+        try:
+            if isinstance(self._engine, PostgresEngine):
+                # A failed EXPLAIN aborts the transaction, so we wrap it in a
+                # savepoint unless in autocommit mode.
+                in_transaction = not txn.txn.connection.autocommit
+                if in_transaction:
+                    cursor.execute("SAVEPOINT synapse_explain")
+                try:
+                    cursor.execute("EXPLAIN " + sql, params)
+                    plan = [row[0] for row in cursor.fetchall()]
+                except self._engine.module.DatabaseError as e:
+                    sql_logger.debug("[SQL] {%s} Unable to explain: %s", txn.name, e)
+                    plan = None
+                if in_transaction:
+                    cursor.execute(
+                        "ROLLBACK TO SAVEPOINT synapse_explain"
+                        if plan is None
+                        else "RELEASE SAVEPOINT synapse_explain"
+                    )
+                return plan
+
+            try:
+                cursor.execute("EXPLAIN QUERY PLAN " + sql, params)
+            except self._engine.module.DatabaseError as e:
+                sql_logger.debug("[SQL] {%s} Unable to explain: %s", txn.name, e)
+                return None
+            return [row[-1] for row in cursor.fetchall()]
+        finally:
+            cursor.close()
+
+    def get_query_stats(self) -> List[JsonDict]:
+        """Get the stats for each query, by transaction name and fingerprint."""
+        with self._lock:
+            return [
+                {
+                    "database": self._database_name,
+                    "txn_name": txn_name,
+                    "fingerprint": fingerprint,
+                    "count": stats.count,
+                    "total_sec": stats.total_sec,
+                    "mean_sec": stats.total_sec / stats.count,
+                    "max_sec": stats.max_sec,
+                    "buckets": {
+                        str(bound): count
+                        for bound, count in zip(QUERY_TIME_BUCKETS, stats.bucket_counts)
+                    },
+                }
+                for (txn_name, fingerprint), stats in self._stats.items()
+            ]
+
+    def get_slow_queries(self) -> List[JsonDict]:
+        """Get the slowest captured queries, slowest first."""
+        with self._lock:
+            queries = [dict(q) for q in self._slow_queries.values()]
+        return sorted(queries, key=lambda q: q["duration_sec"], reverse=True)
+
+
+class InteractionPriority(Names):
+    """
+    How urgently a database interaction needs running.
+    """
+
+    FOREGROUND = NamedConstant()
+    BACKGROUND = NamedConstant()
+
+
+# Background processes whose database interactions are all background priority,
+# unless the interaction says otherwise.
+BACKGROUND_PRIORITY_PROCESSES = frozenset(
+    (
+        "background_updates",
+        "rotate_notifs",
+        "prune_old_user_ips",
+        "purge_history_for_rooms_in_range",
+        "_purge_history",
+    )
+)
+
+
+class InteractionScheduler:
+    """Limits how many background priority interactions run at once, so that
+    some of the database connections are kept free for foreground work.
+
+    While foreground interactions are waiting a long time for a connection,
+    background interactions are further limited to one at a time.
+
+    Args:
+        max_background: The maximum number of background interactions to run at
+            once.
+        throttle_threshold_sec: How long foreground interactions must typically
+            be waiting for a connection before background interactions are
+            throttled.
+    """
+
+    def __init__(self, max_background: int, throttle_threshold_sec: float):
+        self._max_background = max_background
+        self._throttle_threshold_sec = throttle_threshold_sec
+
+        # A moving average of how long foreground interactions waited for a
+        # connection. This is updated from the database threads, but losing the
+        # odd update doesn't matter.
+        self._foreground_wait_sec = 0.0
+
+        self._running = 0
+        self._waiting = deque()  # type: Deque[defer.Deferred]
+
+    def record_foreground_wait(self, wait_sec: float) -> None:
+        self._foreground_wait_sec = 0.9 * self._foreground_wait_sec + 0.1 * wait_sec
+
+    def is_throttled(self) -> bool:
+        return self._foreground_wait_sec > self._throttle_threshold_sec
+
+    def _can_start(self) -> bool:
+        limit = 1 if self.is_throttled() else self._max_background
+        return self._running < limit
+
+    async def acquire(self) -> None:
+        """Wait until a background interaction can be started. `release` must be
+        called once it has finished.
+        """
+        if not self._waiting and self._can_start():
+            self._running += 1
+            return
+
+        # `release` counts us as running before waking us up.
+        d = defer.Deferred()  # type: defer.Deferred
+        self._waiting.append(d)
+        await make_deferred_yieldable(d)
+
+    def release(self) -> None:
+        self._running -= 1
+        while self._waiting and self._can_start():
+            self._running += 1
+            with PreserveLoggingContext():
+                self._waiting.popleft().callback(None)
+
+
+# How often we check how far each read replica has caught up.
+REPLICA_POLL_INTERVAL_MS = 1000
+
+# Replicas which we haven't heard from for this long aren't used.
+REPLICA_STALE_MS = 10 * 1000
+
+
+@attr.s(slots=True)
+class _DatabaseReplica:
+    """A read replica of a database."""
+
+    name = attr.ib(type=str)
+    pool = attr.ib(type=adbapi.ConnectionPool)
+
+    # The position of each of the streams registered with
+    # `DatabasePool.register_replica_stream` on the replica, as of `updated_ms`.
+    positions = attr.ib(factory=dict, type=Dict[str, int])
+    updated_ms = attr.ib(default=0, type=int)
+
+
 class PerformanceCounters:
     def __init__(self):
         self.current_counters = {}
@@ -403,6 +984,55 @@ class DatabasePool:
 
         self.engine = engine
 
+        # Read replicas of the database, which read-only interactions may be run
+        # on if they have caught up far enough. These are only supported on
+        # Postgres.
+        self._replicas = []  # type: List[_DatabaseReplica]
+        if isinstance(engine, PostgresEngine):
+            self._replicas = [
+                _DatabaseReplica(
+                    replica_config.name,
+                    make_pool(hs.get_reactor(), replica_config, engine),
+                )
+                for replica_config in database_config.replicas
+            ]
+
+        # Map from the name of a stream to the query which gets its position, for
+        # the streams whose position we track on each replica.
+        self._replica_stream_queries = {}  # type: Dict[str, str]
+
+        if self._replicas:
+            self._clock.looping_call(
+                run_as_background_process,
+                REPLICA_POLL_INTERVAL_MS,
+                "update_replica_positions",
+                self._update_replica_positions,
+            )
+
+        # Only Postgres has more than one connection to share out.
+        self._scheduler = None  # type: Optional[InteractionScheduler]
+        if isinstance(engine, PostgresEngine):
+            self._scheduler = InteractionScheduler(
+                max(
+                    1,
+                    self._db_pool.max - database_config.reserved_foreground_connections,
+                ),
+                database_config.background_throttle_ms / 1000,
+            )
+
+        self.query_profiler = QueryProfiler(
+            engine, database_config.name, database_config.slow_query_threshold_ms
+        )
+
+        self._prepared_statements = None  # type: Optional[PreparedStatementCache]
+        if (
+            isinstance(engine, PostgresEngine)
+            and database_config.prepared_statement_cache_size
+        ):
+            self._prepared_statements = PreparedStatementCache(
+                engine, database_config.prepared_statement_cache_size
+            )
+
         # A set of tables that are not safe to use native upserts in.
         self._unsafe_to_upsert_tables = set(UNIQUE_INDEX_BACKGROUND_UPDATES.keys())
 
@@ -457,6 +1087,88 @@ class DatabasePool:
                 self._check_safe_to_upsert,
             )
 
+    def register_replica_stream(self, stream_name: str, sql: str) -> None:
+        """Track the position of a stream on each read replica, so that read-only
+        interactions which need the stream to have reached a position are only
+        run on replicas which have caught up.
+
+        Args:
+            stream_name: The name of the stream, as used in `min_stream_positions`.
+            sql: A query which returns the position of the stream.
+        """
+        self._replica_stream_queries[stream_name] = sql
+
+    async def _update_replica_positions(self) -> None:
+        """Check how far each read replica has caught up."""
+
+        def get_positions(conn: LoggingDatabaseConnection) -> Dict[str, int]:
+            positions = {}
+            with conn.cursor(txn_name="update_replica_positions") as txn:
+                for stream_name, sql in self._replica_stream_queries.items():
+                    txn.execute(sql)
+                    positions[stream_name] = txn.fetchone()[0]
+            conn.rollback()
+            return positions
+
+        for replica in self._replicas:
+            try:
+                replica.positions = await self.runWithConnection(
+                    get_positions, _replica=replica
+                )
+                replica.updated_ms = self._clock.time_msec()
+            except Exception as e:
+                logger.warning(
+                    "Unable to reach database replica %s: %s", replica.name, e
+                )
+
+    def _pick_replica(
+        self, min_stream_positions: Optional[Dict[str, int]]
+    ) -> Optional[_DatabaseReplica]:
+        """Pick a replica to run a read-only interaction on, if any are up to date.
+
+        Args:
+            min_stream_positions: The positions that streams must have reached on
+                the replica.
+        """
+        now = self._clock.time_msec()
+        min_stream_positions = min_stream_positions or {}
+
+        replicas = [
+            replica
+            for replica in self._replicas
+            if now - replica.updated_ms < REPLICA_STALE_MS
+            and all(
+                replica.positions.get(stream_name, -1) >= position
+                for stream_name, position in min_stream_positions.items()
+            )
+        ]
+        if not replicas:
+            return None
+
+        return random.choice(replicas)
+
+    @staticmethod
+    def _get_interaction_priority(
+        priority: Optional[NamedConstant],
+    ) -> NamedConstant:
+        """Work out the priority of an interaction which didn't give one, from
+        the background process it was started by, if any.
+        """
+        if priority is not None:
+            return priority
+
+        # Background processes may be running in a logcontext nested inside their
+        # own.
+        context = current_context()
+        while isinstance(context, LoggingContext):
+            if isinstance(context, BackgroundProcessLoggingContext):
+                if context.name in BACKGROUND_PRIORITY_PROCESSES:
+                    return InteractionPriority.BACKGROUND
+                break
+            context = context.parent_context
+
+        return InteractionPriority.FOREGROUND
+
     def start_profiling(self) -> None:
         self._previous_loop_ts = monotonic_time()
 
@@ -528,9 +1240,11 @@ class DatabasePool:
                     after_callbacks=after_callbacks,
                     exception_callbacks=exception_callbacks,
                 )
+                committed = False
                 try:
                     r = func(cursor, *args, **kwargs)
                     conn.commit()
+                    committed = True
                     return r
                 except self.engine.module.OperationalError as e:
                     # This can happen if the database disappears mid
@@ -600,6 +1314,8 @@ class DatabasePool:
                     #
                     # [1]: https://github.com/python/cpython/blob/v3.8.0/Modules/_sqlite/connection.c#L465
                     # [2]: https://github.com/python/cpython/blob/v3.8.0/Modules/_sqlite/cursor.c#L236
+                    if not committed:
+                        cursor.discard_newly_prepared()
                     cursor.close()
         except Exception as e:
             transaction_logger.debug("[TXN FAIL] {%s} %s", name, e)
@@ -622,6 +1338,9 @@ class DatabasePool:
         func: "Callable[..., R]",
         *args: Any,
         db_autocommit: bool = False,
+        read_only: bool = False,
+        min_stream_positions: Optional[Dict[str, int]] = None,
+        priority: Optional[NamedConstant] = None,
         **kwargs: Any
     ) -> R:
         """Starts a transaction on the database and runs a given function
@@ -644,6 +1363,17 @@ class DatabasePool:
                 called multiple times if the transaction is retried, so must
                 correctly handle that case.
 
+            read_only: Whether `func` only reads from the database, so can be run
+                on a read replica.
+
+            min_stream_positions: For read-only interactions, the positions
+                streams must have reached on a read replica for it to be used.
+                See `register_replica_stream`.
+
+            priority: The `InteractionPriority` of the interaction. Defaults to
+                background priority for the background processes in
+                `BACKGROUND_PRIORITY_PROCESSES`, and foreground otherwise.
+
             args: positional args to pass to `func`
             kwargs: named args to pass to `func`
 
@@ -665,6 +1395,9 @@ class DatabasePool:
                 func,
                 *args,
                 db_autocommit=db_autocommit,
+                read_only=read_only,
+                min_stream_positions=min_stream_positions,
+                priority=priority,
                 **kwargs,
             )
 
@@ -682,6 +1415,10 @@ class DatabasePool:
         func: "Callable[..., R]",
         *args: Any,
         db_autocommit: bool = False,
+        read_only: bool = False,
+        min_stream_positions: Optional[Dict[str, int]] = None,
+        priority: Optional[NamedConstant] = None,
+        _replica: Optional[_DatabaseReplica] = None,
         **kwargs: Any
     ) -> R:
         """Wraps the .runWithConnection() method on the underlying db_pool.
@@ -694,6 +1431,13 @@ class DatabasePool:
             db_autocommit: Whether to run the function in "autocommit" mode,
                 i.e. outside of a transaction. This is useful for transaction
                 that are only a single query. Currently only affects postgres.
+            read_only: Whether `func` only reads from the database, so can be run
+                on a read replica.
+            min_stream_positions: For read-only functions, the positions streams
+                must have reached on a read replica for it to be used.
+            priority: The `InteractionPriority` of `func`. See `runInteraction`.
+            _replica: The read replica to run `func` on, regardless of how far it
+                has caught up.
             kwargs: named args to pass to `func`
 
         Returns:
@@ -709,6 +1453,7 @@ class DatabasePool:
             assert isinstance(curr_context, LoggingContext)
             parent_context = curr_context
 
+        priority = self._get_interaction_priority(priority)
         start_time = monotonic_time()
 
         def inner_func(conn, *args, **kwargs):
@@ -722,8 +1467,16 @@ class DatabasePool:
             with LoggingContext("runWithConnection", parent_context) as context:
                 sched_duration_sec = monotonic_time() - start_time
                 sql_scheduling_timer.observe(sched_duration_sec)
+                sql_queue_wait_timer.labels(priority.name).observe(sched_duration_sec)
                 context.add_database_scheduled(sched_duration_sec)
 
+                if (
+                    self._scheduler is not None
+                    and priority == InteractionPriority.FOREGROUND
+                    and _replica is None
+                ):
+                    self._scheduler.record_foreground_wait(sched_duration_sec)
+
                 if self.engine.is_connection_closed(conn):
                     logger.debug("Reconnecting closed database connection")
                     conn.reconnect()
@@ -733,16 +1486,43 @@ class DatabasePool:
                         self.engine.attempt_to_set_autocommit(conn, True)
 
                     db_conn = LoggingDatabaseConnection(
-                        conn, self.engine, "runWithConnection"
+                        conn,
+                        self.engine,
+                        "runWithConnection",
+                        prepared_statements=self._prepared_statements,
+                        query_profiler=self.query_profiler,
                     )
                     return func(db_conn, *args, **kwargs)
                 finally:
                     if db_autocommit:
                         self.engine.attempt_to_set_autocommit(conn, False)
 
-        return await make_deferred_yieldable(
-            self._db_pool.runWithConnection(inner_func, *args, **kwargs)
-        )
+        db_pool = self._db_pool
+        if read_only and self._replicas and _replica is None:
+            _replica = self._pick_replica(min_stream_positions)
+            replica_interactions.labels(
+                _replica.name if _replica else self._database_config.name
+            ).inc()
+        if _replica is not None:
+            db_pool = _replica.pool
+
+        # Interactions on replicas don't use the primary's connections.
+        if (
+            self._scheduler is None
+            or priority != InteractionPriority.BACKGROUND
+            or _replica is not None
+        ):
+            return await make_deferred_yieldable(
+                db_pool.runWithConnection(inner_func, *args, **kwargs)
+            )
+
+        await self._scheduler.acquire()
+        try:
+            return await make_deferred_yieldable(
+                db_pool.runWithConnection(inner_func, *args, **kwargs)
+            )
+        finally:
+            self._scheduler.release()
 
     @staticmethod
     def cursor_to_dict(cursor: Cursor) -> List[Dict[str, Any]]:
@@ -760,13 +1540,23 @@ class DatabasePool:
 
     @overload
     async def execute(
-        self, desc: str, decoder: Literal[None], query: str, *args: Any
+        self,
+        desc: str,
+        decoder: Literal[None],
+        query: str,
+        *args: Any,
+        read_only: bool = False
     ) -> List[Tuple[Any, ...]]:
         ...
 
     @overload
     async def execute(
-        self, desc: str, decoder: Callable[[Cursor], R], query: str, *args: Any
+        self,
+        desc: str,
+        decoder: Callable[[Cursor], R],
+        query: str,
+        *args: Any,
+        read_only: bool = False
     ) -> R:
         ...
 
@@ -775,7 +1565,8 @@ class DatabasePool:
         desc: str,
         decoder: Optional[Callable[[Cursor], R]],
         query: str,
-        *args: Any
+        *args: Any,
+        read_only: bool = False
     ) -> R:
         """Runs a single query for a result set.
 
@@ -785,6 +1576,7 @@ class DatabasePool:
                 something meaningful.
             query - The query string to execute
             *args - Query args.
+            read_only - Whether the query can be run on a read replica.
         Returns:
             The result of decoder(results)
         """
@@ -796,7 +1588,7 @@ class DatabasePool:
             else:
                 return txn.fetchall()
 
-        return await self.runInteraction(desc, interaction)
+        return await self.runInteraction(desc, interaction, read_only=read_only)
 
     # "Simple" SQL API methods that operate on a single table with no JOINs,
     # no complex WHERE clauses, just a dict of values for columns.
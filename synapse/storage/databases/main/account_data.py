@@ -510,8 +510,11 @@ class AccountDataWorkerStore(SQLBaseStore):
         )
 
         # Invalidate the cache for any ignored users which were added or removed.
-        for ignored_user_id in previously_ignored_users ^ currently_ignored_users:
-            self._invalidate_cache_and_stream(txn, self.ignored_by, (ignored_user_id,))
+        self._invalidate_cache_and_stream_bulk(
+            txn,
+            self.ignored_by,
+            [(u,) for u in previously_ignored_users ^ currently_ignored_users],
+        )
 
 
 class AccountDataStore(AccountDataWorkerStore):
@@ -16,7 +16,7 @@
 
 import itertools
 import logging
-from typing import Any, Iterable, List, Optional, Tuple
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
 
 from synapse.api.constants import EventTypes
 from synapse.replication.tcp.streams import BackfillStream, CachesStream
@@ -28,6 +28,7 @@ from synapse.replication.tcp.streams.events import (
 from synapse.storage._base import SQLBaseStore
 from synapse.storage.database import DatabasePool
 from synapse.storage.engines import PostgresEngine
+from synapse.types import Collection
 from synapse.util.iterutils import batch_iter
 
 logger = logging.getLogger(__name__)
@@ -37,6 +38,21 @@ logger = logging.getLogger(__name__)
 # based on the current state when notifying workers over replication.
 CURRENT_STATE_CACHE_NAME = "cs_cache_fake"
 
+# This is a special cache name we use to send the invalidation of many keys of one
+# cache as a single row over replication. The keys of the row are the name of the
+# cache, the length of each key, and then the elements of all of the keys.
+BULK_INVALIDATION_CACHE_NAME = "bulk_cache_fake"
+
+# This is a special cache name we use to invalidate all of the keys of a cache which
+# start with a given prefix. The keys of the row are the name of the cache followed
+# by the prefix. Nothing sends these yet: workers handle them so that once writers
+# start to, workers from the previous release won't drop them.
+PREFIX_INVALIDATION_CACHE_NAME = "prefix_cache_fake"
+
+# The maximum number of key elements we send in a single row over replication.
+# Max line length is 16K, and max user ID length is 255, so 50 should be safe.
+_MAX_KEY_ELEMENTS_PER_ROW = 50
+
 
 class CacheInvalidationWorkerStore(SQLBaseStore):
     def __init__(self, database: DatabasePool, db_conn, hs):
@@ -116,21 +132,62 @@ class CacheInvalidationWorkerStore(SQLBaseStore):
             if self._cache_id_gen:
                 self._cache_id_gen.advance(instance_name, token)
 
-            for row in rows:
-                if row.cache_func == CURRENT_STATE_CACHE_NAME:
-                    if row.keys is None:
-                        raise Exception(
-                            "Can't send an 'invalidate all' for current state cache"
-                        )
-
-                    room_id = row.keys[0]
-                    members_changed = set(row.keys[1:])
-                    self._invalidate_state_caches(room_id, members_changed)
-                else:
-                    self._attempt_to_invalidate_cache(row.cache_func, row.keys)
+            self._process_cache_invalidation_rows(rows)
 
         super().process_replication_rows(stream_name, instance_name, token, rows)
 
+    def _process_cache_invalidation_rows(self, rows):
+        """Invalidate the caches named in a batch of rows from the caches stream.
+
+        Busy rooms and purges can produce many rows invalidating the same entries,
+        so we deduplicate the invalidations in the batch before applying them.
+        """
+        invalidate_all = set()  # type: Set[str]
+        keys_by_cache = {}  # type: Dict[str, Set[Tuple[Any, ...]]]
+        prefixes_by_cache = {}  # type: Dict[str, Set[Tuple[Any, ...]]]
+        members_changed_by_room = {}  # type: Dict[str, Set[str]]
+
+        for row in rows:
+            if row.cache_func == CURRENT_STATE_CACHE_NAME:
+                if row.keys is None:
+                    raise Exception(
+                        "Can't send an 'invalidate all' for current state cache"
+                    )
+
+                room_id = row.keys[0]
+                members_changed_by_room.setdefault(room_id, set()).update(row.keys[1:])
+            elif row.cache_func == BULK_INVALIDATION_CACHE_NAME:
+                cache_name = row.keys[0]
+                key_len = int(row.keys[1])
+                keys = keys_by_cache.setdefault(cache_name, set())
+                for i in range(2, len(row.keys), key_len):
+                    keys.add(tuple(row.keys[i : i + key_len]))
+            elif row.cache_func == PREFIX_INVALIDATION_CACHE_NAME:
+                cache_name = row.keys[0]
+                prefixes_by_cache.setdefault(cache_name, set()).add(tuple(row.keys[1:]))
+            elif row.keys is None:
+                invalidate_all.add(row.cache_func)
+            else:
+                keys_by_cache.setdefault(row.cache_func, set()).add(tuple(row.keys))
+
+        for room_id, members_changed in members_changed_by_room.items():
+            self._invalidate_state_caches(room_id, members_changed)
+
+        for cache_name in invalidate_all:
+            self._attempt_to_invalidate_cache(cache_name, None)
+
+        # There's no point invalidating individual entries of caches which we have
+        # just cleared.
+        for cache_name, prefixes in prefixes_by_cache.items():
+            if cache_name not in invalidate_all:
+                for prefix in prefixes:
+                    self._attempt_to_invalidate_cache_prefix(cache_name, prefix)
+
+        for cache_name, keys in keys_by_cache.items():
+            if cache_name not in invalidate_all:
+                for key in keys:
+                    self._attempt_to_invalidate_cache(cache_name, key)
+
     def _process_event_stream_row(self, token, row):
         data = row.data
 
@@ -220,6 +277,26 @@ class CacheInvalidationWorkerStore(SQLBaseStore):
         txn.call_after(cache_func.invalidate, keys)
         self._send_invalidation_to_replication(txn, cache_func.__name__, keys)
 
+    def _invalidate_cache_and_stream_bulk(
+        self, txn, cache_func, key_tuples: Collection[Tuple[Any, ...]]
+    ):
+        """Invalidates many entries of a cache and adds them to the cache stream, so
+        that slaves will know to invalidate their caches.
+
+        This is equivalent to calling `_invalidate_cache_and_stream` for each key,
+        but sends the invalidations over replication in as few rows as possible.
+        All of the keys must have the same length.
+
+        Workers running an older version of Synapse drop these rows until they are
+        restarted, so this must not be used for caches where a missed invalidation
+        is a security problem, such as `get_user_by_access_token`.
+        """
+        for keys in key_tuples:
+            txn.call_after(cache_func.invalidate, keys)
+        self._send_invalidation_to_replication_bulk(
+            txn, cache_func.__name__, key_tuples
+        )
+
     def _invalidate_all_cache_and_stream(self, txn, cache_func):
         """Invalidates the entire cache and adds it to the cache stream so slaves
         will know to invalidate their caches.
@@ -245,9 +322,7 @@ class CacheInvalidationWorkerStore(SQLBaseStore):
             # We need to be careful that the size of the `members_changed` list
             # isn't so large that it causes problems sending over replication, so we
             # send them in chunks.
-            # Max line length is 16K, and max user ID length is 255, so 50 should
-            # be safe.
-            for chunk in batch_iter(members_changed, 50):
+            for chunk in batch_iter(members_changed, _MAX_KEY_ELEMENTS_PER_ROW):
                 keys = itertools.chain([room_id], chunk)
                 self._send_invalidation_to_replication(
                     txn, CURRENT_STATE_CACHE_NAME, keys
@@ -299,6 +374,42 @@ class CacheInvalidationWorkerStore(SQLBaseStore):
                 },
             )
 
+    def _send_invalidation_to_replication_bulk(
+        self, txn, cache_name: str, key_tuples: Collection[Tuple[Any, ...]]
+    ):
+        """Notifies replication that the given keys of a cache have been
+        invalidated, using as few rows as possible.
+
+        Note that this does *not* invalidate the cache locally.
+
+        Args:
+            txn
+            cache_name
+            key_tuples: The entries to invalidate, which must all have the same
+                length.
+        """
+        if not key_tuples:
+            return
+
+        key_len = len(next(iter(key_tuples)))
+        if key_len == 0:
+            raise Exception("Can't bulk invalidate empty cache keys")
+
+        # As in `_invalidate_state_caches_and_stream`, we need to make sure that
+        # the rows aren't too large to send over replication.
+        keys_per_row = max(1, _MAX_KEY_ELEMENTS_PER_ROW // key_len)
+        for chunk in batch_iter(key_tuples, keys_per_row):
+            if any(len(keys) != key_len for keys in chunk):
+                raise Exception("Can't bulk invalidate keys of different lengths")
+
+            self._send_invalidation_to_replication(
+                txn,
+                BULK_INVALIDATION_CACHE_NAME,
+                itertools.chain(
+                    [cache_name, str(key_len)], itertools.chain.from_iterable(chunk)
+                ),
+            )
+
     def get_cache_stream_token_for_writer(self, instance_name: str) -> int:
         if self._cache_id_gen:
             return self._cache_id_gen.get_current_token_for_writer(instance_name)
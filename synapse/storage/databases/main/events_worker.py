@@ -19,6 +19,7 @@ from collections import namedtuple
 from typing import Dict, Iterable, List, Optional, Tuple, overload
 
 from constantly import NamedConstant, Names
+from prometheus_client import Histogram
 from typing_extensions import Literal
 
 from twisted.internet import defer
@@ -30,11 +31,17 @@ from synapse.api.room_versions import (
     EventFormatVersions,
     RoomVersions,
 )
-from synapse.events import EventBase, make_event_from_dict
+from synapse.events import EventBase, make_event_from_json
 from synapse.events.snapshot import EventContext
 from synapse.events.utils import prune_event
-from synapse.logging.context import PreserveLoggingContext, current_context
+from synapse.logging.context import (
+    LoggingContext,
+    PreserveLoggingContext,
+    current_context,
+)
+from synapse.metrics import LaterGauge
 from synapse.metrics.background_process_metrics import (
+    BackgroundProcessLoggingContext,
     run_as_background_process,
     wrap_as_background_process,
 )
@@ -59,15 +66,38 @@ logger = logging.getLogger(__name__)
 # control how we batch/bulk fetch events from the database.
 # The values are plucked out of thing air to make initial sync run faster
 # on jki.re
-# TODO: Make these configurable.
-EVENT_QUEUE_THREADS = 3  # Max number of threads that will fetch events
+# The number of threads which fetch events is configured per database, with the
+# `event_fetch_threads` option.
 EVENT_QUEUE_ITERATIONS = 3  # No. times we block waiting for requests for events
 EVENT_QUEUE_TIMEOUT_S = 0.1  # Timeout when waiting for requests for events
 
+# Requests for more than this many events are fetched at background priority, as
+# they are usually for large amounts of state, e.g. when joining a room over
+# federation.
+EVENT_FETCH_BACKGROUND_SIZE = 500
+
+event_fetch_queue_wait = Histogram(
+    "synapse_storage_event_fetch_queue_wait_seconds",
+    "Time requests to fetch events spent queued before being fetched",
+    ["priority"],
+)
+
 
 _EventCacheEntry = namedtuple("_EventCacheEntry", ("event", "redacted_event"))
 
 
+class EventFetchPriority(Names):
+    """
+    How urgently a request to fetch events from the database needs serving.
+    """
+
+    # Requests which a client is waiting on.
+    INTERACTIVE = NamedConstant()
+
+    # Requests from background processes, and very large requests.
+    BACKGROUND = NamedConstant()
+
+
 class EventRedactBehaviour(Names):
     """
     What to do when retrieving a redacted event from the database.
@@ -140,6 +170,14 @@ class EventsWorkerStore(SQLBaseStore):
                     db_conn, "events", "stream_ordering", step=-1
                 )
 
+        # Track how far read replicas have got through the events stream, so
+        # that reads which need recent events are only sent to replicas which
+        # have them. With multiple event writers there may be gaps before the
+        # maximum, so this is only a best effort.
+        database.register_replica_stream(
+            "events", "SELECT COALESCE(MAX(stream_ordering), 0) FROM events"
+        )
+
         if hs.config.run_background_tasks:
             # We periodically clean out old transaction ID mappings
             self._clock.looping_call(
@@ -153,9 +191,34 @@ class EventsWorkerStore(SQLBaseStore):
             max_size=hs.config.caches.event_cache_size,
         )
 
+        # Whether the `rejected_events_metadata` background update, which adds
+        # rejected state events to `state_events`, is known to have completed.
+        self._rejected_events_in_state_events = False
+
+        # The queues of requests to fetch events, for each priority. Each request
+        # is the list of event IDs to fetch, the deferred to resolve with the rows
+        # and when it was queued.
         self._event_fetch_lock = threading.Condition()
-        self._event_fetch_list = []
+        self._event_fetch_lists = {
+            priority: [] for priority in EventFetchPriority.iterconstants()
+        }  # type: Dict[NamedConstant, List[Tuple[Iterable[str], defer.Deferred, float]]]
         self._event_fetch_ongoing = 0
+        self._event_fetch_threads = database._database_config.event_fetch_threads
+
+        # The number of threads currently fetching background requests. We keep
+        # one thread free for interactive requests, unless there is only one.
+        self._event_fetch_background_ongoing = 0
+        self._event_fetch_max_background = max(1, self._event_fetch_threads - 1)
+
+        LaterGauge(
+            "synapse_storage_event_fetch_queue_depth",
+            "Number of requests to fetch events waiting to be fetched",
+            ["priority"],
+            lambda: {
+                (priority.name.lower(),): len(event_list)
+                for priority, event_list in self._event_fetch_lists.items()
+            },
+        )
 
         # We define this sequence here so that it can be referenced from both
         # the DataStore and PersistEventStore.
@@ -594,15 +657,19 @@ class EventsWorkerStore(SQLBaseStore):
 
     def _do_fetch(self, conn):
         """Takes a database connection and waits for requests for events from
-        the _event_fetch_list queue.
+        the _event_fetch_lists queues.
+
+        Interactive requests are preferred, but a thread which has just served
+        interactive requests takes any waiting background requests next, so that
+        background requests aren't starved.
         """
         i = 0
+        last_priority = None
         while True:
             with self._event_fetch_lock:
-                event_list = self._event_fetch_list
-                self._event_fetch_list = []
+                priority = self._next_event_fetch_priority(last_priority)
 
-                if not event_list:
+                if priority is None:
                     single_threaded = self.database_engine.single_threaded
                     if (
                         not self.USE_DEDICATED_DB_THREADS_FOR_EVENT_FETCHING
@@ -617,10 +684,62 @@ class EventsWorkerStore(SQLBaseStore):
                         continue
                 i = 0
 
-            self._fetch_event_list(conn, event_list)
+                event_list = self._event_fetch_lists[priority]
+                self._event_fetch_lists[priority] = []
+                if priority == EventFetchPriority.BACKGROUND:
+                    self._event_fetch_background_ongoing += 1
+
+            now = self._clock.time()
+            wait_metric = event_fetch_queue_wait.labels(priority.name.lower())
+            for _, _, queued_ts in event_list:
+                wait_metric.observe(now - queued_ts)
+
+            try:
+                self._fetch_event_list(
+                    conn, [(events, d) for events, d, _ in event_list]
+                )
+            finally:
+                if priority == EventFetchPriority.BACKGROUND:
+                    with self._event_fetch_lock:
+                        self._event_fetch_background_ongoing -= 1
+
+            last_priority = priority
+
+    def _next_event_fetch_priority(
+        self, last_priority: Optional[NamedConstant]
+    ) -> Optional[NamedConstant]:
+        """Pick which queue of requests to fetch events a thread should serve next.
+
+        Must be called with `_event_fetch_lock` held.
+
+        Args:
+            last_priority: The priority of the requests the thread last served, if
+                any.
+
+        Returns:
+            The priority of the queue to serve, or None if there is nothing the
+            thread can serve.
+        """
+        interactive_waiting = bool(
+            self._event_fetch_lists[EventFetchPriority.INTERACTIVE]
+        )
+        background_waiting = bool(
+            self._event_fetch_lists[EventFetchPriority.BACKGROUND]
+        ) and (self._event_fetch_background_ongoing < self._event_fetch_max_background)
+
+        if interactive_waiting and background_waiting:
+            if last_priority == EventFetchPriority.INTERACTIVE:
+                return EventFetchPriority.BACKGROUND
+            return EventFetchPriority.INTERACTIVE
+        elif interactive_waiting:
+            return EventFetchPriority.INTERACTIVE
+        elif background_waiting:
+            return EventFetchPriority.BACKGROUND
+
+        return None
 
     def _fetch_event_list(self, conn, event_list):
-        """Handle a load of requests from the _event_fetch_list queue
+        """Handle a load of requests from one of the _event_fetch_lists queues
 
         Args:
             conn (twisted.enterprise.adbapi.Connection): database connection
@@ -700,6 +819,17 @@ class EventsWorkerStore(SQLBaseStore):
             if events_to_fetch:
                 logger.debug("Also fetching redaction events %s", events_to_fetch)
 
+        # Rejected events didn't used to get a row in state_events, so we can only
+        # rely on it for them once the background update which adds them is done.
+        if not self._rejected_events_in_state_events and any(
+            row and row["rejected_reason"] for row in fetched_events.values()
+        ):
+            self._rejected_events_in_state_events = (
+                await self.db_pool.updates.has_completed_background_update(
+                    "rejected_events_metadata"
+                )
+            )
+
         # build a map from event_id to EventBase
         event_map = {}
         for event_id, row in fetched_events.items():
@@ -712,13 +842,36 @@ class EventsWorkerStore(SQLBaseStore):
             if not allow_rejected and rejected_reason:
                 continue
 
-            # If the event or metadata cannot be parsed, log the error and act
-            # as if the event is unknown.
-            try:
-                d = db_to_json(row["json"])
-            except ValueError:
-                logger.error("Unable to parse json from event: %s", event_id)
-                continue
+            format_version = row["format_version"]
+            if format_version is None:
+                # This means that we stored the event before we had the concept
+                # of a event format version, so it must be a V1 event.
+                format_version = EventFormatVersions.V1
+
+            # We only decode the event JSON when something needs a field which
+            # we didn't get from the events table.
+            event_json = row["json"]
+            if isinstance(event_json, memoryview):
+                event_json = event_json.tobytes()
+            if isinstance(event_json, (bytes, bytearray)):
+                event_json = event_json.decode("utf8")
+
+            known_fields = {
+                "type": row["type"],
+                "room_id": row["room_id"],
+            }
+            if not rejected_reason or self._rejected_events_in_state_events:
+                # We have a row in state_events for every such state event, so
+                # this is None exactly when the event isn't a state event.
+                known_fields["state_key"] = row["state_key"]
+            if format_version == EventFormatVersions.V1:
+                known_fields["event_id"] = event_id
+            if row["sender"] is not None:
+                # Events from before the sender column was added won't have it.
+                known_fields["sender"] = row["sender"]
+
+            # If the metadata cannot be parsed, log the error and act as if the
+            # event is unknown.
             try:
                 internal_metadata = db_to_json(row["internal_metadata"])
             except ValueError:
@@ -727,12 +880,6 @@ class EventsWorkerStore(SQLBaseStore):
                 )
                 continue
 
-            format_version = row["format_version"]
-            if format_version is None:
-                # This means that we stored the event before we had the concept
-                # of a event format version, so it must be a V1 event.
-                format_version = EventFormatVersions.V1
-
             room_version_id = row["room_version_id"]
 
             if not room_version_id:
@@ -743,9 +890,9 @@ class EventsWorkerStore(SQLBaseStore):
                 # However, the 'out_of_band_membership' flag is unreliable for older
                 # invites, so just accept it for all membership events.
                 #
-                if d["type"] != EventTypes.Member:
+                if row["type"] != EventTypes.Member:
                     raise Exception(
-                        "Room %s for event %s is unknown" % (d["room_id"], event_id)
+                        "Room %s for event %s is unknown" % (row["room_id"], event_id)
                     )
 
                 # so, assuming this is an out-of-band-invite that arrived before #6983
@@ -775,7 +922,7 @@ class EventsWorkerStore(SQLBaseStore):
                     logger.warning(
                         "Event %s in room %s has unknown room version %s",
                         event_id,
-                        d["room_id"],
+                        row["room_id"],
                         room_version_id,
                     )
                     continue
@@ -785,15 +932,17 @@ class EventsWorkerStore(SQLBaseStore):
                         "Event %s in room %s with version %s has wrong format: "
                         "expected %s, was %s",
                         event_id,
-                        d["room_id"],
+                        row["room_id"],
                         room_version_id,
                         room_version.event_format,
                         format_version,
                     )
                     continue
 
-            original_ev = make_event_from_dict(
-                event_dict=d,
+            original_ev = make_event_from_json(
+                json=event_json,
+                event_id=event_id,
+                known_fields=known_fields,
                 room_version=room_version,
                 internal_metadata_dict=internal_metadata,
                 rejected_reason=rejected_reason,
@@ -821,7 +970,7 @@ class EventsWorkerStore(SQLBaseStore):
         return result_map
 
     async def _enqueue_events(self, events):
-        """Fetches events from the database using the _event_fetch_list. This
+        """Fetches events from the database using the _event_fetch_lists. This
         allows batch and bulk fetching of events - it allows us to fetch events
         without having to create a new transaction for each request for events.
 
@@ -833,13 +982,17 @@ class EventsWorkerStore(SQLBaseStore):
                 May contain events that weren't requested.
         """
 
+        priority = self._get_event_fetch_priority(events)
+
         events_d = defer.Deferred()
         with self._event_fetch_lock:
-            self._event_fetch_list.append((events, events_d))
+            self._event_fetch_lists[priority].append(
+                (events, events_d, self._clock.time())
+            )
 
             self._event_fetch_lock.notify()
 
-            if self._event_fetch_ongoing < EVENT_QUEUE_THREADS:
+            if self._event_fetch_ongoing < self._event_fetch_threads:
                 self._event_fetch_ongoing += 1
                 should_start = True
             else:
@@ -857,6 +1010,23 @@ class EventsWorkerStore(SQLBaseStore):
 
         return row_map
 
+    def _get_event_fetch_priority(self, events: Collection[str]) -> NamedConstant:
+        """Decide the priority of a request to fetch the given events, from its
+        size and whether it was made by a background process.
+        """
+        if len(events) > EVENT_FETCH_BACKGROUND_SIZE:
+            return EventFetchPriority.BACKGROUND
+
+        # Background processes may be running in a logcontext nested inside their
+        # own.
+        context = current_context()
+        while isinstance(context, LoggingContext):
+            if isinstance(context, BackgroundProcessLoggingContext):
+                return EventFetchPriority.BACKGROUND
+            context = context.parent_context
+
+        return EventFetchPriority.INTERACTIVE
+
     def _fetch_event_rows(self, txn, event_ids):
         """Fetch event rows from the database
 
@@ -885,6 +1055,14 @@ class EventsWorkerStore(SQLBaseStore):
          * rejected_reason (str|None): if the event was rejected, the reason
            why.
 
+         * type (str), room_id (str): the type and room of the event.
+
+         * sender (str|None): the sender of the event. This may be None for
+           very old events.
+
+         * state_key (str|None): the state key of the event, if it is a state
+           event.
+
          * redactions (List[str]): a list of event-ids which (claim to) redact
            this event.
 
@@ -905,11 +1083,16 @@ class EventsWorkerStore(SQLBaseStore):
                   ej.json,
                   ej.format_version,
                   r.room_version,
-                  rej.reason
+                  rej.reason,
+                  e.type,
+                  e.room_id,
+                  e.sender,
+                  se.state_key
                 FROM events AS e
                   JOIN event_json AS ej USING (event_id)
                   LEFT JOIN rooms r ON r.room_id = e.room_id
                   LEFT JOIN rejections as rej USING (event_id)
+                  LEFT JOIN state_events AS se USING (event_id)
                 WHERE """
 
             clause, args = make_in_list_sql_clause(
@@ -928,6 +1111,10 @@ class EventsWorkerStore(SQLBaseStore):
                     "format_version": row[4],
                     "room_version_id": row[5],
                     "rejected_reason": row[6],
+                    "type": row[7],
+                    "room_id": row[8],
+                    "sender": row[9],
+                    "state_key": row[10],
                     "redactions": [],
                 }
 
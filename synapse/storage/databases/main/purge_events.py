@@ -18,6 +18,7 @@ from typing import Any, List, Set, Tuple
 
 from synapse.api.errors import SynapseError
 from synapse.storage._base import SQLBaseStore
+from synapse.storage.database import InteractionPriority
 from synapse.storage.databases.main.state import StateGroupWorkerStore
 from synapse.types import RoomStreamToken
 
@@ -53,6 +54,7 @@ class PurgeEventsStore(StateGroupWorkerStore, SQLBaseStore):
             room_id,
             parsed_token,
             delete_local_events,
+            priority=InteractionPriority.BACKGROUND,
         )
 
     def _purge_history_txn(
@@ -298,7 +300,10 @@ class PurgeEventsStore(StateGroupWorkerStore, SQLBaseStore):
             The list of state groups to delete.
         """
         return await self.db_pool.runInteraction(
-            "purge_room", self._purge_room_txn, room_id
+            "purge_room",
+            self._purge_room_txn,
+            room_id,
+            priority=InteractionPriority.BACKGROUND,
         )
 
     def _purge_room_txn(self, txn, room_id: str) -> List[int]:
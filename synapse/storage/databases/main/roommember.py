@@ -146,7 +146,7 @@ class RoomMemberWorkerStore(EventsWorkerStore):
                 self._check_safe_current_state_events_membership_updated_txn,
             )
 
-    @cached(max_entries=100000, iterable=True)
+    @cached(max_entries=100000, iterable=True, external_cache_expiry_ms=30 * 60 * 1000)
     async def get_users_in_room(self, room_id: str) -> List[str]:
         return await self.db_pool.runInteraction(
             "get_users_in_room", self.get_users_in_room_txn, room_id
@@ -621,6 +621,7 @@ class RoomMemberWorkerStore(EventsWorkerStore):
     @cachedList(
         cached_method_name="_get_joined_profile_from_event_id",
         list_name="event_ids",
+        coalesce_window_ms=0,
     )
     async def _get_joined_profiles_from_event_ids(self, event_ids: Iterable[str]):
         """For given set of member event_ids check if they point to a join
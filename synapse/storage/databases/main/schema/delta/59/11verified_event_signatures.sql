@@ -0,0 +1,24 @@
+/* Copyright 2021 The Matrix.org Foundation C.I.C
+ *
+ * Licensed under the Apache License, Version 2.0 (the "License");
+ * you may not use this file except in compliance with the License.
+ * You may obtain a copy of the License at
+ *
+ *    http://www.apache.org/licenses/LICENSE-2.0
+ *
+ * Unless required by applicable law or agreed to in writing, software
+ * distributed under the License is distributed on an "AS IS" BASIS,
+ * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ * See the License for the specific language governing permissions and
+ * limitations under the License.
+ */
+
+-- Events received over federation whose signatures we have checked. The key is a
+-- hash of the room version and the redacted event, including its signatures.
+CREATE TABLE IF NOT EXISTS verified_event_signatures (
+    cache_key TEXT NOT NULL,
+    verified_ts BIGINT NOT NULL
+);
+
+CREATE UNIQUE INDEX verified_event_signatures_key ON verified_event_signatures(cache_key);
+CREATE INDEX verified_event_signatures_ts ON verified_event_signatures(verified_ts);
@@ -423,7 +423,7 @@ class SearchStore(SearchBackgroundUpdateStore):
         sql += " ORDER BY rank DESC LIMIT 500"
 
         results = await self.db_pool.execute(
-            "search_msgs", self.db_pool.cursor_to_dict, sql, *args
+            "search_msgs", self.db_pool.cursor_to_dict, sql, *args, read_only=True
         )
 
         results = list(filter(lambda row: row["room_id"] in room_ids, results))
@@ -444,7 +444,11 @@ class SearchStore(SearchBackgroundUpdateStore):
         count_sql += " GROUP BY room_id"
 
         count_results = await self.db_pool.execute(
-            "search_rooms_count", self.db_pool.cursor_to_dict, count_sql, *count_args
+            "search_rooms_count",
+            self.db_pool.cursor_to_dict,
+            count_sql,
+            *count_args,
+            read_only=True,
         )
 
         count = sum(row["count"] for row in count_results if row["room_id"] in room_ids)
@@ -581,7 +585,7 @@ class SearchStore(SearchBackgroundUpdateStore):
         args.append(limit)
 
         results = await self.db_pool.execute(
-            "search_rooms", self.db_pool.cursor_to_dict, sql, *args
+            "search_rooms", self.db_pool.cursor_to_dict, sql, *args, read_only=True
         )
 
         results = list(filter(lambda row: row["room_id"] in room_ids, results))
@@ -602,7 +606,11 @@ class SearchStore(SearchBackgroundUpdateStore):
         count_sql += " GROUP BY room_id"
 
         count_results = await self.db_pool.execute(
-            "search_rooms_count", self.db_pool.cursor_to_dict, count_sql, *count_args
+            "search_rooms_count",
+            self.db_pool.cursor_to_dict,
+            count_sql,
+            *count_args,
+            read_only=True,
         )
 
         count = sum(row["count"] for row in count_results if row["room_id"] in room_ids)
@@ -13,16 +13,29 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-from typing import Dict, Iterable, List, Tuple
+from typing import Collection, Dict, Iterable, List, Set, Tuple
 
 from unpaddedbase64 import encode_base64
 
+from synapse.metrics.background_process_metrics import wrap_as_background_process
 from synapse.storage._base import SQLBaseStore
+from synapse.storage.database import DatabasePool
 from synapse.storage.types import Cursor
 from synapse.util.caches.descriptors import cached, cachedList
 
+# How long we remember that we have checked the signatures of an event.
+VERIFIED_EVENT_SIGNATURES_RETENTION_MS = 7 * 24 * 60 * 60 * 1000
+
 
 class SignatureWorkerStore(SQLBaseStore):
+    def __init__(self, database: DatabasePool, db_conn, hs):
+        super().__init__(database, db_conn, hs)
+
+        if hs.config.run_background_tasks:
+            self._clock.looping_call(
+                self._prune_verified_event_signatures, 60 * 60 * 1000
+            )
+
     @cached()
     def get_event_reference_hash(self, event_id):
         # This is a dummy function to allow get_event_reference_hashes
@@ -89,6 +102,55 @@ class SignatureWorkerStore(SQLBaseStore):
         txn.execute(query, (event_id,))
         return {k: v for k, v in txn}
 
+    async def get_verified_event_signatures(self, cache_keys: Iterable[str]) -> Set[str]:
+        """Get which of the given events we have already checked the signatures
+        of.
+
+        Args:
+            cache_keys: The keys of the events, as computed by
+                `VerifiedSignatureCache`.
+
+        Returns:
+            The subset of `cache_keys` which have been checked.
+        """
+        rows = await self.db_pool.simple_select_many_batch(
+            table="verified_event_signatures",
+            column="cache_key",
+            iterable=cache_keys,
+            retcols=("cache_key",),
+            desc="get_verified_event_signatures",
+        )
+        return {row["cache_key"] for row in rows}
+
+    async def store_verified_event_signatures(self, cache_keys: Collection[str]) -> None:
+        """Record that we have checked the signatures of the given events.
+
+        Args:
+            cache_keys: The keys of the events, as computed by
+                `VerifiedSignatureCache`.
+        """
+        now = self._clock.time_msec()
+        await self.db_pool.simple_upsert_many(
+            table="verified_event_signatures",
+            key_names=("cache_key",),
+            key_values=[(cache_key,) for cache_key in cache_keys],
+            value_names=("verified_ts",),
+            value_values=[(now,) for _ in cache_keys],
+            desc="store_verified_event_signatures",
+        )
+
+    @wrap_as_background_process("prune_verified_event_signatures")
+    async def _prune_verified_event_signatures(self) -> None:
+        def _prune_verified_event_signatures_txn(txn):
+            txn.execute(
+                "DELETE FROM verified_event_signatures WHERE verified_ts < ?",
+                (self._clock.time_msec() - VERIFIED_EVENT_SIGNATURES_RETENTION_MS,),
+            )
+
+        await self.db_pool.runInteraction(
+            "_prune_verified_event_signatures", _prune_verified_event_signatures_txn
+        )
+
 
 class SignatureStore(SignatureWorkerStore):
     """Persistence for event signatures and hashes"""
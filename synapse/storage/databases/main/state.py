@@ -273,6 +273,7 @@ class StateGroupWorkerStore(EventsWorkerStore, SQLBaseStore):
         cached_method_name="_get_state_group_for_event",
         list_name="event_ids",
         num_args=1,
+        coalesce_window_ms=0,
     )
     async def _get_state_group_for_events(self, event_ids):
         """Returns mapping event_id -> state_group"""
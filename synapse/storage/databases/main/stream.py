@@ -649,6 +649,8 @@ class StreamWorkerStore(EventsWorkerStore, SQLBaseStore, metaclass=abc.ABCMeta):
             room_id,
             from_token=end_token,
             limit=limit,
+            read_only=True,
+            min_stream_positions={"events": end_token.get_max_stream_pos()},
         )
 
         # We want to return the results in ascending order.
@@ -1235,6 +1237,13 @@ class StreamWorkerStore(EventsWorkerStore, SQLBaseStore, metaclass=abc.ABCMeta):
             direction,
             limit,
             event_filter,
+            read_only=True,
+            min_stream_positions={
+                "events": max(
+                    from_key.get_max_stream_pos(),
+                    to_key.get_max_stream_pos() if to_key else 0,
+                )
+            },
         )
 
         events = await self.get_events_as_list(
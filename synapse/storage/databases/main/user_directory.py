@@ -858,7 +858,7 @@ class UserDirectoryStore(UserDirectoryBackgroundUpdateStore):
             raise Exception("Unrecognized database engine")
 
         results = await self.db_pool.execute(
-            "search_user_dir", self.db_pool.cursor_to_dict, sql, *args
+            "search_user_dir", self.db_pool.cursor_to_dict, sql, *args, read_only=True
         )
 
         limited = len(results) > limit
@@ -23,6 +23,7 @@ from frozendict import frozendict
 from twisted.internet import defer, task
 
 from synapse.logging import context
+from synapse.util.frozenutils import FrozenDictView
 
 logger = logging.getLogger(__name__)
 
@@ -33,13 +34,15 @@ def _reject_invalid_json(val):
 
 
 def _handle_frozendict(obj):
-    """Helper for json_encoder. Makes frozendicts serializable by returning
-    the underlying dict
+    """Helper for json_encoder. Makes frozendicts and FrozenDictViews serializable
+    by returning the underlying dict
     """
     if type(obj) is frozendict:
         # fishing the protected dict out of the object is a bit nasty,
         # but we don't really want the overhead of copying the dict.
         return obj._dict
+    if isinstance(obj, FrozenDictView):
+        return obj.get_underlying_dict()
     raise TypeError(
         "Object of type %s is not JSON serializable" % obj.__class__.__name__
     )
@@ -14,7 +14,10 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import collections
 import logging
+import typing
+from enum import Enum, auto
 from sys import intern
 from typing import Callable, Dict, Optional, Sized
 
@@ -30,9 +33,19 @@ collectors_by_name = {}  # type: Dict
 
 cache_size = Gauge("synapse_util_caches_cache:size", "", ["name"])
 cache_hits = Gauge("synapse_util_caches_cache:hits", "", ["name"])
-cache_evicted = Gauge("synapse_util_caches_cache:evicted_size", "", ["name"])
+cache_evicted = Gauge("synapse_util_caches_cache:evicted_size", "", ["name", "reason"])
 cache_total = Gauge("synapse_util_caches_cache:total", "", ["name"])
+cache_ghost_hits = Gauge(
+    "synapse_util_caches_cache:ghost_hits",
+    "Misses on keys which had recently been evicted to make space",
+    ["name"],
+)
 cache_max_size = Gauge("synapse_util_caches_cache_max_size", "", ["name"])
+cache_memory_usage = Gauge(
+    "synapse_util_caches_cache_size_bytes",
+    "Estimated memory usage of the caches",
+    ["name"],
+)
 
 response_cache_size = Gauge("synapse_util_caches_response_cache:size", "", ["name"])
 response_cache_hits = Gauge("synapse_util_caches_response_cache:hits", "", ["name"])
@@ -42,6 +55,12 @@ response_cache_evicted = Gauge(
 response_cache_total = Gauge("synapse_util_caches_response_cache:total", "", ["name"])
 
 
+class EvictionReason(Enum):
+    size = auto()
+    memory = auto()
+    time = auto()
+
+
 @attr.s(slots=True)
 class CacheMetric:
 
@@ -52,7 +71,13 @@ class CacheMetric:
 
     hits = attr.ib(default=0)
     misses = attr.ib(default=0)
-    evicted_size = attr.ib(default=0)
+    # Misses on keys which had recently been evicted for space. Only counted when
+    # cache auto-tuning is enabled.
+    ghost_hits = attr.ib(default=0)
+    eviction_size_by_reason = attr.ib(
+        factory=collections.Counter
+    )  # type: typing.Counter[EvictionReason]
+    memory_usage = attr.ib(default=None)  # type: Optional[int]
 
     def inc_hits(self):
         self.hits += 1
@@ -60,8 +85,21 @@ class CacheMetric:
     def inc_misses(self):
         self.misses += 1
 
-    def inc_evictions(self, size=1):
-        self.evicted_size += size
+    def inc_ghost_hits(self):
+        self.ghost_hits += 1
+
+    def inc_evictions(self, size=1, reason=EvictionReason.size):
+        self.eviction_size_by_reason[reason] += size
+
+    def inc_memory_usage(self, memory: int):
+        if self.memory_usage is None:
+            self.memory_usage = 0
+
+        self.memory_usage += memory
+
+    def dec_memory_usage(self, memory: int):
+        assert self.memory_usage is not None
+        self.memory_usage -= memory
 
     def describe(self):
         return []
@@ -71,17 +109,25 @@ class CacheMetric:
             if self._cache_type == "response_cache":
                 response_cache_size.labels(self._cache_name).set(len(self._cache))
                 response_cache_hits.labels(self._cache_name).set(self.hits)
-                response_cache_evicted.labels(self._cache_name).set(self.evicted_size)
+                response_cache_evicted.labels(self._cache_name).set(
+                    sum(self.eviction_size_by_reason.values())
+                )
                 response_cache_total.labels(self._cache_name).set(
                     self.hits + self.misses
                 )
             else:
                 cache_size.labels(self._cache_name).set(len(self._cache))
                 cache_hits.labels(self._cache_name).set(self.hits)
-                cache_evicted.labels(self._cache_name).set(self.evicted_size)
+                for reason in EvictionReason:
+                    cache_evicted.labels(self._cache_name, reason.name).set(
+                        self.eviction_size_by_reason[reason]
+                    )
                 cache_total.labels(self._cache_name).set(self.hits + self.misses)
+                cache_ghost_hits.labels(self._cache_name).set(self.ghost_hits)
                 if getattr(self._cache, "max_size", None):
                     cache_max_size.labels(self._cache_name).set(self._cache.max_size)
+                if self.memory_usage is not None:
+                    cache_memory_usage.labels(self._cache_name).set(self.memory_usage)
             if self._collect_callback:
                 self._collect_callback()
         except Exception as e:
@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+# Copyright 2021 The Matrix.org Foundation C.I.C.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Periodically redistributes space between the LruCaches, based on how often each
+cache misses keys which it recently evicted to make space.
+
+Each named LruCache remembers the keys it has evicted for space (up to its own
+size), and counts a "ghost hit" whenever it misses one of them: a hit which a cache
+twice the size would have had. The ghost hits per entry are an estimate of how much
+a cache would gain from growing, so the tuner moves entries from the caches with the
+fewest ghost hits per entry to those with the most.
+"""
+
+import logging
+from typing import TYPE_CHECKING, Dict, List
+
+import attr
+from prometheus_client import Gauge
+
+from synapse.config.cache import set_auto_tuned_cache_factors
+from synapse.util.caches import caches_by_name
+from synapse.util.caches.lrucache import LruCache, enable_evicted_key_tracking
+
+if TYPE_CHECKING:
+    from synapse.server import HomeServer
+
+logger = logging.getLogger(__name__)
+
+# The fraction of the smaller of two caches which is moved between them in each
+# tuning round.
+_STEP_FRACTION = 0.1
+
+# We only move space to a cache if its ghost hits per entry are at least this many
+# times those of the cache giving up the space, so that the sizes don't flap.
+_MIN_SCORE_RATIO = 2
+
+auto_tuned_factor_gauge = Gauge(
+    "synapse_util_caches_cache_auto_tuned_factor",
+    "The cache factor chosen for the cache by the cache auto-tuner",
+    ["name"],
+)
+
+
+@attr.s(slots=True)
+class _Candidate:
+    name = attr.ib(type=str)
+    factor = attr.ib(type=float)
+    size = attr.ib(type=int)
+    # Ghost hits per entry since the last tuning round.
+    score = attr.ib(type=float)
+
+
+def setup_cache_auto_tuning(hs: "HomeServer") -> None:
+    """Start periodically auto-tuning the cache sizes, if `caches.auto_tune` is
+    enabled.
+    """
+    if not hs.config.caches.auto_tune_enabled:
+        return
+
+    tuner = CacheAutoTuner(hs)
+    enable_evicted_key_tracking()
+    hs.get_clock().looping_call(tuner.tune, hs.config.caches.auto_tune_interval_msec)
+
+
+class CacheAutoTuner:
+    """Redistributes a fixed total number of cache entries between the caches which
+    don't have a cache factor set in the config.
+    """
+
+    def __init__(self, hs: "HomeServer"):
+        self._config = hs.config.caches
+
+        # The factors we have chosen for each cache, by cache name. Caches which
+        # aren't here use the global factor.
+        self._factors = {}  # type: Dict[str, float]
+
+        # The number of ghost hits of each cache at the last tuning round.
+        self._last_ghost_hits = {}  # type: Dict[str, int]
+
+    def tune(self) -> None:
+        """Move space from the caches which would gain least from being bigger to
+        the caches which would gain most.
+        """
+        candidates = self._get_candidates()
+
+        # Pair up the caches which would gain most with those which would gain
+        # least, working inwards.
+        candidates.sort(key=lambda c: c.score)
+        new_factors = {}  # type: Dict[str, float]
+        donor_idx, receiver_idx = 0, len(candidates) - 1
+        while donor_idx < receiver_idx:
+            donor = candidates[donor_idx]
+            receiver = candidates[receiver_idx]
+            if receiver.score <= 0 or receiver.score < donor.score * _MIN_SCORE_RATIO:
+                break
+
+            # Work out how many entries to move, without taking either cache
+            # outside of the allowed range of factors.
+            donor_min_size = (
+                donor.size * self._config.auto_tune_min_factor / donor.factor
+            )
+            receiver_max_size = (
+                receiver.size * self._config.auto_tune_max_factor / receiver.factor
+            )
+            moved = min(
+                int(min(donor.size, receiver.size) * _STEP_FRACTION),
+                int(donor.size - donor_min_size),
+                int(receiver_max_size - receiver.size),
+            )
+
+            if moved > 0:
+                new_factors[donor.name] = (
+                    donor.factor * (donor.size - moved) / donor.size
+                )
+                new_factors[receiver.name] = (
+                    receiver.factor * (receiver.size + moved) / receiver.size
+                )
+                logger.debug(
+                    "Moving %d entries from cache %s to %s",
+                    moved,
+                    donor.name,
+                    receiver.name,
+                )
+
+            donor_idx += 1
+            receiver_idx -= 1
+
+        if not new_factors:
+            return
+
+        self._factors.update(new_factors)
+        for name, factor in new_factors.items():
+            auto_tuned_factor_gauge.labels(name).set(factor)
+
+        logger.info("Auto-tuned the sizes of %d caches", len(new_factors))
+        set_auto_tuned_cache_factors(new_factors)
+
+    def _get_candidates(self) -> List[_Candidate]:
+        """Get the caches which can be auto-tuned, along with their ghost hits per
+        entry since the last tuning round.
+        """
+        candidates = []
+        for name, cache in list(caches_by_name.items()):
+            if (
+                not isinstance(cache, LruCache)
+                or not cache.apply_cache_factor_from_config
+                or cache.metrics is None
+                or self._config.has_cache_factor(name)
+            ):
+                continue
+
+            ghost_hits = cache.metrics.ghost_hits
+            new_ghost_hits = ghost_hits - self._last_ghost_hits.get(name, 0)
+            self._last_ghost_hits[name] = ghost_hits
+
+            factor = self._factors.get(name, self._config.global_factor)
+            size = cache.max_size
+            if size <= 0 or factor <= 0:
+                continue
+
+            candidates.append(
+                _Candidate(
+                    name=name,
+                    factor=factor,
+                    size=size,
+                    score=new_ghost_hits / size,
+                )
+            )
+
+        return candidates
@@ -75,6 +75,7 @@ class DeferredCache(Generic[KT, VT]):
         tree: bool = False,
         iterable: bool = False,
         apply_cache_factor_from_config: bool = True,
+        expiry_ms: Optional[int] = None,
     ):
         """
         Args:
@@ -87,6 +88,9 @@ class DeferredCache(Generic[KT, VT]):
                 rather than each cached object
             apply_cache_factor_from_config: Whether cache factors specified in the
                 config file affect `max_entries`
+            expiry_ms: If set, completed entries which haven't been accessed for
+                this many milliseconds are dropped from the cache. Defaults to the
+                `caches.expiry_time` config option.
         """
         cache_type = TreeCache if tree else dict
 
@@ -108,6 +112,7 @@ class DeferredCache(Generic[KT, VT]):
             size_callback=(lambda d: len(d) or 1) if iterable else None,
             metrics_collection_callback=metrics_cb,
             apply_cache_factor_from_config=apply_cache_factor_from_config,
+            expiry_ms=expiry_ms,
         )  # type: LruCache[KT, VT]
 
         self.thread = None  # type: Optional[threading.Thread]
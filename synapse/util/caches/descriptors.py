@@ -18,13 +18,18 @@ import functools
 import inspect
 import logging
 from typing import (
+    TYPE_CHECKING,
     Any,
+    Awaitable,
     Callable,
+    Dict,
     Generic,
     Iterable,
+    List,
     Mapping,
     Optional,
     Sequence,
+    Set,
     Tuple,
     TypeVar,
     Union,
@@ -35,10 +40,16 @@ from weakref import WeakValueDictionary
 from twisted.internet import defer
 
 from synapse.logging.context import make_deferred_yieldable, preserve_fn
-from synapse.util import unwrapFirstError
+from synapse.metrics.background_process_metrics import run_as_background_process
+from synapse.util import json_encoder, unwrapFirstError
+from synapse.util.async_helpers import maybe_awaitable
+from synapse.util.batching_queue import BatchingQueue
 from synapse.util.caches.deferred_cache import DeferredCache
 from synapse.util.caches.lrucache import LruCache
 
+if TYPE_CHECKING:
+    from synapse.replication.tcp.external_cache import ExternalCache
+
 logger = logging.getLogger(__name__)
 
 CacheKey = Union[Tuple, Any]
@@ -52,6 +63,7 @@ class _CachedFunction(Generic[F]):
     invalidate_many = None  # type: Any
     prefill = None  # type: Any
     cache = None  # type: Any
+    external_tier = None  # type: Any
     num_args = None  # type: Any
 
     __name__ = None  # type: str
@@ -61,6 +73,182 @@ class _CachedFunction(Generic[F]):
     __call__ = None  # type: F
 
 
+class _InvalidationTracker:
+    """A cache invalidation callback which records whether it has been called, and
+    chains to another callback.
+    """
+
+    __slots__ = ["invalidated", "_callback"]
+
+    def __init__(self, callback: Optional[Callable[[], None]]):
+        self.invalidated = False
+        self._callback = callback
+
+    def __call__(self) -> None:
+        self.invalidated = True
+        if self._callback:
+            self._callback()
+
+
+# The key in the external cache of the generation which is bumped whenever all
+# entries of a cache are invalidated.
+_ALL_GENERATION_KEY = "gen:*"
+
+# The prefix of the keys in the external cache of the generations which are bumped
+# whenever individual entries are invalidated. Cache keys are JSON encoded, so
+# can't start with this.
+_GENERATION_KEY_PREFIX = "gen:"
+
+
+class _ExternalCacheTier:
+    """Uses the shared external cache (i.e. Redis) as a second-level cache for a
+    `@cached` method, so that workers can share results rather than each fetching
+    them from the database.
+
+    Values are stored as JSON, so this is only suitable for methods whose results
+    survive a round trip through JSON.
+
+    Every process which invalidates an entry in its in-memory cache (as the writer
+    does when it changes the data, and other workers do as they process the cache
+    invalidation replication stream) bumps a generation for that key in the
+    external cache. Values are stored along with the generations which were
+    current before they were fetched from the database, and are ignored if the
+    generations have been bumped since. This stops a worker which raced with an
+    invalidation from handing its stale result to workers which have already
+    processed the invalidation.
+    """
+
+    def __init__(
+        self, external_cache: "ExternalCache", cache_name: str, expiry_ms: int
+    ):
+        self._external_cache = external_cache
+        self._cache_name = cache_name
+        self._expiry_ms = expiry_ms
+
+    def _get_key(self, cache_key: CacheKey) -> str:
+        return json_encoder.encode(cache_key)
+
+    async def get_many(
+        self, cache_keys: Iterable[CacheKey]
+    ) -> Tuple[Dict[CacheKey, Any], Dict[CacheKey, List[int]]]:
+        """Look up the given keys in the external cache.
+
+        Returns:
+            A map from cache key to value for the keys which were found, and a map
+            from cache key to the current generations of the key, to be passed to
+            `set` when storing a value fetched from the database. The generations
+            must be looked up before fetching the value.
+        """
+        keys = {self._get_key(cache_key): cache_key for cache_key in cache_keys}
+        redis_keys = [_ALL_GENERATION_KEY]
+        for key in keys:
+            redis_keys.append(key)
+            redis_keys.append(_GENERATION_KEY_PREFIX + key)
+
+        try:
+            found = await self._external_cache.get_many(self._cache_name, redis_keys)
+        except Exception:
+            # The database is still the source of truth, so we carry on without
+            # the external cache.
+            logger.warning(
+                "Failed to fetch %s from external cache",
+                self._cache_name,
+                exc_info=True,
+            )
+            return {}, {}
+
+        all_generation = found.get(_ALL_GENERATION_KEY, 0)
+        values = {}
+        generations = {}
+        for key, cache_key in keys.items():
+            generation = [
+                all_generation,
+                found.get(_GENERATION_KEY_PREFIX + key, 0),
+            ]
+            generations[cache_key] = generation
+
+            # Values are stored as a list of the value and its generations.
+            entry = found.get(key)
+            if isinstance(entry, list) and len(entry) == 2 and entry[1] == generation:
+                values[cache_key] = entry[0]
+
+        return values, generations
+
+    async def fetch(
+        self,
+        cache_key: CacheKey,
+        tracker: _InvalidationTracker,
+        f: Callable[..., Any],
+        *args,
+        **kwargs
+    ) -> Any:
+        """Look up the key in the external cache, falling back to calling `f` (and
+        storing its result in the external cache) on a miss.
+        """
+        found, generations = await self.get_many([cache_key])
+        if cache_key in found:
+            return found[cache_key]
+
+        result = await maybe_awaitable(f(*args, **kwargs))
+
+        # Don't store the result if the entry was invalidated while we were
+        # fetching it, as it may be out of date.
+        if not tracker.invalidated and cache_key in generations:
+            self.set(cache_key, result, generations[cache_key])
+
+        return result
+
+    def set(self, cache_key: CacheKey, value: Any, generation: List[int]) -> None:
+        """Store a value in the external cache, in the background.
+
+        Args:
+            cache_key
+            value
+            generation: The generations of the key returned by `get_many` before
+                the value was fetched.
+        """
+        run_as_background_process(
+            "external_cache_set",
+            self._external_cache.set,
+            self._cache_name,
+            self._get_key(cache_key),
+            [value, generation],
+            self._expiry_ms,
+        )
+
+    def invalidate(self, cache_key: CacheKey) -> None:
+        """Bump the generation of a key in the external cache, and remove its
+        value, in the background.
+        """
+        run_as_background_process(
+            "external_cache_invalidate", self._invalidate, self._get_key(cache_key)
+        )
+
+    async def _invalidate(self, key: str) -> None:
+        # All commands go down the same connection, so the generation is bumped
+        # before any later lookup by this process.
+        #
+        # The generation has to outlive any stale value written before it was
+        # bumped, which could otherwise become valid again once the generation
+        # expired.
+        await self._external_cache.incr(
+            self._cache_name, _GENERATION_KEY_PREFIX + key, 2 * self._expiry_ms
+        )
+        await self._external_cache.delete(self._cache_name, key)
+
+    def invalidate_all(self) -> None:
+        """Bump the generation of all keys in the external cache, in the background.
+
+        The values are left to expire.
+        """
+        run_as_background_process(
+            "external_cache_invalidate_all",
+            self._external_cache.incr,
+            self._cache_name,
+            _ALL_GENERATION_KEY,
+        )
+
+
 class _CacheDescriptorBase:
     def __init__(self, orig: Callable[..., Any], num_args, cache_context=False):
         self.orig = orig
@@ -250,6 +438,18 @@ class DeferredCacheDescriptor(_CacheDescriptorBase):
         num_args (int): number of positional arguments (excluding ``self`` and
             ``cache_context``) to use as cache keys. Defaults to all named
             args of the function.
+        expiry_ms (int|None): if set, entries which haven't been accessed for this
+            many milliseconds are dropped from the cache. Defaults to the
+            `caches.expiry_time` config option.
+        external_cache_expiry_ms (int|None): if set, and Redis is configured,
+            misses in the in-memory cache are looked up in Redis before calling
+            the function, and results are stored in Redis for this many
+            milliseconds. The function's results must be JSON-serialisable, and
+            will be returned with lists in place of tuples and dicts in place of
+            frozendicts when read back from Redis. Only used if the
+            `caches.redis_second_level_cache` config option is enabled. Requires
+            the object the method is bound to to have an `hs` attribute. Cannot be
+            used with `tree` or `cache_context`.
     """
 
     def __init__(
@@ -260,12 +460,24 @@ class DeferredCacheDescriptor(_CacheDescriptorBase):
         tree=False,
         cache_context=False,
         iterable=False,
+        expiry_ms=None,
+        external_cache_expiry_ms=None,
     ):
         super().__init__(orig, num_args=num_args, cache_context=cache_context)
 
+        if tree and external_cache_expiry_ms is not None:
+            raise ValueError("Cannot use an external cache with tree=True")
+
+        # The cache context invalidates the in-memory entry when another cache is
+        # invalidated, which wouldn't remove the entry from the external cache.
+        if cache_context and external_cache_expiry_ms is not None:
+            raise ValueError("Cannot use an external cache with cache_context=True")
+
         self.max_entries = max_entries
         self.tree = tree
         self.iterable = iterable
+        self.expiry_ms = expiry_ms
+        self.external_cache_expiry_ms = external_cache_expiry_ms
 
     def __get__(self, obj, owner):
         cache = DeferredCache(
@@ -274,8 +486,20 @@ class DeferredCacheDescriptor(_CacheDescriptorBase):
             keylen=self.num_args,
             tree=self.tree,
             iterable=self.iterable,
+            expiry_ms=self.expiry_ms,
         )  # type: DeferredCache[CacheKey, Any]
 
+        external_tier = None  # type: Optional[_ExternalCacheTier]
+        if self.external_cache_expiry_ms is not None:
+            external_cache = obj.hs.get_external_cache()
+            if (
+                obj.hs.config.caches.redis_second_level_cache
+                and external_cache.is_enabled()
+            ):
+                external_tier = _ExternalCacheTier(
+                    external_cache, self.orig.__name__, self.external_cache_expiry_ms
+                )
+
         get_cache_key = self.cache_key_builder
 
         @functools.wraps(self.orig)
@@ -296,23 +520,49 @@ class DeferredCacheDescriptor(_CacheDescriptorBase):
                         cache, cache_key
                     )
 
-                ret = defer.maybeDeferred(preserve_fn(self.orig), obj, *args, **kwargs)
-                ret = cache.set(cache_key, ret, callback=invalidate_callback)
+                if external_tier:
+                    tracker = _InvalidationTracker(invalidate_callback)
+                    ret = defer.maybeDeferred(
+                        preserve_fn(external_tier.fetch),
+                        cache_key,
+                        tracker,
+                        self.orig,
+                        obj,
+                        *args,
+                        **kwargs,
+                    )
+                    ret = cache.set(cache_key, ret, callback=tracker)
+                else:
+                    ret = defer.maybeDeferred(
+                        preserve_fn(self.orig), obj, *args, **kwargs
+                    )
+                    ret = cache.set(cache_key, ret, callback=invalidate_callback)
 
             return make_deferred_yieldable(ret)
 
         wrapped = cast(_CachedFunction, _wrapped)
 
+        def invalidate(key):
+            cache.invalidate(key)
+            if external_tier:
+                external_tier.invalidate(key)
+
+        def invalidate_all():
+            cache.invalidate_all()
+            if external_tier:
+                external_tier.invalidate_all()
+
         if self.num_args == 1:
-            wrapped.invalidate = lambda key: cache.invalidate(key[0])
+            wrapped.invalidate = lambda key: invalidate(key[0])
             wrapped.prefill = lambda key, val: cache.prefill(key[0], val)
         else:
-            wrapped.invalidate = cache.invalidate
+            wrapped.invalidate = invalidate
             wrapped.invalidate_many = cache.invalidate_many
             wrapped.prefill = cache.prefill
 
-        wrapped.invalidate_all = cache.invalidate_all
+        wrapped.invalidate_all = invalidate_all
         wrapped.cache = cache
+        wrapped.external_tier = external_tier
         wrapped.num_args = self.num_args
 
         obj.__dict__[self.orig.__name__] = wrapped
@@ -330,7 +580,14 @@ class DeferredCacheListDescriptor(_CacheDescriptorBase):
     of results.
     """
 
-    def __init__(self, orig, cached_method_name, list_name, num_args=None):
+    def __init__(
+        self,
+        orig,
+        cached_method_name,
+        list_name,
+        num_args=None,
+        coalesce_window_ms=None,
+    ):
         """
         Args:
             orig (function)
@@ -339,10 +596,17 @@ class DeferredCacheListDescriptor(_CacheDescriptorBase):
             num_args (int): number of positional arguments (excluding ``self``,
                 but including list_name) to use as cache keys. Defaults to all
                 named args of the function.
+            coalesce_window_ms (int|None): If set, cache misses from concurrent
+                calls (with the same values for the other arguments) which
+                arrive within this many milliseconds of each other are fetched
+                with a single call to the wrapped function. Zero means only
+                calls made in the same reactor tick are coalesced. Requires the
+                object the method is bound to to have an `hs` attribute.
         """
         super().__init__(orig, num_args=num_args)
 
         self.list_name = list_name
+        self.coalesce_window_ms = coalesce_window_ms
 
         self.list_pos = self.arg_names.index(self.list_name)
         self.cached_method_name = cached_method_name
@@ -358,8 +622,33 @@ class DeferredCacheListDescriptor(_CacheDescriptorBase):
     def __get__(self, obj, objtype=None):
         cached_method = getattr(obj, self.cached_method_name)
         cache = cached_method.cache  # type: DeferredCache[CacheKey, Any]
+        external_tier = (
+            cached_method.external_tier
+        )  # type: Optional[_ExternalCacheTier]
         num_args = cached_method.num_args
 
+        batching_queue = None  # type: Optional[BatchingQueue[Dict[str, Any], Any]]
+        if self.coalesce_window_ms is not None:
+            batching_queue = BatchingQueue(
+                "cachedList_%s" % (self.orig.__name__,),
+                obj.hs.get_clock(),
+                self._process_coalesced_batch,
+                window_ms=self.coalesce_window_ms,
+            )
+
+        async def load(args_to_call: Dict[str, Any]) -> Any:
+            """Call the wrapped function for the missing entries, batching the
+            call up with those from other concurrent calls if configured.
+            """
+            if batching_queue:
+                batch_key = _get_batch_key(args_to_call, self.list_name)
+                if batch_key is not None:
+                    return await batching_queue.add_to_queue(
+                        args_to_call, key=batch_key
+                    )
+
+            return await maybe_awaitable(self.orig(**args_to_call))
+
         @functools.wraps(self.orig)
         def wrapped(*args, **kwargs):
             # If we're passed a cache_context then we'll want to call its
@@ -410,11 +699,16 @@ class DeferredCacheListDescriptor(_CacheDescriptorBase):
                 # which we put in the cache. Each deferred resolves with the
                 # relevant result for that key.
                 deferreds_map = {}
+                trackers = {}
                 for arg in missing:
                     deferred = defer.Deferred()
                     deferreds_map[arg] = deferred
                     key = arg_to_cache_key(arg)
-                    cache.set(key, deferred, callback=invalidate_callback)
+                    if external_tier:
+                        trackers[arg] = _InvalidationTracker(invalidate_callback)
+                        cache.set(key, deferred, callback=trackers[arg])
+                    else:
+                        cache.set(key, deferred, callback=invalidate_callback)
 
                 def complete_all(res):
                     # the wrapped function has completed. It returns a
@@ -440,11 +734,22 @@ class DeferredCacheListDescriptor(_CacheDescriptorBase):
                 args_to_call = dict(arg_dict)
                 args_to_call[self.list_name] = list(missing)
 
-                cached_defers.append(
-                    defer.maybeDeferred(
-                        preserve_fn(self.orig), **args_to_call
-                    ).addCallbacks(complete_all, errback)
-                )
+                if external_tier:
+                    fetch = preserve_fn(self._fetch_via_external_cache)
+                    d = defer.maybeDeferred(
+                        fetch,
+                        load,
+                        external_tier,
+                        arg_to_cache_key,
+                        trackers,
+                        args_to_call,
+                    )
+                elif batching_queue:
+                    d = defer.maybeDeferred(preserve_fn(load), args_to_call)
+                else:
+                    d = defer.maybeDeferred(preserve_fn(self.orig), **args_to_call)
+
+                cached_defers.append(d.addCallbacks(complete_all, errback))
 
             if cached_defers:
                 d = defer.gatherResults(cached_defers, consumeErrors=True).addCallbacks(
@@ -458,6 +763,74 @@ class DeferredCacheListDescriptor(_CacheDescriptorBase):
 
         return wrapped
 
+    async def _process_coalesced_batch(
+        self, batch: List[Dict[str, Any]]
+    ) -> Dict[Any, Any]:
+        """Call the wrapped function once for all the missing entries of a batch
+        of calls, which only differ in the list argument.
+        """
+        to_fetch = set()  # type: Set[Any]
+        for args_to_call in batch:
+            to_fetch.update(args_to_call[self.list_name])
+
+        args_to_call = dict(batch[0])
+        args_to_call[self.list_name] = list(to_fetch)
+        return await maybe_awaitable(self.orig(**args_to_call))
+
+    async def _fetch_via_external_cache(
+        self,
+        load: Callable[[Dict[str, Any]], Awaitable[Any]],
+        external_tier: _ExternalCacheTier,
+        arg_to_cache_key: Callable[[Any], CacheKey],
+        trackers: Dict[Any, _InvalidationTracker],
+        args_to_call: Dict[str, Any],
+    ) -> Dict[Any, Any]:
+        """Look up the missing entries in the external cache, and call the wrapped
+        function for any which aren't there.
+        """
+        missing = args_to_call[self.list_name]
+        keys_to_args = {arg_to_cache_key(arg): arg for arg in missing}
+        found, generations = await external_tier.get_many(keys_to_args)
+
+        results = {keys_to_args[key]: value for key, value in found.items()}
+        remaining = [arg for arg in missing if arg not in results]
+        if not remaining:
+            return results
+
+        args_to_call = dict(args_to_call)
+        args_to_call[self.list_name] = remaining
+        fetched = await load(args_to_call)
+
+        for arg in remaining:
+            # Missing entries are cached as `None`, as they are in memory. We
+            # skip any which were invalidated while we were fetching them, as
+            # they may be out of date.
+            value = fetched.get(arg, None)
+            results[arg] = value
+            key = arg_to_cache_key(arg)
+            if not trackers[arg].invalidated and key in generations:
+                external_tier.set(key, value, generations[key])
+
+        return results
+
+
+def _get_batch_key(args_to_call: Dict[str, Any], list_name: str) -> Optional[Tuple]:
+    """Get the key used to decide which calls to a `@cachedList` method can be
+    coalesced, i.e. the values of all arguments other than the list.
+
+    Returns None if the arguments can't be used as a key.
+    """
+    key = tuple(
+        (name, value)
+        for name, value in sorted(args_to_call.items())
+        if name != list_name and name != "self"
+    )
+    try:
+        hash(key)
+    except TypeError:
+        return None
+    return key
+
 
 class _CacheContext:
     """Holds cache information from the cached function higher in the calling order.
@@ -503,6 +876,8 @@ def cached(
     tree: bool = False,
     cache_context: bool = False,
     iterable: bool = False,
+    expiry_ms: Optional[int] = None,
+    external_cache_expiry_ms: Optional[int] = None,
 ) -> Callable[[F], _CachedFunction[F]]:
     func = lambda orig: DeferredCacheDescriptor(
         orig,
@@ -511,13 +886,18 @@ def cached(
         tree=tree,
         cache_context=cache_context,
         iterable=iterable,
+        expiry_ms=expiry_ms,
+        external_cache_expiry_ms=external_cache_expiry_ms,
     )
 
     return cast(Callable[[F], _CachedFunction[F]], func)
 
 
 def cachedList(
-    cached_method_name: str, list_name: str, num_args: Optional[int] = None
+    cached_method_name: str,
+    list_name: str,
+    num_args: Optional[int] = None,
+    coalesce_window_ms: Optional[int] = None,
 ) -> Callable[[F], _CachedFunction[F]]:
     """Creates a descriptor that wraps a function in a `CacheListDescriptor`.
 
@@ -534,6 +914,10 @@ def cachedList(
             do batch lookups in the cache.
         num_args: Number of arguments to use as the key in the cache
             (including list_name). Defaults to all named parameters.
+        coalesce_window_ms: If set, cache misses from concurrent calls which
+            arrive within this many milliseconds of each other are fetched with
+            a single call to the wrapped function. Zero means only calls in the
+            same reactor tick are coalesced.
 
     Example:
 
@@ -551,6 +935,7 @@ def cachedList(
         cached_method_name=cached_method_name,
         list_name=list_name,
         num_args=num_args,
+        coalesce_window_ms=coalesce_window_ms,
     )
 
     return cast(Callable[[F], _CachedFunction[F]], func)
@@ -13,14 +13,23 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import logging
+import sys
 import threading
+import weakref
+from collections import OrderedDict
+from collections.abc import Mapping
 from functools import wraps
+from types import FunctionType, MethodType, ModuleType
 from typing import (
+    TYPE_CHECKING,
     Any,
     Callable,
     Generic,
     Iterable,
+    List,
     Optional,
+    Set,
     Type,
     TypeVar,
     Union,
@@ -30,10 +39,19 @@ from typing import (
 
 from typing_extensions import Literal
 
+from twisted.internet import reactor
+
 from synapse.config import cache as cache_config
-from synapse.util.caches import CacheMetric, register_cache
+from synapse.metrics.background_process_metrics import wrap_as_background_process
+from synapse.util import Clock
+from synapse.util.caches import CacheMetric, EvictionReason, register_cache
 from synapse.util.caches.treecache import TreeCache
 
+if TYPE_CHECKING:
+    from synapse.server import HomeServer
+
+logger = logging.getLogger(__name__)
+
 # Function type: the type used for invalidation callbacks
 FT = TypeVar("FT", bound=Callable[..., Any])
 
@@ -54,15 +72,389 @@ def enumerate_leaves(node, depth):
                 yield m
 
 
+# How deep to recurse into container objects when estimating the size of a cache
+# entry.
+_MAX_SIZE_ESTIMATE_DEPTH = 20
+
+# Objects which are shared between many cache entries (or aren't really owned by
+# the cache at all), and so shouldn't be counted towards the size of an entry.
+_SIZE_ESTIMATE_SKIPPED_TYPES = (type, ModuleType, FunctionType, MethodType)
+
+# How often we check whether the caches are using more memory than allowed by
+# `caches.global_max_bytes`.
+_MEMORY_LIMIT_CHECK_INTERVAL_MS = 5 * 1000
+
+# How often we look for cache entries which haven't been accessed recently enough.
+_EXPIRY_CHECK_INTERVAL_MS = 30 * 1000
+
+# The maximum number of entries we expire from a cache before releasing its lock
+# and yielding to the reactor.
+_EXPIRY_BATCH_SIZE = 1000
+
+
+def _get_size_of(obj: Any, seen: Optional[Set[int]] = None, depth: int = 0) -> int:
+    """Estimates the memory used by the given object, including the objects it
+    references.
+
+    This is only an estimate: objects which are shared between cache entries (such
+    as interned strings) will be counted once per entry that references them.
+    """
+    if seen is None:
+        seen = set()
+
+    if id(obj) in seen or isinstance(obj, _SIZE_ESTIMATE_SKIPPED_TYPES):
+        return 0
+    seen.add(id(obj))
+
+    size = sys.getsizeof(obj, 0)
+    if depth >= _MAX_SIZE_ESTIMATE_DEPTH or isinstance(
+        obj, (str, bytes, int, float, bool)
+    ):
+        return size
+
+    depth += 1
+    if isinstance(obj, Mapping):
+        for key, value in obj.items():
+            size += _get_size_of(key, seen, depth)
+            size += _get_size_of(value, seen, depth)
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        for item in obj:
+            size += _get_size_of(item, seen, depth)
+    else:
+        if hasattr(obj, "__dict__"):
+            size += _get_size_of(obj.__dict__, seen, depth)
+        for cls in type(obj).__mro__:
+            for slot in getattr(cls, "__slots__", ()):
+                if hasattr(obj, slot):
+                    size += _get_size_of(getattr(obj, slot), seen, depth)
+
+    return size
+
+
 class _Node:
-    __slots__ = ["prev_node", "next_node", "key", "value", "callbacks"]
+    """An entry in an LruCache, which is a member of the cache's doubly-linked list
+    of entries.
+
+    Caches can hold millions of entries, so this is kept as small as possible: the
+    set of invalidation callbacks is only allocated once a callback is added, and
+    the fields needed to track memory usage are only present on `_TrackedNode`s.
+    """
+
+    __slots__ = [
+        "prev_node",
+        "next_node",
+        "key",
+        "value",
+        "callbacks",
+    ]
+
+    # These are overridden by slots on `_TrackedNode`.
+    global_prev_node = None  # type: Optional[_Node]
+    global_next_node = None  # type: Optional[_Node]
+    cache = None  # type: Optional[LruCache]
+    memory = None  # type: Optional[int]
 
-    def __init__(self, prev_node, next_node, key, value, callbacks=set()):
+    # This is overridden by a slot on the timed node classes.
+    last_access_ts_ms = None  # type: Optional[int]
+
+    def __init__(self, prev_node, next_node, key, value, callbacks=None):
         self.prev_node = prev_node
         self.next_node = next_node
         self.key = key
         self.value = value
-        self.callbacks = callbacks
+
+        # The callbacks to run when the entry is removed from the cache, or None if
+        # there aren't any.
+        self.callbacks = set(callbacks) if callbacks else None  # type: Optional[Set]
+
+    def add_callbacks(self, callbacks: Iterable[Callable[[], None]]) -> None:
+        if not callbacks:
+            return
+        if self.callbacks is None:
+            self.callbacks = set(callbacks)
+        else:
+            self.callbacks.update(callbacks)
+
+    def run_and_clear_callbacks(self) -> None:
+        if self.callbacks is None:
+            return
+        callbacks = self.callbacks
+        self.callbacks = None
+        for cb in callbacks:
+            cb()
+
+
+class _TrackedNode(_Node):
+    """An LruCache entry whose memory usage is being tracked by `_CacheMemoryTracker`."""
+
+    __slots__ = ["global_prev_node", "global_next_node", "cache", "memory"]
+
+    def __init__(self, prev_node, next_node, key, value, callbacks=None):
+        super().__init__(prev_node, next_node, key, value, callbacks)
+
+        # The position of the node in the global list of nodes across all caches,
+        # and the cache that owns it.
+        self.global_prev_node = None  # type: Optional[_Node]
+        self.global_next_node = None  # type: Optional[_Node]
+        self.cache = None  # type: Optional[LruCache]
+
+        # The estimated size of the key and value in bytes.
+        self.memory = None  # type: Optional[int]
+
+
+class _TimedNode(_Node):
+    """An LruCache entry which records when it was last read or written, for caches
+    which expire entries that haven't been accessed recently.
+    """
+
+    __slots__ = ["last_access_ts_ms"]
+
+
+class _TimedTrackedNode(_TrackedNode):
+    """A `_TimedNode` whose memory usage is also being tracked."""
+
+    __slots__ = ["last_access_ts_ms"]
+
+
+class _CacheMemoryTracker:
+    """Tracks the estimated memory usage of the entries of all LruCaches, along with
+    the order in which they were last accessed, so that we can evict the coldest
+    entries across all caches when the process-wide budget is exceeded.
+
+    Entries are only tracked once `enable` has been called.
+    """
+
+    def __init__(self):
+        # Caches may be accessed from different threads, so we protect the global
+        # list with its own lock. This must always be acquired *after* any
+        # LruCache lock.
+        self._lock = threading.Lock()
+
+        self._root = _TrackedNode(None, None, None, None)
+        self._root.global_next_node = self._root
+        self._root.global_prev_node = self._root
+
+        self.enabled = False
+        self.total_bytes = 0
+
+    def enable(self) -> None:
+        self.enabled = True
+
+    def reset(self) -> None:
+        """Stops tracking memory usage and forgets all tracked entries. Used for
+        tests.
+        """
+        with self._lock:
+            self.enabled = False
+            self.total_bytes = 0
+            self._root.global_next_node = self._root
+            self._root.global_prev_node = self._root
+
+    def add(self, cache: "LruCache", node: _Node) -> None:
+        """Start tracking the given node, which has just been added to the cache."""
+        node.memory = _get_size_of(node.key) + _get_size_of(node.value)
+        node.cache = cache
+        if cache.metrics:
+            cache.metrics.inc_memory_usage(node.memory)
+
+        with self._lock:
+            self.total_bytes += node.memory
+            self._link_at_front(node)
+
+    def update(self, node: _Node) -> None:
+        """Re-estimate the size of the node, whose value has been replaced."""
+        assert node.memory is not None and node.cache is not None
+
+        memory = _get_size_of(node.key) + _get_size_of(node.value)
+        if node.cache.metrics:
+            node.cache.metrics.dec_memory_usage(node.memory)
+            node.cache.metrics.inc_memory_usage(memory)
+
+        with self._lock:
+            self.total_bytes += memory - node.memory
+            node.memory = memory
+
+    def touch(self, node: _Node) -> None:
+        """Mark the node as the most recently accessed entry."""
+        with self._lock:
+            if node.global_prev_node is None:
+                # The node has already been removed.
+                return
+            self._unlink(node)
+            self._link_at_front(node)
+
+    def remove(self, node: _Node) -> None:
+        """Stop tracking the node, which has been removed from its cache."""
+        with self._lock:
+            if node.global_prev_node is None:
+                return
+            self._unlink(node)
+            self.total_bytes -= node.memory
+
+        if node.cache is not None and node.cache.metrics:
+            node.cache.metrics.dec_memory_usage(node.memory)
+        node.cache = None
+
+    def get_coldest_node(self) -> Optional[_Node]:
+        """Get the least recently accessed node across all caches, if any."""
+        with self._lock:
+            node = self._root.global_prev_node
+            if node is self._root:
+                return None
+            return node
+
+    def _link_at_front(self, node: _Node) -> None:
+        next_node = self._root.global_next_node
+        assert next_node is not None
+
+        node.global_prev_node = self._root
+        node.global_next_node = next_node
+        self._root.global_next_node = node
+        next_node.global_prev_node = node
+
+    def _unlink(self, node: _Node) -> None:
+        prev_node = node.global_prev_node
+        next_node = node.global_next_node
+        assert prev_node is not None and next_node is not None
+
+        prev_node.global_next_node = next_node
+        next_node.global_prev_node = prev_node
+        node.global_prev_node = None
+        node.global_next_node = None
+
+
+_memory_tracker = _CacheMemoryTracker()
+
+
+def setup_cache_memory_limit(hs: "HomeServer") -> None:
+    """Start tracking the memory used by LruCaches and periodically evict the least
+    recently used entries across all caches, if `caches.global_max_bytes` is set.
+    """
+    max_bytes = hs.config.caches.global_max_bytes
+    if not max_bytes:
+        return
+
+    clock = hs.get_clock()
+    _memory_tracker.enable()
+
+    clock.looping_call(
+        _enforce_cache_memory_limit, _MEMORY_LIMIT_CHECK_INTERVAL_MS, clock, max_bytes
+    )
+
+
+@wrap_as_background_process("LruCache._enforce_cache_memory_limit")
+async def _enforce_cache_memory_limit(clock, max_bytes: int) -> None:
+    """Evict the least recently used entries across all caches until the total
+    estimated memory usage is within `max_bytes`.
+    """
+    evicted = 0
+    while _memory_tracker.total_bytes > max_bytes:
+        node = _memory_tracker.get_coldest_node()
+        if node is None:
+            break
+
+        if node.cache is not None:
+            node.cache._evict_node(node, EvictionReason.memory)
+        else:
+            _memory_tracker.remove(node)
+
+        evicted += 1
+
+        # Make sure we don't block the reactor for too long.
+        if evicted % 1000 == 0:
+            await clock.sleep(0)
+
+    if evicted:
+        logger.info(
+            "Evicted %d cache entries to keep cache memory usage under %d bytes",
+            evicted,
+            max_bytes,
+        )
+
+
+# All LruCaches which have been created, so that we can periodically expire their
+# old entries.
+_all_caches = weakref.WeakSet()  # type: weakref.WeakSet[LruCache]
+
+
+class _ExpiryConfig:
+    def __init__(self):
+        # The default time after which entries which haven't been accessed are
+        # dropped, for caches which don't specify their own `expiry_ms`.
+        self.default_expiry_ms = None  # type: Optional[int]
+
+        # The clock to run the expiry job on, once the homeserver has started.
+        self.clock = None  # type: Optional[Clock]
+
+        # Whether the expiry job is running.
+        self.started = False
+
+    def maybe_start_expiry_job(self) -> None:
+        """Start the background job which expires old entries, if the homeserver
+        has started and it isn't already running.
+        """
+        if self.started or self.clock is None:
+            return
+
+        self.started = True
+        self.clock.looping_call(
+            _expire_old_entries, _EXPIRY_CHECK_INTERVAL_MS, self.clock
+        )
+
+
+_expiry_config = _ExpiryConfig()
+
+
+def setup_expire_lru_cache_entries(hs: "HomeServer") -> None:
+    """Set up the background job which periodically drops entries from LruCaches
+    that haven't been accessed within the cache's expiry time.
+
+    The default expiry time for all caches is taken from `caches.expiry_time`. The
+    job is only run once there is a cache with an expiry time.
+    """
+    _expiry_config.default_expiry_ms = hs.config.caches.expiry_time_msec
+    _expiry_config.clock = hs.get_clock()
+
+    if _expiry_config.default_expiry_ms or any(
+        cache._expiry_ms for cache in _all_caches
+    ):
+        _expiry_config.maybe_start_expiry_job()
+
+
+@wrap_as_background_process("LruCache._expire_old_entries")
+async def _expire_old_entries(clock: Clock) -> None:
+    """Drop entries which haven't been accessed within their cache's expiry time."""
+    expired = 0
+    for cache in list(_all_caches):
+        while True:
+            count = cache._expire_old_entries(_EXPIRY_BATCH_SIZE)
+            expired += count
+            if count < _EXPIRY_BATCH_SIZE:
+                break
+
+            # Make sure we don't block the reactor for too long.
+            await clock.sleep(0)
+
+    if expired:
+        logger.debug("Expired %d cache entries", expired)
+
+
+class _EvictedKeyTrackingConfig:
+    def __init__(self):
+        # Whether named caches remember the keys of the entries they have evicted
+        # for space, so that they can count misses which a bigger cache would have
+        # turned into hits. This is used to auto-tune the cache sizes.
+        self.enabled = False
+
+
+_evicted_key_tracking_config = _EvictedKeyTrackingConfig()
+
+
+def enable_evicted_key_tracking() -> None:
+    """Start counting misses on recently evicted keys, in the `ghost_hits` of each
+    named cache's metrics.
+    """
+    _evicted_key_tracking_config.enabled = True
 
 
 class LruCache(Generic[KT, VT]):
@@ -82,6 +474,8 @@ class LruCache(Generic[KT, VT]):
         size_callback: Optional[Callable] = None,
         metrics_collection_callback: Optional[Callable[[], None]] = None,
         apply_cache_factor_from_config: bool = True,
+        clock: Optional[Clock] = None,
+        expiry_ms: Optional[int] = None,
     ):
         """
         Args:
@@ -109,6 +503,14 @@ class LruCache(Generic[KT, VT]):
 
             apply_cache_factor_from_config (bool): If true, `max_size` will be
                 multiplied by a cache factor derived from the homeserver config
+
+            clock: The clock used to track when entries were last accessed.
+                Defaults to a clock using the global reactor.
+
+            expiry_ms: If set, entries which haven't been accessed for this many
+                milliseconds are dropped from the cache. Defaults to the
+                `caches.expiry_time` config option. Entries are expired by a
+                periodic background job, so may live a little longer than this.
         """
         cache = cache_type()
         self.cache = cache  # Used for introspection.
@@ -141,10 +543,29 @@ class LruCache(Generic[KT, VT]):
         # this is exposed for access from outside this class
         self.metrics = metrics
 
+        if clock is None:
+            clock = Clock(reactor)
+        self._clock = clock
+        self._expiry_ms = expiry_ms
+        _all_caches.add(self)
+
+        # Whether to record when each entry was last accessed, even if the cache
+        # doesn't expire entries. See `track_access_times`.
+        self._track_access_times = False
+
+        if expiry_ms:
+            _expiry_config.maybe_start_expiry_job()
+
         list_root = _Node(None, None, None, None)
         list_root.next_node = list_root
         list_root.prev_node = list_root
 
+        # The keys of the entries most recently evicted for space (if evicted key
+        # tracking is enabled), oldest first. We only remember as many keys as the
+        # cache can hold, so a miss on one of these keys is a miss which a cache of
+        # twice the size would have avoided.
+        evicted_keys = OrderedDict()  # type: OrderedDict[KT, None]
+
         lock = threading.Lock()
 
         def evict():
@@ -153,7 +574,15 @@ class LruCache(Generic[KT, VT]):
                 evicted_len = delete_node(todelete)
                 cache.pop(todelete.key, None)
                 if metrics:
-                    metrics.inc_evictions(evicted_len)
+                    metrics.inc_evictions(evicted_len, EvictionReason.size)
+                    if _evicted_key_tracking_config.enabled:
+                        remember_evicted_key(todelete.key)
+
+        def remember_evicted_key(key):
+            evicted_keys[key] = None
+            evicted_keys.move_to_end(key)
+            while len(evicted_keys) > max(self.max_size, 1):
+                evicted_keys.popitem(last=False)
 
         def synchronized(f: FT) -> FT:
             @wraps(f)
@@ -176,10 +605,33 @@ class LruCache(Generic[KT, VT]):
 
         self.len = synchronized(cache_len)
 
-        def add_node(key, value, callbacks=set()):
+        def is_timed() -> bool:
+            """Whether the entries of the cache need to record when they were last
+            accessed.
+            """
+            if self._track_access_times:
+                return True
+            if self._expiry_ms is not None:
+                return self._expiry_ms > 0
+            return bool(_expiry_config.default_expiry_ms)
+
+        def add_node(key, value, callbacks=None):
             prev_node = list_root
             next_node = prev_node.next_node
-            node = _Node(prev_node, next_node, key, value, callbacks)
+            if is_timed():
+                if _memory_tracker.enabled:
+                    node = _TimedTrackedNode(
+                        prev_node, next_node, key, value, callbacks
+                    )  # type: _Node
+                else:
+                    node = _TimedNode(prev_node, next_node, key, value, callbacks)
+                node.last_access_ts_ms = clock.time_msec()
+            elif _memory_tracker.enabled:
+                node = _TrackedNode(prev_node, next_node, key, value, callbacks)
+            else:
+                node = _Node(prev_node, next_node, key, value, callbacks)
+            if evicted_keys:
+                evicted_keys.pop(key, None)
             prev_node.next_node = node
             next_node.prev_node = node
             cache[key] = node
@@ -187,6 +639,9 @@ class LruCache(Generic[KT, VT]):
             if size_callback:
                 cached_cache_len[0] += size_callback(node.value)
 
+            if _memory_tracker.enabled:
+                _memory_tracker.add(self, node)
+
         def move_node_to_front(node):
             prev_node = node.prev_node
             next_node = node.next_node
@@ -199,6 +654,12 @@ class LruCache(Generic[KT, VT]):
             prev_node.next_node = node
             next_node.prev_node = node
 
+            if node.last_access_ts_ms is not None:
+                node.last_access_ts_ms = clock.time_msec()
+
+            if node.memory is not None:
+                _memory_tracker.touch(node)
+
         def delete_node(node):
             prev_node = node.prev_node
             next_node = node.next_node
@@ -210,11 +671,60 @@ class LruCache(Generic[KT, VT]):
                 deleted_len = size_callback(node.value)
                 cached_cache_len[0] -= deleted_len
 
-            for cb in node.callbacks:
-                cb()
-            node.callbacks.clear()
+            if node.memory is not None:
+                _memory_tracker.remove(node)
+
+            node.run_and_clear_callbacks()
             return deleted_len
 
+        @synchronized
+        def evict_node(node: _Node, reason: EvictionReason) -> None:
+            if cache.get(node.key, None) is not node:
+                # The node has already been removed from the cache.
+                if node.memory is not None:
+                    _memory_tracker.remove(node)
+                return
+
+            evicted_len = delete_node(node)
+            cache.pop(node.key, None)
+            if metrics:
+                metrics.inc_evictions(evicted_len, reason)
+
+        @synchronized
+        def expire_old_entries(limit: int) -> int:
+            """Drop up to `limit` entries which haven't been accessed within the
+            expiry time, returning the number dropped.
+            """
+            expiry_ms = self._expiry_ms
+            if expiry_ms is None:
+                expiry_ms = _expiry_config.default_expiry_ms
+            if not expiry_ms:
+                return 0
+
+            # The list is ordered by access time, so we can stop as soon as we
+            # find an entry which is recent enough. Entries added before the cache
+            # had an expiry time don't know when they were last accessed, and are
+            # treated as old.
+            cutoff = clock.time_msec() - expiry_ms
+            expired = 0
+            while expired < limit:
+                node = list_root.prev_node
+                if node is list_root:
+                    break
+                if (
+                    node.last_access_ts_ms is not None
+                    and node.last_access_ts_ms > cutoff
+                ):
+                    break
+
+                evicted_len = delete_node(node)
+                cache.pop(node.key, None)
+                if metrics:
+                    metrics.inc_evictions(evicted_len, EvictionReason.time)
+                expired += 1
+
+            return expired
+
         @overload
         def cache_get(
             key: KT,
@@ -243,13 +753,16 @@ class LruCache(Generic[KT, VT]):
             node = cache.get(key, None)
             if node is not None:
                 move_node_to_front(node)
-                node.callbacks.update(callbacks)
+                node.add_callbacks(callbacks)
                 if update_metrics and metrics:
                     metrics.inc_hits()
                 return node.value
             else:
                 if update_metrics and metrics:
                     metrics.inc_misses()
+                    if evicted_keys and key in evicted_keys:
+                        del evicted_keys[key]
+                        metrics.inc_ghost_hits()
                 return default
 
         @synchronized
@@ -260,9 +773,7 @@ class LruCache(Generic[KT, VT]):
                 # the inequality check to take a long time. So let's only do
                 # the check if we have some callbacks to call.
                 if node.callbacks and value != node.value:
-                    for cb in node.callbacks:
-                        cb()
-                    node.callbacks.clear()
+                    node.run_and_clear_callbacks()
 
                 # We don't bother to protect this by value != node.value as
                 # generally size_callback will be cheap compared with equality
@@ -272,12 +783,15 @@ class LruCache(Generic[KT, VT]):
                     cached_cache_len[0] -= size_callback(node.value)
                     cached_cache_len[0] += size_callback(value)
 
-                node.callbacks.update(callbacks)
+                node.add_callbacks(callbacks)
 
                 move_node_to_front(node)
                 node.value = value
+
+                if node.memory is not None:
+                    _memory_tracker.update(node)
             else:
-                add_node(key, value, set(callbacks))
+                add_node(key, value, callbacks)
 
             evict()
 
@@ -307,6 +821,10 @@ class LruCache(Generic[KT, VT]):
                 cache.pop(node.key, None)
                 return node.value
             else:
+                # The key has been invalidated, so a later miss on it isn't due to
+                # the cache being too small.
+                if evicted_keys:
+                    evicted_keys.pop(key, None)
                 return default
 
         @synchronized
@@ -325,9 +843,11 @@ class LruCache(Generic[KT, VT]):
             list_root.next_node = list_root
             list_root.prev_node = list_root
             for node in cache.values():
-                for cb in node.callbacks:
-                    cb()
+                if node.memory is not None:
+                    _memory_tracker.remove(node)
+                node.run_and_clear_callbacks()
             cache.clear()
+            evicted_keys.clear()
             if size_callback:
                 cached_cache_len[0] = 0
 
@@ -335,6 +855,28 @@ class LruCache(Generic[KT, VT]):
         def cache_contains(key: KT) -> bool:
             return key in cache
 
+        @synchronized
+        def cache_get_hot_keys(limit: int) -> List[KT]:
+            """Get up to `limit` keys, most recently used first."""
+            keys = []
+            node = list_root.next_node
+            while node is not list_root and len(keys) < limit:
+                keys.append(node.key)
+                node = node.next_node
+            return keys
+
+        @synchronized
+        def cache_get_last_access_ts_ms(key: KT) -> Optional[int]:
+            """Get when the entry was last read or written, if it is in the cache
+            and the cache records access times.
+
+            Doesn't count as an access of the entry.
+            """
+            node = cache.get(key, None)
+            if node is None:
+                return None
+            return node.last_access_ts_ms
+
         self.sentinel = object()
 
         # make sure that we clear out any excess entries after we get resized.
@@ -352,6 +894,18 @@ class LruCache(Generic[KT, VT]):
         self.len = synchronized(cache_len)
         self.contains = cache_contains
         self.clear = cache_clear
+        self.get_hot_keys = cache_get_hot_keys
+        self.get_last_access_ts_ms = cache_get_last_access_ts_ms
+        self._evict_node = evict_node
+        self._expire_old_entries = expire_old_entries
+
+    def track_access_times(self) -> None:
+        """Record when entries added from now on were last accessed, so that they can
+        be queried with `get_last_access_ts_ms`.
+
+        This is done anyway if the cache expires entries.
+        """
+        self._track_access_times = True
 
     def __getitem__(self, key):
         result = self.get(key, self.sentinel)
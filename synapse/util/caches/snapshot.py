@@ -0,0 +1,339 @@
+# -*- coding: utf-8 -*-
+# Copyright 2021 The Matrix.org Foundation C.I.C.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Saves the keys of the hottest cache entries on shutdown, so that they can be
+fetched again on startup.
+
+Only keys are saved: the values are fetched from the database again when the
+snapshot is restored, so there is no risk of restoring stale data.
+"""
+
+import logging
+import os
+from typing import TYPE_CHECKING, Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from prometheus_client import Gauge
+
+from twisted.internet import defer
+
+from synapse.logging.context import make_deferred_yieldable, run_in_background
+from synapse.util import json_decoder, json_encoder
+from synapse.util.async_helpers import concurrently_execute, timeout_deferred
+from synapse.util.caches.deferred_cache import DeferredCache
+from synapse.util.caches.descriptors import DeferredCacheListDescriptor
+from synapse.util.caches.lrucache import LruCache
+from synapse.util.iterutils import batch_iter
+
+if TYPE_CHECKING:
+    from synapse.server import HomeServer
+
+logger = logging.getLogger(__name__)
+
+# The version of the snapshot file format.
+_SNAPSHOT_VERSION = 1
+
+# The number of keys we fetch in each batch when restoring the event cache, or a
+# cache with a `@cachedList` method.
+_EVENT_BATCH_SIZE = 100
+
+# How many lookups we run in parallel when restoring a cache.
+_RESTORE_CONCURRENCY = 10
+
+# How long after restoring a snapshot we check how many of the restored entries
+# have been used.
+_RESTORED_HIT_RATIO_DELAY_MS = 10 * 60 * 1000
+
+restored_keys_gauge = Gauge(
+    "synapse_util_caches_snapshot_restored_keys",
+    "Number of cache entries restored from the snapshot on startup",
+    ["name"],
+)
+restored_hit_ratio_gauge = Gauge(
+    "synapse_util_caches_snapshot_restored_hit_ratio",
+    "Fraction of the restored cache entries which were used within ten minutes of "
+    "startup",
+    ["name"],
+)
+
+# A function which fetches the given keys into a cache.
+Loader = Callable[[List[Any]], Awaitable[Any]]
+
+
+class CacheSnapshotter:
+    """Saves and restores snapshots of the keys of selected caches, as configured
+    by the `caches.snapshot` config option.
+    """
+
+    def __init__(self, hs: "HomeServer"):
+        self._clock = hs.get_clock()
+        self._reactor = hs.get_reactor()
+        self._store = hs.get_datastore()
+
+        config = hs.config.caches
+        self._path = config.snapshot_path
+        self._cache_names = config.snapshot_caches
+        self._max_keys_per_cache = config.snapshot_max_keys_per_cache
+        self._restore_timeout_ms = config.snapshot_restore_timeout_msec
+
+    def is_enabled(self) -> bool:
+        return bool(self._path and self._cache_names)
+
+    def save(self) -> None:
+        """Write the keys of the most recently used entries of each cache to the
+        snapshot file.
+        """
+        if not self.is_enabled():
+            return
+
+        snapshot = {}  # type: Dict[str, List[Any]]
+        for cache_name in self._cache_names:
+            cache = self._get_cache(cache_name)
+            if cache is None:
+                logger.warning("Not snapshotting unknown cache %r", cache_name)
+                continue
+
+            keys = []
+            for key in cache.get_hot_keys(self._max_keys_per_cache):
+                # We can only save keys which can be represented as JSON.
+                try:
+                    json_encoder.encode(key)
+                except (TypeError, ValueError):
+                    continue
+                keys.append(key)
+
+            snapshot[cache_name] = keys
+
+        # Write to a temporary file first, so that we never leave a partially
+        # written snapshot behind.
+        tmp_path = self._path + ".tmp"
+        with open(tmp_path, "w") as f:
+            f.write(
+                json_encoder.encode({"version": _SNAPSHOT_VERSION, "caches": snapshot})
+            )
+        os.replace(tmp_path, self._path)
+
+        logger.info(
+            "Saved snapshot of %d cache keys to %s",
+            sum(len(keys) for keys in snapshot.values()),
+            self._path,
+        )
+
+    async def restore(self) -> None:
+        """Fetch the entries listed in the snapshot file (if any) into the caches.
+
+        Errors are logged rather than raised, since a missing or broken snapshot
+        only means that we start with cold caches.
+        """
+        if not self.is_enabled():
+            return
+
+        try:
+            with open(self._path) as f:
+                snapshot = json_decoder.decode(f.read())
+        except FileNotFoundError:
+            return
+        except Exception:
+            logger.warning(
+                "Failed to read cache snapshot from %s", self._path, exc_info=True
+            )
+            return
+
+        if snapshot.get("version") != _SNAPSHOT_VERSION:
+            logger.warning("Ignoring cache snapshot with unknown version")
+            return
+
+        # Restoring the caches holds up startup, so we give up if it takes too
+        # long. The caches which have been restored by then stay warm.
+        restored = []  # type: List[Tuple[str, List[Any]]]
+        try:
+            await make_deferred_yieldable(
+                timeout_deferred(
+                    run_in_background(self._restore_caches, snapshot, restored),
+                    self._restore_timeout_ms / 1000,
+                    self._reactor,
+                )
+            )
+        except defer.TimeoutError:
+            logger.warning(
+                "Timed out restoring caches from snapshot after %dms",
+                self._restore_timeout_ms,
+            )
+
+        logger.info(
+            "Restored %d cache keys from snapshot",
+            sum(len(keys) for _, keys in restored),
+        )
+
+        restored_ts = self._clock.time_msec()
+        self._clock.call_later(
+            _RESTORED_HIT_RATIO_DELAY_MS / 1000,
+            self._record_restored_hit_ratio,
+            restored,
+            restored_ts,
+        )
+
+    async def _restore_caches(
+        self, snapshot: Dict[str, Any], restored: List[Tuple[str, List[Any]]]
+    ) -> None:
+        """Fetch the entries listed in the snapshot into the caches, adding the
+        names and keys of the caches to `restored` as they are restored.
+        """
+        for cache_name, keys in snapshot.get("caches", {}).items():
+            if cache_name not in self._cache_names:
+                continue
+
+            loader = self._get_loader(cache_name)
+            if loader is None:
+                logger.warning("Not restoring unknown cache %r", cache_name)
+                continue
+
+            # JSON turns tuples into lists, so we need to turn them back.
+            keys = [tuple(key) if isinstance(key, list) else key for key in keys]
+
+            # We need to know when the restored entries are used, to report how
+            # useful restoring them was.
+            cache = self._get_cache(cache_name)
+            if cache is not None:
+                cache.track_access_times()
+
+            try:
+                await loader(keys)
+            except Exception:
+                logger.warning(
+                    "Failed to restore cache %s from snapshot",
+                    cache_name,
+                    exc_info=True,
+                )
+                continue
+
+            restored_keys_gauge.labels(cache_name).set(len(keys))
+            restored.append((cache_name, keys))
+
+    def _get_cache(self, cache_name: str) -> Optional[LruCache]:
+        """Get the cache with the given name, or None if there is no such cache."""
+        if cache_name == "*getEvent*":
+            return self._store._get_event_cache
+
+        method = getattr(self._store, cache_name, None)
+        if method is None or not isinstance(
+            getattr(method, "cache", None), DeferredCache
+        ):
+            return None
+        return method.cache.cache
+
+    def _get_loader(self, cache_name: str) -> Optional[Loader]:
+        """Get a function which fetches a list of keys into the given cache, or
+        None if we don't know how to fetch entries for the cache.
+        """
+        if cache_name == "*getEvent*":
+            return self._load_events
+
+        # Otherwise, the cache needs to belong to a cached storage method, which
+        # we call to populate the cache.
+        if self._get_cache(cache_name) is None:
+            return None
+
+        # Prefer fetching the keys in batches if there is a bulk version of the
+        # method.
+        list_descriptor = self._get_list_descriptor(cache_name)
+        if list_descriptor is not None:
+            return self._get_list_loader(*list_descriptor)
+
+        method = getattr(self._store, cache_name)
+
+        async def load(keys: List[Any]) -> None:
+            async def load_key(key: Any) -> None:
+                if method.num_args == 1:
+                    key = (key,)
+                await method(*key)
+
+            await concurrently_execute(load_key, keys, _RESTORE_CONCURRENCY)
+
+        return load
+
+    def _get_list_descriptor(
+        self, cache_name: str
+    ) -> Optional[Tuple[str, DeferredCacheListDescriptor]]:
+        """Get the name and descriptor of the `@cachedList` method which fetches
+        entries for the given cache in bulk, if there is one.
+        """
+        for cls in type(self._store).__mro__:
+            for name, value in vars(cls).items():
+                if (
+                    isinstance(value, DeferredCacheListDescriptor)
+                    and value.cached_method_name == cache_name
+                ):
+                    return name, value
+        return None
+
+    def _get_list_loader(
+        self, list_method_name: str, descriptor: DeferredCacheListDescriptor
+    ) -> Loader:
+        """Get a function which fetches keys into a cache in batches, using the
+        given `@cachedList` method.
+        """
+        list_method = getattr(self._store, list_method_name)
+        list_pos = descriptor.list_pos
+        list_name = descriptor.arg_names[list_pos]
+        other_names = [name for name in descriptor.arg_names if name != list_name]
+
+        async def load(keys: List[Any]) -> None:
+            # Keys which only differ in the list argument can be fetched together.
+            batches = {}  # type: Dict[Tuple, List[Any]]
+            for key in keys:
+                if not other_names:
+                    key = (key,)
+                other_args = key[:list_pos] + key[list_pos + 1 :]
+                batches.setdefault(other_args, []).append(key[list_pos])
+
+            calls = []
+            for other_args, values in batches.items():
+                for batch in batch_iter(values, _EVENT_BATCH_SIZE):
+                    kwargs = dict(zip(other_names, other_args))
+                    kwargs[list_name] = list(batch)
+                    calls.append(kwargs)
+
+            async def load_batch(kwargs: Dict[str, Any]) -> None:
+                await list_method(**kwargs)
+
+            await concurrently_execute(load_batch, calls, _RESTORE_CONCURRENCY)
+
+        return load
+
+    async def _load_events(self, keys: List[Any]) -> None:
+        event_ids = [key[0] for key in keys]
+        for i in range(0, len(event_ids), _EVENT_BATCH_SIZE):
+            await self._store._get_events_from_cache_or_db(
+                event_ids[i : i + _EVENT_BATCH_SIZE], allow_rejected=True
+            )
+
+    def _record_restored_hit_ratio(
+        self, restored: List[Tuple[str, List[Any]]], restored_ts: int
+    ) -> None:
+        """Record what fraction of the restored entries have been used since they
+        were restored.
+        """
+        for cache_name, keys in restored:
+            cache = self._get_cache(cache_name)
+            if cache is None or not keys:
+                continue
+
+            used = 0
+            for key in keys:
+                last_access = cache.get_last_access_ts_ms(key)
+                if last_access is not None and last_access > restored_ts:
+                    used += 1
+
+            restored_hit_ratio_gauge.labels(cache_name).set(used / len(keys))
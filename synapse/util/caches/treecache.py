@@ -8,11 +8,14 @@ class TreeCache:
     Tree-based backing store for LruCache. Allows subtrees of data to be deleted
     efficiently.
     Keys must be tuples.
+
+    The tree is made of nested `_TreeNode` dicts, one level per element of the key,
+    and values are stored directly in the leaves.
     """
 
     def __init__(self):
         self.size = 0
-        self.root = {}  # type: Dict
+        self.root = _TreeNode()
 
     def __setitem__(self, key, value):
         return self.set(key, value)
@@ -23,8 +26,11 @@ class TreeCache:
     def set(self, key, value):
         node = self.root
         for k in key[:-1]:
-            node = node.setdefault(k, {})
-        node[key[-1]] = _Entry(value)
+            next_node = node.get(k, None)
+            if next_node is None:
+                next_node = node[k] = _TreeNode()
+            node = next_node
+        node[key[-1]] = value
         self.size += 1
 
     def get(self, key, default=None):
@@ -33,11 +39,15 @@ class TreeCache:
             node = node.get(k, None)
             if node is None:
                 return default
-        return node.get(key[-1], _Entry(default)).value
+        value = node.get(key[-1], default)
+        if isinstance(value, _TreeNode):
+            # The key is a prefix of the keys in the cache, rather than a key.
+            return default
+        return value
 
     def clear(self):
         self.size = 0
-        self.root = {}
+        self.root = _TreeNode()
 
     def pop(self, key, default=None):
         nodes = []
@@ -63,8 +73,7 @@ class TreeCache:
                 break
             node_and_keys[i + 1][0].pop(k)
 
-        popped, cnt = _strip_and_count_entires(popped)
-        self.size -= cnt
+        self.size -= _count_entries(popped)
         return popped
 
     def values(self):
@@ -74,40 +83,31 @@ class TreeCache:
         return self.size
 
 
+class _TreeNode(dict):
+    """An interior node of a TreeCache.
+
+    This is a distinct type so that leaves can be told apart from subtrees without
+    wrapping every value in the cache, even if the values are themselves dicts.
+    """
+
+    __slots__ = ()
+
+
 def iterate_tree_cache_entry(d):
     """Helper function to iterate over the leaves of a tree, i.e. a dict of that
     can contain dicts.
     """
-    if isinstance(d, dict):
+    if isinstance(d, _TreeNode):
         for value_d in d.values():
             for value in iterate_tree_cache_entry(value_d):
                 yield value
     else:
-        if isinstance(d, _Entry):
-            yield d.value
-        else:
-            yield d
-
-
-class _Entry:
-    __slots__ = ["value"]
+        yield d
 
-    def __init__(self, value):
-        self.value = value
 
-
-def _strip_and_count_entires(d):
-    """Takes an _Entry or dict with leaves of _Entry's, and either returns the
-    value or a dictionary with _Entry's replaced by their values.
-
-    Also returns the count of _Entry's
-    """
-    if isinstance(d, dict):
-        cnt = 0
-        for key, value in d.items():
-            v, n = _strip_and_count_entires(value)
-            d[key] = v
-            cnt += n
-        return d, cnt
+def _count_entries(d):
+    """Counts the leaves of a subtree, which may be a single value."""
+    if isinstance(d, _TreeNode):
+        return sum(_count_entries(value) for value in d.values())
     else:
-        return d.value, 1
+        return 1
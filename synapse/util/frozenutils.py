@@ -12,15 +12,105 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
+import json
+from collections.abc import Mapping
+from typing import Any, Dict, Iterator, Optional
 
 from frozendict import frozendict
 
 
+class FrozenDictView(Mapping):
+    """A read-only view of a dict decoded from JSON, which doesn't copy the dict.
+
+    Nested dicts are returned as views, and nested lists as tuples, when they are
+    read, so nothing reached through the view can be modified. These are created
+    on first access and then reused, so repeatedly reading e.g. the `prev_events`
+    of an event doesn't copy the list each time.
+
+    Views can be encoded by `json_encoder` and canonicaljson without copying.
+    """
+
+    __slots__ = ["_dict", "_views"]
+
+    def __init__(self, d: dict):
+        self._dict = d
+
+        # The views of the nested dicts and lists which have been read, or None if
+        # there aren't any yet.
+        self._views = None  # type: Optional[Dict[str, Any]]
+
+    def get_underlying_dict(self) -> dict:
+        """Returns the wrapped dict, which must not be modified."""
+        return self._dict
+
+    def __getitem__(self, key: str) -> Any:
+        value = self._dict[key]
+        if type(value) is not dict and type(value) is not list:
+            return value
+
+        if self._views is None:
+            self._views = {}
+        view = self._views.get(key)
+        if view is None:
+            view = self._views[key] = _view(value)
+        return view
+
+    def __contains__(self, key: object) -> bool:
+        return key in self._dict
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._dict)
+
+    def __len__(self) -> int:
+        return len(self._dict)
+
+    def __eq__(self, other: object) -> bool:
+        if isinstance(other, FrozenDictView):
+            other = other._dict
+        return self._dict == other
+
+    def __hash__(self) -> int:
+        return hash(frozenset(self.items()))
+
+    def __repr__(self) -> str:
+        return "FrozenDictView(%r)" % (self._dict,)
+
+
+def _view(o: Any) -> Any:
+    if type(o) is dict:
+        return FrozenDictView(o)
+
+    if type(o) is list:
+        return tuple(_view(i) for i in o)
+
+    return o
+
+
+class ViewAwareJSONEncoder(json.JSONEncoder):
+    """A JSONEncoder which encodes `FrozenDictView`s as their underlying dicts.
+
+    This is given to canonicaljson as its JSON library, which passes its own
+    `default`.
+    """
+
+    def __init__(self, *, default=None, **kwargs):
+        def _default(o):
+            if isinstance(o, FrozenDictView):
+                return o.get_underlying_dict()
+            if default is not None:
+                return default(o)
+            raise TypeError(
+                "Object of type %s is not JSON serializable" % o.__class__.__name__
+            )
+
+        super().__init__(default=_default, **kwargs)
+
+
 def freeze(o):
     if isinstance(o, dict):
         return frozendict({k: freeze(v) for k, v in o.items()})
 
-    if isinstance(o, frozendict):
+    if isinstance(o, (frozendict, FrozenDictView)):
         return o
 
     if isinstance(o, (bytes, str)):
@@ -35,6 +125,9 @@ def freeze(o):
 
 
 def unfreeze(o):
+    if isinstance(o, FrozenDictView):
+        o = o.get_underlying_dict()
+
     if isinstance(o, (dict, frozendict)):
         return dict({k: unfreeze(v) for k, v in o.items()})
 
@@ -12,6 +12,22 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
+
+"""Runs the synmark benchmark suites with pyperf.
+
+To run a subset of the suites, pass their module names, e.g.:
+
+    python -m synmark lrucache cached cached_list
+
+pyperf's own options can be used as well. In particular, `-o` writes the results
+as pyperf JSON, which can be compared between commits with:
+
+    python -m synmark -o before.json
+    git checkout <other commit>
+    python -m synmark -o after.json
+    python -m pyperf compare_to before.json after.json --table
+"""
+
 import sys
 from argparse import REMAINDER
 from contextlib import redirect_stderr
@@ -1,4 +1,17 @@
-from . import logging, lrucache, lrucache_evict
+from . import (
+    cached,
+    cached_list,
+    deferred_cache,
+    dictionary_cache,
+    event_hashing,
+    expiring_cache,
+    logging,
+    lrucache,
+    lrucache_evict,
+    lrucache_tree,
+    response_cache,
+    stream_change_cache,
+)
 
 SUITES = [
     (logging, 1000),
@@ -6,4 +19,13 @@ SUITES = [
     (logging, None),
     (lrucache, None),
     (lrucache_evict, None),
+    (lrucache_tree, None),
+    (deferred_cache, None),
+    (cached, None),
+    (cached_list, None),
+    (dictionary_cache, None),
+    (stream_change_cache, None),
+    (response_cache, None),
+    (expiring_cache, None),
+    (event_hashing, 1000),
 ]
@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+# Copyright 2021 The Matrix.org Foundation C.I.C.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from pyperf import perf_counter
+
+from synapse.util.caches.descriptors import cached
+
+
+class _Store:
+    @cached()
+    async def get_synmark_cached_value(self, key):
+        return key
+
+
+async def main(reactor, loops):
+    """
+    Benchmark `loops` number of keys being looked up twice through a `@cached`
+    method: once as a cache miss, and once as a cache hit.
+    """
+    store = _Store()
+
+    start = perf_counter()
+
+    for i in range(loops):
+        await store.get_synmark_cached_value(i)
+        await store.get_synmark_cached_value(i)
+
+    end = perf_counter() - start
+
+    return end
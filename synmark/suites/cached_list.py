@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+# Copyright 2021 The Matrix.org Foundation C.I.C.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from pyperf import perf_counter
+
+from synapse.util.caches.descriptors import cached, cachedList
+
+# The number of keys requested in each call to the `@cachedList` method.
+_BATCH_SIZE = 100
+
+
+class _Store:
+    @cached()
+    async def get_synmark_cached_list_value(self, key):
+        pass
+
+    @cachedList("get_synmark_cached_list_value", "keys")
+    async def get_synmark_cached_list_values(self, keys):
+        return {key: key for key in keys}
+
+
+async def main(reactor, loops):
+    """
+    Benchmark `loops` number of keys being fetched twice through a `@cachedList`
+    method, in batches: once as cache misses, and once as cache hits.
+    """
+    store = _Store()
+
+    batches = [
+        list(range(i, min(i + _BATCH_SIZE, loops)))
+        for i in range(0, loops, _BATCH_SIZE)
+    ]
+
+    start = perf_counter()
+
+    for batch in batches:
+        await store.get_synmark_cached_list_values(batch)
+        await store.get_synmark_cached_list_values(batch)
+
+    end = perf_counter() - start
+
+    return end
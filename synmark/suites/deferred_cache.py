@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+# Copyright 2021 The Matrix.org Foundation C.I.C.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from pyperf import perf_counter
+
+from twisted.internet import defer
+
+from synapse.util.caches.deferred_cache import DeferredCache
+
+
+async def main(reactor, loops):
+    """
+    Benchmark `loops` number of completed deferreds being added to a DeferredCache,
+    followed by a lookup of each of them.
+    """
+    cache = DeferredCache(
+        "synmark_deferred_cache",
+        max_entries=loops,
+        apply_cache_factor_from_config=False,
+    )
+
+    start = perf_counter()
+
+    for i in range(loops):
+        cache.set(i, defer.succeed(i))
+    for i in range(loops):
+        cache.get(i)
+
+    end = perf_counter() - start
+
+    return end
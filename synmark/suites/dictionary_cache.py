@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+# Copyright 2021 The Matrix.org Foundation C.I.C.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from pyperf import perf_counter
+
+from synapse.util.caches.dictionary_cache import DictionaryCache
+
+# The number of dict keys in each cache entry, like the state in a state group.
+_DICT_KEYS_PER_ENTRY = 10
+
+
+async def main(reactor, loops):
+    """
+    Benchmark `loops` number of full dicts being added to a DictionaryCache, followed
+    by a lookup of all of each dict and of a single key from it.
+    """
+    cache = DictionaryCache("synmark_dictionary_cache", max_entries=loops)
+    value = {
+        ("m.room.member", "@user%d:test" % (i,)): "$event%d" % (i,)
+        for i in range(_DICT_KEYS_PER_ENTRY)
+    }
+    dict_keys = [next(iter(value))]
+
+    start = perf_counter()
+
+    for i in range(loops):
+        sequence = cache.sequence
+        cache.update(sequence, i, value)
+    for i in range(loops):
+        cache.get(i)
+        cache.get(i, dict_keys)
+
+    end = perf_counter() - start
+
+    return end
@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+# Copyright 2021 The Matrix.org Foundation C.I.C.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+
+from pyperf import perf_counter
+from signedjson.key import generate_signing_key
+
+from synapse.api.room_versions import RoomVersions
+from synapse.crypto.event_signing import (
+    add_hashes_and_signatures,
+    check_event_content_hash,
+    compute_event_reference_hash,
+)
+from synapse.events import make_event_from_dict
+from synapse.util.stringutils import random_string
+
+
+async def main(reactor, loops):
+    """
+    Benchmark hashing `loops` events received over federation, as they are on
+    the way in: checking the content hash and computing the reference hash a few
+    times (for the event ID, signature checks and persistence).
+    """
+    room_version = RoomVersions.V6
+    signing_key = generate_signing_key("1")
+
+    events = []
+    for i in range(loops):
+        event_dict = {
+            "room_id": "!room:example.com",
+            "sender": "@user:example.com",
+            "type": "m.room.message",
+            "content": {"msgtype": "m.text", "body": random_string(100)},
+            "depth": i,
+            "prev_events": ["$" + random_string(43)],
+            "auth_events": ["$" + random_string(43) for _ in range(3)],
+            "origin_server_ts": 1000 + i,
+        }
+        add_hashes_and_signatures(room_version, event_dict, "example.com", signing_key)
+        events.append(make_event_from_dict(event_dict, room_version))
+
+    start = perf_counter()
+
+    for event in events:
+        check_event_content_hash(event)
+        for _ in range(3):
+            compute_event_reference_hash(event)
+
+    end = perf_counter() - start
+
+    return end
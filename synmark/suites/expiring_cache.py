@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+# Copyright 2021 The Matrix.org Foundation C.I.C.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from pyperf import perf_counter
+
+from synapse.util import Clock
+from synapse.util.caches.expiringcache import ExpiringCache
+
+
+async def main(reactor, loops):
+    """
+    Benchmark `loops` number of insertions into an ExpiringCache where half of them
+    are evicted, followed by a lookup of each key.
+    """
+    cache = ExpiringCache(
+        "synmark_expiring_cache",
+        Clock(reactor),
+        max_len=loops // 2,
+        expiry_ms=60000,
+        reset_expiry_on_get=True,
+    )
+
+    start = perf_counter()
+
+    for i in range(loops):
+        cache[i] = True
+    for i in range(loops):
+        cache.get(i)
+
+    end = perf_counter() - start
+
+    return end
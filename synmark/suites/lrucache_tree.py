@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+# Copyright 2021 The Matrix.org Foundation C.I.C.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import logging
+import tracemalloc
+
+from pyperf import perf_counter
+
+from synapse.util.caches.lrucache import LruCache
+from synapse.util.caches.treecache import TreeCache
+
+logger = logging.getLogger(__name__)
+
+# The number of entries under each first-level key, like the users in a room.
+_ENTRIES_PER_PREFIX = 100
+
+
+async def main(reactor, loops):
+    """
+    Benchmark `loops` number of insertions into a TreeCache-backed LruCache with
+    two-element keys, followed by a lookup of each entry and the invalidation of
+    every subtree.
+
+    The memory used by each entry, excluding the keys and values, is logged
+    (run with `--log` to see it).
+    """
+    keys = [
+        ("room%d" % (i // _ENTRIES_PER_PREFIX,), "user%d" % (i,)) for i in range(loops)
+    ]
+    prefixes = sorted({key[:1] for key in keys})
+
+    cache = LruCache(loops, keylen=2, cache_type=TreeCache)
+
+    start = perf_counter()
+
+    for key in keys:
+        cache[key] = True
+    for key in keys:
+        cache.get(key)
+    for prefix in prefixes:
+        cache.del_multi(prefix)
+
+    end = perf_counter() - start
+
+    # Measure the memory overhead separately, so that tracing allocations doesn't
+    # slow down the timed run.
+    cache = LruCache(loops, keylen=2, cache_type=TreeCache)
+    tracemalloc.start()
+    before, _ = tracemalloc.get_traced_memory()
+    for key in keys:
+        cache[key] = True
+    after, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    logger.info(
+        "TreeCache-backed LruCache uses %.1f bytes per entry",
+        (after - before) / max(loops, 1),
+    )
+
+    return end
@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+# Copyright 2021 The Matrix.org Foundation C.I.C.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from pyperf import perf_counter
+
+from synapse.util import Clock
+from synapse.util.caches.response_cache import ResponseCache
+
+
+async def _handle_request(key):
+    return key
+
+
+async def main(reactor, loops):
+    """
+    Benchmark `loops` number of requests being wrapped by a ResponseCache, where each
+    key is requested twice while the first request is still cached.
+    """
+    cache = ResponseCache(Clock(reactor), "synmark_response_cache", timeout_ms=60000)
+
+    start = perf_counter()
+
+    for i in range(loops):
+        await cache.wrap(i, _handle_request, i)
+    for i in range(loops):
+        await cache.wrap(i, _handle_request, i)
+
+    end = perf_counter() - start
+
+    return end
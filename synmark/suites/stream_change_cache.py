@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+# Copyright 2021 The Matrix.org Foundation C.I.C.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from pyperf import perf_counter
+
+from synapse.util.caches.stream_change_cache import StreamChangeCache
+
+# The number of entities which have changed in the cache.
+_CHANGED_ENTITIES = 10000
+
+# The number of entities we ask about in each call, like the users a user shares
+# rooms with.
+_QUERIED_ENTITIES = 10000
+
+
+async def main(reactor, loops):
+    """
+    Benchmark `loops` number of calls to `StreamChangeCache.get_entities_changed` with
+    a large set of entities, half of which have changed since the given position.
+    """
+    cache = StreamChangeCache(
+        "synmark_stream_change_cache", 0, max_size=_CHANGED_ENTITIES
+    )
+    for i in range(_CHANGED_ENTITIES):
+        cache.entity_has_changed("@user%d:test" % (i,), i + 1)
+
+    entities = [
+        "@user%d:test" % (i,)
+        for i in range(_CHANGED_ENTITIES - _QUERIED_ENTITIES // 2, _CHANGED_ENTITIES)
+    ] + ["@other%d:test" % (i,) for i in range(_QUERIED_ENTITIES // 2)]
+    stream_pos = _CHANGED_ENTITIES // 2
+
+    start = perf_counter()
+
+    for _ in range(loops):
+        cache.get_entities_changed(entities, stream_pos)
+
+    end = perf_counter() - start
+
+    return end
@@ -13,8 +13,12 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-from synapse.config._base import Config, RootConfig
-from synapse.config.cache import CacheConfig, add_resizable_cache
+from synapse.config._base import Config, ConfigError, RootConfig
+from synapse.config.cache import (
+    CacheConfig,
+    add_resizable_cache,
+    set_auto_tuned_cache_factors,
+)
 from synapse.util.caches.lrucache import LruCache
 
 from tests.unittest import TestCase
@@ -169,3 +173,84 @@ class CacheConfigTests(TestCase):
         add_resizable_cache("event_cache", cache_resize_callback=cache.set_cache_factor)
 
         self.assertEqual(cache.max_size, 10240)
+
+    def test_global_max_bytes(self):
+        """
+        The global cache memory limit can be given as a size string.
+        """
+        t = TestConfig()
+        t.read_config(
+            {"caches": {"global_max_bytes": "2G"}}, config_dir_path="", data_dir_path=""
+        )
+        self.assertEqual(t.caches.global_max_bytes, 2 * 1024 * 1024 * 1024)
+
+        t = TestConfig()
+        t.read_config({}, config_dir_path="", data_dir_path="")
+        self.assertIsNone(t.caches.global_max_bytes)
+
+    def test_expiry_time(self):
+        """
+        The cache expiry time is parsed as a duration.
+        """
+        t = TestConfig()
+        t.read_config(
+            {"caches": {"expiry_time": "30m"}}, config_dir_path="", data_dir_path=""
+        )
+        self.assertEqual(t.caches.expiry_time_msec, 30 * 60 * 1000)
+
+    def test_snapshot(self):
+        """
+        The cache snapshot options are read, and the list of caches is validated.
+        """
+        t = TestConfig()
+        t.read_config(
+            {
+                "caches": {
+                    "snapshot": {
+                        "path": "/tmp/snapshot.json",
+                        "caches": ["*getEvent*", "get_users_in_room"],
+                    }
+                }
+            },
+            config_dir_path="",
+            data_dir_path="",
+        )
+        self.assertEqual(t.caches.snapshot_path, "/tmp/snapshot.json")
+        self.assertEqual(t.caches.snapshot_caches, ["*getEvent*", "get_users_in_room"])
+        self.assertEqual(t.caches.snapshot_max_keys_per_cache, 10000)
+
+        t = TestConfig()
+        with self.assertRaises(ConfigError):
+            t.read_config(
+                {"caches": {"snapshot": {"caches": "get_users_in_room"}}},
+                config_dir_path="",
+                data_dir_path="",
+            )
+
+    def test_auto_tuned_factors(self):
+        """
+        Auto-tuned cache factors are applied to caches, unless a factor has been
+        set for the cache in the config.
+        """
+        config = {"caches": {"per_cache_factors": {"bar": 3}}}
+        t = TestConfig()
+        t.read_config(config, config_dir_path="", data_dir_path="")
+
+        cache_foo = LruCache(100)
+        add_resizable_cache("*foo*", cache_resize_callback=cache_foo.set_cache_factor)
+        cache_bar = LruCache(100)
+        add_resizable_cache("bar", cache_resize_callback=cache_bar.set_cache_factor)
+
+        set_auto_tuned_cache_factors({"*foo*": 2, "bar": 2})
+        self.assertEqual(cache_foo.max_size, 200)
+        self.assertEqual(cache_bar.max_size, 300)
+
+        self.assertFalse(t.caches.has_cache_factor("*foo*"))
+        self.assertTrue(t.caches.has_cache_factor("bar"))
+
+        with self.assertRaises(ConfigError):
+            TestConfig().read_config(
+                {"caches": {"auto_tune": {"min_factor": 2, "max_factor": 1}}},
+                config_dir_path="",
+                data_dir_path="",
+            )
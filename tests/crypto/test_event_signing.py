@@ -15,10 +15,16 @@
 
 
 import nacl.signing
+from canonicaljson import encode_canonical_json
+from mock import patch
 from unpaddedbase64 import decode_base64
 
 from synapse.api.room_versions import RoomVersions
-from synapse.crypto.event_signing import add_hashes_and_signatures
+from synapse.crypto.event_signing import (
+    add_hashes_and_signatures,
+    check_event_content_hash,
+    compute_event_reference_hash,
+)
 from synapse.events import make_event_from_dict
 
 from tests import unittest
@@ -104,3 +110,40 @@ class EventSigningTestCase(unittest.TestCase):
             "Wm+VzmOUOz08Ds+0NTWb1d4CZrVsJSikkeRxh6aCcUw"
             "u6pNC78FunoD7KNWzqFn241eYHYMGCA5McEiVPdhzBA",
         )
+
+    def test_hashes_cached(self):
+        """The hashes of an event are only computed once."""
+        event_dict = {
+            "content": {"body": "Here is the message content"},
+            "origin": "domain",
+            "origin_server_ts": 1000000,
+            "type": "m.room.message",
+            "room_id": "!r:domain",
+            "sender": "@u:domain",
+            "depth": 1,
+            "prev_events": [],
+            "auth_events": [],
+        }
+        add_hashes_and_signatures(
+            RoomVersions.V6, event_dict, HOSTNAME, self.signing_key
+        )
+        event = make_event_from_dict(event_dict, RoomVersions.V6)
+
+        with patch(
+            "synapse.crypto.event_signing.encode_canonical_json",
+            wraps=encode_canonical_json,
+        ) as encode:
+            # the event ID is the reference hash.
+            event_id = event.event_id
+            self.assertEqual(encode.call_count, 1)
+
+            name, ref_hash = compute_event_reference_hash(event)
+            self.assertEqual(name, "sha256")
+            self.assertEqual(
+                ref_hash,
+                decode_base64(event_id[1:].replace("-", "+").replace("_", "/")),
+            )
+
+            self.assertTrue(check_event_content_hash(event))
+            self.assertTrue(check_event_content_hash(event))
+            self.assertEqual(encode.call_count, 2)
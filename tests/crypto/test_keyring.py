@@ -235,6 +235,28 @@ class KeyringTestCase(unittest.HomeserverTestCase):
         )
         self.get_success(d)
 
+    @unittest.override_config({"federation_verification": {"use_threads": True}})
+    def test_verify_json_on_threads(self):
+        """Signatures can be checked on the thread pool."""
+        kr = keyring.Keyring(self.hs, key_fetchers=(StoreKeyFetcher(self.hs),))
+
+        key1 = signedjson.key.generate_signing_key(1)
+        r = self.hs.get_datastore().store_server_verify_keys(
+            "server9",
+            time.time() * 1000,
+            [("server9", get_key_id(key1), FetchKeyResult(get_verify_key(key1), None))],
+        )
+        self.get_success(r)
+
+        json1 = {}
+        signedjson.sign.sign_json(json1, "server9", key1)
+        d = _verify_json_for_server(kr, "server9", json1, 0, "test signed")
+        self.get_success(d)
+
+        json2 = {"tampered": True, "signatures": json1["signatures"]}
+        d = _verify_json_for_server(kr, "server9", json2, 0, "test tampered")
+        self.get_failure(d, SynapseError)
+
     def test_verify_json_dedupes_key_requests(self):
         """Two requests for the same key should be deduped."""
         key1 = signedjson.key.generate_signing_key(1)
@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+# Copyright 2021 The Matrix.org Foundation C.I.C.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from mock import patch
+
+from twisted.internet import defer
+
+from synapse.crypto import verification_executor
+from synapse.crypto.verification_executor import VerificationExecutor
+
+from tests import unittest
+
+
+def _double(x):
+    if x < 0:
+        raise ValueError("negative")
+    return x * 2
+
+
+class VerificationExecutorTestCase(unittest.HomeserverTestCase):
+    def test_inline(self):
+        """Checks run straight away by default."""
+        executor = VerificationExecutor(self.hs)
+
+        d = defer.ensureDeferred(executor.run(_double, 2))
+        self.assertEqual(self.successResultOf(d), 4)
+
+    @unittest.override_config(
+        {"federation_verification": {"use_threads": True, "batch_size": 2}}
+    )
+    def test_batches(self):
+        """Checks made at the same time are run in batches on the thread pool."""
+        executor = VerificationExecutor(self.hs)
+
+        batches = []
+        run_checks = verification_executor._run_checks
+
+        def _run_checks(checks):
+            batches.append(len(checks))
+            return run_checks(checks)
+
+        with patch.object(verification_executor, "_run_checks", _run_checks):
+            ds = [defer.ensureDeferred(executor.run(_double, x)) for x in (1, 2, -1)]
+            self.assertFalse(any(d.called for d in ds))
+
+            self.pump()
+
+        self.assertEqual(batches, [2, 1])
+        self.assertEqual(self.successResultOf(ds[0]), 2)
+        self.assertEqual(self.successResultOf(ds[1]), 4)
+        self.failureResultOf(ds[2], ValueError)
@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+# Copyright 2021 The Matrix.org Foundation C.I.C.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from synapse.api.room_versions import RoomVersions
+from synapse.events import make_event_from_dict, make_event_from_json
+from synapse.util import json_encoder
+
+from tests import unittest
+
+EVENT_DICT = {
+    "type": "m.room.member",
+    "state_key": "@alice:test",
+    "sender": "@alice:test",
+    "room_id": "!room:test",
+    "content": {"membership": "join"},
+    "auth_events": ["$create"],
+    "prev_events": ["$prev"],
+    "depth": 5,
+    "origin_server_ts": 1000,
+    "hashes": {"sha256": "abc"},
+    "signatures": {"test": {"ed25519:a": "sig"}},
+    "unsigned": {"age_ts": 1000},
+}
+
+
+class LazyEventTestCase(unittest.TestCase):
+    def _make_lazy_event(self, known_fields):
+        return make_event_from_json(
+            json=json_encoder.encode(EVENT_DICT),
+            event_id="$event",
+            known_fields=known_fields,
+            room_version=RoomVersions.V6,
+        )
+
+    def test_known_fields_do_not_decode(self):
+        """Reading the known fields doesn't decode the JSON."""
+        event = self._make_lazy_event(
+            {
+                "type": "m.room.member",
+                "state_key": "@alice:test",
+                "sender": "@alice:test",
+                "room_id": "!room:test",
+            }
+        )
+
+        self.assertEqual(event.event_id, "$event")
+        self.assertEqual(event.type, "m.room.member")
+        self.assertEqual(event.sender, "@alice:test")
+        self.assertTrue(event.is_state())
+        self.assertFalse(event._dict.is_decoded())
+
+        self.assertEqual(event.membership, "join")
+        self.assertTrue(event._dict.is_decoded())
+
+    def test_known_absent_field(self):
+        """A field known to be absent doesn't decode the JSON."""
+        event = self._make_lazy_event({"type": "m.room.message", "state_key": None})
+
+        self.assertFalse(event.is_state())
+        self.assertNotIn("state_key", event)
+        self.assertFalse(event._dict.is_decoded())
+
+    def test_same_as_eager_event(self):
+        """A lazy event looks the same as one built from the dict."""
+        event = self._make_lazy_event({"type": "m.room.member"})
+        eager_event = make_event_from_dict(EVENT_DICT, RoomVersions.V6)
+
+        self.assertEqual(event.get_dict(), eager_event.get_dict())
+        self.assertEqual(event.get_pdu_json(), eager_event.get_pdu_json())
+        self.assertEqual(event.signatures, eager_event.signatures)
+        self.assertEqual(event.unsigned, eager_event.unsigned)
+        self.assertEqual(list(event.auth_event_ids()), ["$create"])
+        self.assertEqual(list(event.prev_event_ids()), ["$prev"])
+        self.assertEqual(event.depth, 5)
+
+    def test_set_unsigned(self):
+        """The unsigned dict can be replaced, and survives decoding."""
+        event = self._make_lazy_event({"type": "m.room.member"})
+
+        event.unsigned = {"prev_content": {}}
+        self.assertEqual(event.content, {"membership": "join"})
+        self.assertEqual(event.unsigned, {"prev_content": {}})
+
+    def test_freeze(self):
+        """Freezing a lazy event freezes the decoded dict."""
+        event = self._make_lazy_event({"type": "m.room.member"})
+        event.freeze()
+
+        with self.assertRaises(TypeError):
+            event.content["membership"] = "leave"
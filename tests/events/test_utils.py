@@ -13,13 +13,19 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+from mock import patch
+
 from synapse.api.room_versions import RoomVersions
 from synapse.events import make_event_from_dict
 from synapse.events.utils import (
+    SerializedEvent,
     copy_power_levels_contents,
     prune_event,
     serialize_event,
 )
+from synapse.http.server import _encode_json_bytes
+from synapse.util import json_decoder
+from synapse.util.caches.lrucache import LruCache
 from synapse.util.frozenutils import freeze
 
 from tests import unittest
@@ -423,6 +429,104 @@ class SerializeEventTestCase(unittest.TestCase):
             )
 
 
+class SerializedEventTestCase(unittest.TestCase):
+    def setUp(self):
+        self.cache = LruCache(10)
+
+    def serialize(self, ev, time_now_ms=1000, **kwargs):
+        return serialize_event(ev, time_now_ms, encoding_cache=self.cache, **kwargs)
+
+    def decode(self, json_object):
+        return json_decoder.decode(b"".join(_encode_json_bytes(json_object)).decode())
+
+    def test_encode(self):
+        """The encoding of a serialized event is the same as that of the dict."""
+        ev = MockEvent(
+            sender="@alice:localhost",
+            room_id="!foo:bar",
+            content={"body": "A message"},
+            unsigned={"age_ts": 500},
+        )
+        d = self.serialize(ev)
+        self.assertIsInstance(d, SerializedEvent)
+
+        response = {"chunk": [d], "start": "s1"}
+        self.assertEqual(self.decode(response), {"chunk": [dict(d)], "start": "s1"})
+
+        # The second time round the static parts come from the cache, and the age
+        # is updated.
+        self.assertEqual(len(self.cache), 1)
+        d2 = self.serialize(ev, time_now_ms=2000)
+        self.assertEqual(self.decode(d2)["unsigned"], {"age": 1500})
+        self.assertEqual(self.decode(d2)["content"], {"body": "A message"})
+
+    def test_changed(self):
+        """Changing a serialized event stops it from using the cached encoding."""
+        ev = MockEvent(sender="@alice:localhost", content={"body": "A message"})
+        self.decode(self.serialize(ev))
+
+        d = self.serialize(ev)
+        d["content"] = {"body": "An edit"}
+        self.assertEqual(self.decode(d)["content"], {"body": "An edit"})
+
+    def test_only_event_fields(self):
+        """Events filtered by field are returned as plain dicts."""
+        ev = MockEvent(sender="@alice:localhost", room_id="!foo:bar")
+        d = self.serialize(ev, only_event_fields=["room_id"])
+        self.assertNotIsInstance(d, SerializedEvent)
+        self.assertEqual(self.decode(d), {"room_id": "!foo:bar"})
+
+
+class FrozenEventTestCase(unittest.TestCase):
+    """Tests that the dicts of frozen events can't be modified through copies."""
+
+    def setUp(self):
+        patcher = patch("synapse.events.USE_FROZEN_DICTS", True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.event = make_event_from_dict(
+            {
+                "type": "A",
+                "event_id": "$test:domain",
+                "room_id": "!1:domain",
+                "sender": "@2:domain",
+                "content": {"membership": "join", "other": {"a": 1}},
+                "hashes": {"sha256": "abc"},
+                "prev_events": ["$prev"],
+            },
+            RoomVersions.V1,
+        )
+
+    def test_get_dict(self):
+        d = self.event.get_dict()
+        with self.assertRaises(TypeError):
+            d["content"]["membership"] = "leave"
+        with self.assertRaises(TypeError):
+            d["hashes"]["sha256"] = "def"
+
+    def test_prune_event(self):
+        pruned = prune_event(self.event)
+        with self.assertRaises(TypeError):
+            pruned.get_dict()["hashes"]["sha256"] = "def"
+
+    def test_serialize_event(self):
+        serialized = serialize_event(self.event, 1000)
+        with self.assertRaises(TypeError):
+            serialized["content"]["other"]["a"] = 2
+
+        self.assertEqual(
+            json_decoder.decode(b"".join(_encode_json_bytes(serialized)).decode()),
+            serialize_event(self.event, 1000),
+        )
+
+    def test_get_pdu_json(self):
+        pdu_json = self.event.get_pdu_json()
+        with self.assertRaises(TypeError):
+            pdu_json["content"]["membership"] = "leave"
+        self.assertEqual(self.event.content["membership"], "join")
+
+
 class CopyPowerLevelsContentTestCase(unittest.TestCase):
     def setUp(self) -> None:
         self.test_content = {
@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+# Copyright 2021 The Matrix.org Foundation C.I.C.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import signedjson.key
+from mock import patch
+from signedjson.key import get_verify_key
+
+from synapse.api.errors import SynapseError
+from synapse.api.room_versions import RoomVersions
+from synapse.crypto.event_signing import add_hashes_and_signatures
+from synapse.events import make_event_from_dict
+from synapse.events.utils import prune_event
+from synapse.federation.federation_base import VerifiedSignatureCache
+from synapse.storage.keys import FetchKeyResult
+
+from tests import unittest
+
+ROOM_VERSION = RoomVersions.V6
+
+
+class VerifiedSignatureCacheTestCase(unittest.HomeserverTestCase):
+    def prepare(self, reactor, clock, hs):
+        self.store = hs.get_datastore()
+        self.federation_client = hs.get_federation_client()
+
+        self.key = signedjson.key.generate_signing_key("1")
+        self.get_success(
+            self.store.store_server_verify_keys(
+                "other.server",
+                clock.time_msec(),
+                [
+                    (
+                        "other.server",
+                        "ed25519:1",
+                        FetchKeyResult(get_verify_key(self.key), 2 ** 62),
+                    )
+                ],
+            )
+        )
+
+    def _make_event(self, body="hello"):
+        event_dict = {
+            "room_id": "!room:other.server",
+            "sender": "@user:other.server",
+            "type": "m.room.message",
+            "content": {"body": body},
+            "depth": 1,
+            "prev_events": [],
+            "auth_events": [],
+            "origin_server_ts": 1000,
+        }
+        add_hashes_and_signatures(ROOM_VERSION, event_dict, "other.server", self.key)
+        return event_dict
+
+    def _check(self, event_dict):
+        """Checks the signatures on the event, returning the number of signatures
+        the keyring was asked to check.
+        """
+        keyring = self.federation_client.keyring
+        verify = keyring.verify_json_objects_for_server
+        checked = []
+
+        def verify_json_objects_for_server(server_and_json):
+            server_and_json = list(server_and_json)
+            checked.extend(server_and_json)
+            return verify(server_and_json)
+
+        event = make_event_from_dict(event_dict, ROOM_VERSION)
+        with patch.object(
+            keyring, "verify_json_objects_for_server", verify_json_objects_for_server
+        ):
+            d = self.federation_client._check_sigs_and_hash(ROOM_VERSION, event)
+            self.get_success(d)
+
+        return len(checked)
+
+    def test_not_checked_twice(self):
+        """The signatures on an event are only checked the first time it is
+        received.
+        """
+        event_dict = self._make_event()
+        self.assertEqual(self._check(event_dict), 1)
+        self.assertEqual(self._check(event_dict), 0)
+
+        # a different event is checked.
+        self.assertEqual(self._check(self._make_event("bye")), 1)
+
+    def test_bad_signatures_not_cached(self):
+        """Changing the signatures of an event we have seen means it is checked
+        again, and failed checks aren't remembered.
+        """
+        event_dict = self._make_event()
+        self.assertEqual(self._check(event_dict), 1)
+
+        event_dict["signatures"]["other.server"]["ed25519:1"] = "AAAA"
+        event = make_event_from_dict(event_dict, ROOM_VERSION)
+        for _ in range(2):
+            d = self.federation_client._check_sigs_and_hash(ROOM_VERSION, event)
+            self.get_failure(d, SynapseError)
+
+    @unittest.override_config(
+        {"federation_verification": {"persist_signature_cache": True}}
+    )
+    def test_persisted(self):
+        """Events whose signatures have been checked are remembered in the
+        database.
+        """
+        event_dict = self._make_event()
+        self.assertEqual(self._check(event_dict), 1)
+
+        cache_key = VerifiedSignatureCache.get_cache_key(
+            ROOM_VERSION,
+            prune_event(make_event_from_dict(event_dict, ROOM_VERSION)).get_pdu_json(),
+        )
+        self.assertEqual(
+            self.get_success(self.store.get_verified_event_signatures([cache_key])),
+            {cache_key},
+        )
+
+        # If we forget about it in memory, it is read from the database.
+        self.federation_client._signature_cache._cache.clear()
+        self.assertEqual(self._check(event_dict), 0)
+
+    @unittest.override_config({"federation_verification": {"signature_cache_size": 0}})
+    def test_disabled(self):
+        """Every event is checked if the cache is disabled."""
+        event_dict = self._make_event()
+        self.assertEqual(self._check(event_dict), 1)
+        self.assertEqual(self._check(event_dict), 1)
@@ -636,6 +636,14 @@ class FakeRedisPubSubProtocol(Protocol):
             self.send("OK")
         elif command == b"GET":
             self.send(None)
+        elif command == b"MGET":
+            self.send([None] * len(args))
+        elif command == b"DEL":
+            self.send(0)
+        elif command == b"INCR":
+            self.send(1)
+        elif command == b"PEXPIRE":
+            self.send(1)
         else:
             raise Exception("Unknown command")
 
@@ -518,3 +518,107 @@ class UserMediaStatisticsTestCase(unittest.HomeserverTestCase):
         returned_order = [row["user_id"] for row in channel.json_body["users"]]
         self.assertListEqual(expected_user_list, returned_order)
         self._check_fields(channel.json_body["users"])
+
+
+class DatabaseQueryStatisticsTestCase(unittest.HomeserverTestCase):
+    servlets = [
+        synapse.rest.admin.register_servlets,
+        login.register_servlets,
+    ]
+
+    def prepare(self, reactor, clock, hs):
+        self.admin_user = self.register_user("admin", "pass", admin=True)
+        self.admin_user_tok = self.login("admin", "pass")
+
+        self.other_user = self.register_user("user", "pass")
+        self.other_user_tok = self.login("user", "pass")
+
+        self.db_pool = hs.get_datastore().db_pool
+
+    def test_requester_is_no_admin(self):
+        """
+        If the user is not a server admin, an error 403 is returned.
+        """
+        for path in ("queries", "slow_queries"):
+            channel = self.make_request(
+                "GET",
+                "/_synapse/admin/v1/statistics/database/" + path,
+                access_token=self.other_user_tok,
+            )
+
+            self.assertEqual(
+                403, int(channel.result["code"]), msg=channel.result["body"]
+            )
+            self.assertEqual(Codes.FORBIDDEN, channel.json_body["errcode"])
+
+    def test_queries(self):
+        """
+        The time taken by queries is listed by transaction name and fingerprint.
+        """
+        for i in range(3):
+            self.get_success(
+                self.db_pool.execute(
+                    "test_queries", None, "SELECT ? FROM users LIMIT %d" % (i,), 1
+                )
+            )
+
+        channel = self.make_request(
+            "GET",
+            "/_synapse/admin/v1/statistics/database/queries?order_by=count&limit=1000",
+            access_token=self.admin_user_tok,
+        )
+
+        self.assertEqual(200, int(channel.result["code"]), msg=channel.result["body"])
+        queries = [
+            q for q in channel.json_body["queries"] if q["txn_name"] == "test_queries"
+        ]
+        self.assertEqual(len(queries), 1)
+        self.assertEqual(queries[0]["fingerprint"], "SELECT ? FROM users LIMIT ?")
+        self.assertEqual(queries[0]["count"], 3)
+        self.assertEqual(sum(queries[0]["buckets"].values()), 3)
+
+        counts = [q["count"] for q in channel.json_body["queries"]]
+        self.assertEqual(counts, sorted(counts, reverse=True))
+
+    def test_invalid_order_by(self):
+        channel = self.make_request(
+            "GET",
+            "/_synapse/admin/v1/statistics/database/queries?order_by=bad",
+            access_token=self.admin_user_tok,
+        )
+
+        self.assertEqual(400, int(channel.result["code"]), msg=channel.result["body"])
+        self.assertEqual(Codes.INVALID_PARAM, channel.json_body["errcode"])
+
+    def test_slow_queries(self):
+        """
+        Slow queries are captured with the shape of their parameters and their
+        query plan.
+        """
+        self.db_pool.query_profiler._slow_query_threshold_ms = 0
+
+        self.get_success(
+            self.db_pool.execute(
+                "test_slow_queries",
+                None,
+                "SELECT name FROM users WHERE name = ?",
+                "@secret:test",
+            )
+        )
+
+        channel = self.make_request(
+            "GET",
+            "/_synapse/admin/v1/statistics/database/slow_queries",
+            access_token=self.admin_user_tok,
+        )
+
+        self.assertEqual(200, int(channel.result["code"]), msg=channel.result["body"])
+        queries = [
+            q
+            for q in channel.json_body["queries"]
+            if q["txn_name"] == "test_slow_queries"
+        ]
+        self.assertEqual(len(queries), 1)
+        self.assertEqual(queries[0]["args"], ["str(12)"])
+        self.assertTrue(queries[0]["explain"])
+        self.assertNotIn("@secret:test", json.dumps(channel.json_body))
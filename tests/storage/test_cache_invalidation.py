@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+# Copyright 2021 The Matrix.org Foundation C.I.C.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from mock import Mock, call
+
+from synapse.replication.tcp.streams import CachesStream
+from synapse.storage.databases.main.cache import (
+    BULK_INVALIDATION_CACHE_NAME,
+    CURRENT_STATE_CACHE_NAME,
+    PREFIX_INVALIDATION_CACHE_NAME,
+)
+
+from tests.unittest import HomeserverTestCase
+
+CachesStreamRow = CachesStream.CachesStreamRow
+
+
+class CacheInvalidationRowsTestCase(HomeserverTestCase):
+    def prepare(self, reactor, clock, hs):
+        self.store = hs.get_datastore()
+
+        self.store._attempt_to_invalidate_cache = Mock()
+        self.store._attempt_to_invalidate_cache_prefix = Mock()
+        self.store._invalidate_state_caches = Mock()
+
+    def _process(self, *rows):
+        self.store._process_cache_invalidation_rows(
+            [CachesStreamRow(cache_func, keys, 0) for cache_func, keys in rows]
+        )
+
+    def test_bulk_row(self):
+        """A bulk row invalidates each of the keys in it."""
+        self._process(
+            (BULK_INVALIDATION_CACHE_NAME, ["get_thing", "2", "a", "b", "c", "d"])
+        )
+
+        self.assertCountEqual(
+            self.store._attempt_to_invalidate_cache.call_args_list,
+            [call("get_thing", ("a", "b")), call("get_thing", ("c", "d"))],
+        )
+
+    def test_prefix_row(self):
+        """A prefix row invalidates all the entries starting with the prefix."""
+        self._process((PREFIX_INVALIDATION_CACHE_NAME, ["get_thing", "a"]))
+
+        self.store._attempt_to_invalidate_cache_prefix.assert_called_once_with(
+            "get_thing", ("a",)
+        )
+        self.store._attempt_to_invalidate_cache.assert_not_called()
+
+    def test_dedupe_keys(self):
+        """Repeated invalidations of the same key in a batch are only applied once."""
+        self._process(
+            ("get_thing", ["a"]),
+            ("get_thing", ["a"]),
+            (BULK_INVALIDATION_CACHE_NAME, ["get_thing", "1", "a", "b"]),
+        )
+
+        self.assertCountEqual(
+            self.store._attempt_to_invalidate_cache.call_args_list,
+            [call("get_thing", ("a",)), call("get_thing", ("b",))],
+        )
+
+    def test_invalidate_all_supersedes_keys(self):
+        """Keys of a cache which is invalidated entirely in the same batch are
+        skipped.
+        """
+        self._process(
+            ("get_thing", ["a"]),
+            (PREFIX_INVALIDATION_CACHE_NAME, ["get_thing", "b"]),
+            ("get_thing", None),
+            ("get_other_thing", ["a"]),
+        )
+
+        self.assertCountEqual(
+            self.store._attempt_to_invalidate_cache.call_args_list,
+            [call("get_thing", None), call("get_other_thing", ("a",))],
+        )
+        self.store._attempt_to_invalidate_cache_prefix.assert_not_called()
+
+    def test_merge_current_state_rows(self):
+        """Current state invalidations for the same room are merged."""
+        self._process(
+            (CURRENT_STATE_CACHE_NAME, ["!room:test", "@a:test"]),
+            (CURRENT_STATE_CACHE_NAME, ["!room:test", "@b:test", "@a:test"]),
+        )
+
+        self.store._invalidate_state_caches.assert_called_once_with(
+            "!room:test", {"@a:test", "@b:test"}
+        )
+
+
+class SendBulkInvalidationTestCase(HomeserverTestCase):
+    def prepare(self, reactor, clock, hs):
+        self.store = hs.get_datastore()
+        self.store._send_invalidation_to_replication = Mock()
+
+    def test_chunking(self):
+        """Bulk invalidations are split into rows of a bounded size."""
+        key_tuples = [("user%d" % (i,), "device") for i in range(30)]
+        self.store._send_invalidation_to_replication_bulk(
+            Mock(), "get_thing", key_tuples
+        )
+
+        calls = self.store._send_invalidation_to_replication.call_args_list
+        self.assertEqual(len(calls), 2)
+
+        sent_keys = []
+        for (_, cache_name, keys), _ in calls:
+            self.assertEqual(cache_name, BULK_INVALIDATION_CACHE_NAME)
+            keys = list(keys)
+            self.assertEqual(keys[:2], ["get_thing", "2"])
+            self.assertLessEqual(len(keys) - 2, 50)
+            sent_keys.extend(keys[2:])
+
+        self.assertEqual(sent_keys, [element for key in key_tuples for element in key])
+
+    def test_no_keys(self):
+        """Nothing is sent if there are no keys to invalidate."""
+        self.store._send_invalidation_to_replication_bulk(Mock(), "get_thing", [])
+        self.store._send_invalidation_to_replication.assert_not_called()
@@ -13,7 +13,23 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-from synapse.storage.database import make_tuple_comparison_clause
+from mock import Mock, call
+
+from twisted.internet import defer
+
+from synapse.logging.context import LoggingContext
+from synapse.metrics.background_process_metrics import run_as_background_process
+from synapse.storage.database import (
+    REPLICA_STALE_MS,
+    DatabasePool,
+    InteractionPriority,
+    InteractionScheduler,
+    LoggingTransaction,
+    PreparedStatementCache,
+    _DatabaseReplica,
+    make_tuple_comparison_clause,
+    query_fingerprint,
+)
 from synapse.storage.engines import BaseDatabaseEngine
 
 from tests import unittest
@@ -50,3 +66,254 @@ class TupleComparisonClauseTestCase(unittest.TestCase):
             clause, "(a >= ? AND (a > ? OR (b >= ? AND (b > ? OR c > ?))))"
         )
         self.assertEqual(args, [1, 1, 2, 2, 3])
+
+
+class _DatabaseError(Exception):
+    pass
+
+
+class PreparedStatementCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.engine = _stub_db_engine(
+            convert_param_style=lambda self, sql: sql.replace("?", "%s")
+        )
+        self.engine.module = Mock(DatabaseError=_DatabaseError)
+        self.cache = PreparedStatementCache(
+            self.engine, max_per_connection=1, min_executions=2
+        )
+        self.cursor = Mock()
+        self.cursor.connection.autocommit = False
+
+    def _execute(self, sql, args):
+        self.cursor.execute.reset_mock()
+        txn = LoggingTransaction(
+            self.cursor, "test", self.engine, prepared_statements=self.cache
+        )
+        txn.execute(sql, args)
+        return txn
+
+    def test_prepare(self):
+        """Queries are prepared once they have been run enough times."""
+        self._execute("SELECT a FROM t WHERE b = ? AND c = ?", (1, 2))
+        self.cursor.execute.assert_called_once_with(
+            "SELECT a FROM t WHERE b = %s AND c = %s", (1, 2)
+        )
+
+        self._execute("SELECT a FROM t WHERE b = ? AND c = ?", (1, 2))
+        self.assertEqual(
+            self.cursor.execute.call_args_list,
+            [
+                call("SAVEPOINT synapse_prepare"),
+                call(
+                    "PREPARE synapse_stmt_0 AS SELECT a FROM t WHERE b = $1 AND c = $2"
+                ),
+                call("RELEASE SAVEPOINT synapse_prepare"),
+                call("EXECUTE synapse_stmt_0 (%s, %s)", (1, 2)),
+            ],
+        )
+
+        self._execute("SELECT a FROM t WHERE b = ? AND c = ?", (3, 4))
+        self.cursor.execute.assert_called_once_with(
+            "EXECUTE synapse_stmt_0 (%s, %s)", (3, 4)
+        )
+
+    def test_evict(self):
+        """The least recently used statements are deallocated."""
+        for _ in range(2):
+            self._execute("SELECT a FROM t WHERE b = ?", (1,))
+        for _ in range(2):
+            self._execute("SELECT a FROM u WHERE b = ?", (1,))
+        self.assertIn(call("DEALLOCATE synapse_stmt_0"), self.cursor.execute.mock_calls)
+
+        self._execute("SELECT a FROM t WHERE b = ?", (1,))
+        self.assertNotIn(
+            call("EXECUTE synapse_stmt_0 (%s)", (1,)), self.cursor.execute.mock_calls
+        )
+
+    def test_unpreparable(self):
+        """Queries which can't be prepared are run as usual."""
+
+        def execute(sql, *args):
+            if sql.startswith("PREPARE"):
+                raise _DatabaseError("could not determine data type")
+
+        self.cursor.execute.side_effect = execute
+        for _ in range(2):
+            self._execute("SELECT ? FROM t", (1,))
+        self.assertIn(
+            call("ROLLBACK TO SAVEPOINT synapse_prepare"),
+            self.cursor.execute.mock_calls,
+        )
+        self.assertEqual(self.cursor.execute.call_args, call("SELECT %s FROM t", (1,)))
+
+        self._execute("SELECT ? FROM t", (1,))
+        self.cursor.execute.assert_called_once_with("SELECT %s FROM t", (1,))
+
+        # queries with a literal `%` aren't prepared.
+        for _ in range(3):
+            self._execute("SELECT a FROM t WHERE b LIKE '%%' || ?", ("x",))
+            self.cursor.execute.assert_called_once_with(
+                "SELECT a FROM t WHERE b LIKE '%%' || %s", ("x",)
+            )
+
+    def test_discard_after_failure(self):
+        """Statements prepared in a failed transaction are prepared again."""
+        self._execute("SELECT a FROM t WHERE b = ?", (1,))
+        txn = self._execute("SELECT a FROM t WHERE b = ?", (1,))
+        txn.discard_newly_prepared()
+
+        self._execute("SELECT a FROM t WHERE b = ?", (1,))
+        self._execute("SELECT a FROM t WHERE b = ?", (1,))
+        self.assertIn(
+            call("PREPARE synapse_stmt_1 AS SELECT a FROM t WHERE b = $1"),
+            self.cursor.execute.mock_calls,
+        )
+
+
+class ReadReplicaTestCase(unittest.HomeserverTestCase):
+    def prepare(self, reactor, clock, hs):
+        self.db_pool = hs.get_datastore().db_pool
+
+        # Use the primary database as the "replica", so that we can check which
+        # pool interactions are run on.
+        self.replica_pool = Mock(wraps=self.db_pool._db_pool)
+        self.replica = _DatabaseReplica("replica", self.replica_pool)
+        self.db_pool._replicas = [self.replica]
+
+        self.get_success(self.db_pool._update_replica_positions())
+        self.replica_pool.reset_mock()
+
+    def _interaction(self, **kwargs):
+        return self.get_success(
+            self.db_pool.runInteraction("test", lambda txn: 1, **kwargs)
+        )
+
+    def test_positions(self):
+        """The position of registered streams on replicas is tracked."""
+        self.assertIn("events", self.replica.positions)
+        self.assertEqual(self.replica.updated_ms, self.clock.time_msec())
+
+    def test_read_only(self):
+        """Only read-only interactions are run on replicas."""
+        self.assertEqual(self._interaction(), 1)
+        self.replica_pool.runWithConnection.assert_not_called()
+
+        self.assertEqual(self._interaction(read_only=True), 1)
+        self.replica_pool.runWithConnection.assert_called_once()
+
+    def test_behind(self):
+        """Replicas which haven't caught up far enough aren't used."""
+        position = self.replica.positions["events"]
+
+        self._interaction(read_only=True, min_stream_positions={"events": position + 1})
+        self.replica_pool.runWithConnection.assert_not_called()
+
+        self._interaction(read_only=True, min_stream_positions={"events": position})
+        self.replica_pool.runWithConnection.assert_called_once()
+
+    def test_stale(self):
+        """Replicas whose positions haven't been updated recently aren't used."""
+        self.reactor.advance(REPLICA_STALE_MS / 1000)
+
+        self._interaction(read_only=True)
+        self.replica_pool.runWithConnection.assert_not_called()
+
+
+class InteractionSchedulerTestCase(unittest.TestCase):
+    def setUp(self):
+        self.scheduler = InteractionScheduler(2, 0.1)
+
+    def _acquire(self):
+        return defer.ensureDeferred(self.scheduler.acquire())
+
+    def test_limit(self):
+        """Only `max_background` interactions run at once."""
+        d1 = self._acquire()
+        d2 = self._acquire()
+        d3 = self._acquire()
+        self.successResultOf(d1)
+        self.successResultOf(d2)
+        self.assertNoResult(d3)
+
+        self.scheduler.release()
+        self.successResultOf(d3)
+
+    def test_throttle(self):
+        """Only one interaction runs at once while foreground work is waiting."""
+        for _ in range(20):
+            self.scheduler.record_foreground_wait(1)
+        self.assertTrue(self.scheduler.is_throttled())
+
+        d1 = self._acquire()
+        d2 = self._acquire()
+        self.successResultOf(d1)
+        self.assertNoResult(d2)
+
+        for _ in range(50):
+            self.scheduler.record_foreground_wait(0)
+        self.assertFalse(self.scheduler.is_throttled())
+
+        # Waiting interactions are started as others finish.
+        d3 = self._acquire()
+        self.assertNoResult(d3)
+        self.scheduler.release()
+        self.successResultOf(d2)
+        self.successResultOf(d3)
+
+
+class InteractionPriorityTestCase(unittest.HomeserverTestCase):
+    def test_priority(self):
+        """Interactions from maintenance jobs are background priority."""
+        get_priority = DatabasePool._get_interaction_priority
+
+        with LoggingContext("request"):
+            self.assertEqual(get_priority(None), InteractionPriority.FOREGROUND)
+            self.assertEqual(
+                get_priority(InteractionPriority.BACKGROUND),
+                InteractionPriority.BACKGROUND,
+            )
+
+        priorities = []
+
+        async def process():
+            priorities.append(get_priority(None))
+
+        run_as_background_process("background_updates", process)
+        run_as_background_process("federation_sender", process)
+        self.assertEqual(
+            priorities, [InteractionPriority.BACKGROUND, InteractionPriority.FOREGROUND]
+        )
+
+    def test_interaction(self):
+        """Interactions run at either priority."""
+        db_pool = self.hs.get_datastore().db_pool
+        for priority in InteractionPriority.iterconstants():
+            self.assertEqual(
+                self.get_success(
+                    db_pool.runInteraction("test", lambda txn: 1, priority=priority)
+                ),
+                1,
+            )
+
+
+class QueryFingerprintTestCase(unittest.TestCase):
+    def test_literals(self):
+        """Literals are replaced with placeholders."""
+        self.assertEqual(
+            query_fingerprint("SELECT a FROM t WHERE b = 'it''s' AND c > 10 LIMIT %s"),
+            "SELECT a FROM t WHERE b = ? AND c > ? LIMIT ?",
+        )
+        self.assertEqual(
+            query_fingerprint("SELECT e2e_keys FROM t"), "SELECT e2e_keys FROM t"
+        )
+
+    def test_lists(self):
+        """Lists of parameters and rows are collapsed."""
+        self.assertEqual(
+            query_fingerprint("SELECT a FROM t WHERE b IN (?, ?,?)"),
+            "SELECT a FROM t WHERE b IN (?, ...)",
+        )
+        self.assertEqual(
+            query_fingerprint("INSERT INTO t (a, b) VALUES (?, ?), (?, ?), (?, ?)"),
+            "INSERT INTO t (a, b) VALUES (?, ...), ...",
+        )
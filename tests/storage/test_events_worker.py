@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+# Copyright 2021 The Matrix.org Foundation C.I.C.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import synapse.rest.admin
+from synapse.api.constants import EventTypes
+from synapse.logging.context import LoggingContext, current_context
+from synapse.metrics.background_process_metrics import run_as_background_process
+from synapse.rest.client.v1 import login, room
+from synapse.storage.databases.main.events_worker import (
+    EVENT_FETCH_BACKGROUND_SIZE,
+    EventFetchPriority,
+)
+
+from tests.unittest import HomeserverTestCase
+
+
+class RejectedStateEventTestCase(HomeserverTestCase):
+    servlets = [
+        synapse.rest.admin.register_servlets_for_client_rest_resource,
+        room.register_servlets,
+        login.register_servlets,
+    ]
+
+    def prepare(self, reactor, clock, hs):
+        self.store = hs.get_datastore()
+
+        self.user_id = self.register_user("user", "pass")
+        self.tok = self.login("user", "pass")
+        self.room_id = self.helper.create_room_as(self.user_id, tok=self.tok)
+        self.event_id = self.helper.send_state(
+            self.room_id, EventTypes.Name, {"name": "A room"}, tok=self.tok
+        )["event_id"]
+
+        # Make the event look like a rejected event persisted before rejected
+        # events were added to state_events.
+        self.get_success(
+            self.store.db_pool.simple_insert(
+                "rejections",
+                {"event_id": self.event_id, "reason": "bad", "last_check": "1"},
+            )
+        )
+        self.get_success(
+            self.store.db_pool.simple_delete(
+                "state_events", {"event_id": self.event_id}, desc="test"
+            )
+        )
+        self.store._get_event_cache.clear()
+
+    def _get_event(self):
+        return self.get_success(
+            self.store.get_event(self.event_id, allow_rejected=True)
+        )
+
+    def test_rejected_state_event_without_state_events_row(self):
+        """The state key of old rejected state events is read from the event JSON
+        while the background update which fixes them up is pending.
+        """
+        self.get_success(
+            self.store.db_pool.simple_insert(
+                "background_updates",
+                {"update_name": "rejected_events_metadata", "progress_json": "{}"},
+            )
+        )
+        self.store.db_pool.updates._all_done = False
+
+        event = self._get_event()
+        self.assertTrue(event.is_state())
+        self.assertEqual(event.state_key, "")
+
+    def test_rejected_state_event_after_background_update(self):
+        """Once the background update is done, the state_events table is trusted."""
+        event = self._get_event()
+        self.assertTrue(self.store._rejected_events_in_state_events)
+        self.assertFalse(event._dict.is_decoded())
+
+
+class EventFetchPriorityTestCase(HomeserverTestCase):
+    def prepare(self, reactor, clock, hs):
+        self.store = hs.get_datastore()
+
+    def test_priority_of_request(self):
+        """Large requests and requests from background processes are background
+        priority.
+        """
+        with LoggingContext("request"):
+            self.assertEqual(
+                self.store._get_event_fetch_priority(["$event"]),
+                EventFetchPriority.INTERACTIVE,
+            )
+            self.assertEqual(
+                self.store._get_event_fetch_priority(
+                    ["$event%d" % (i,) for i in range(EVENT_FETCH_BACKGROUND_SIZE + 1)]
+                ),
+                EventFetchPriority.BACKGROUND,
+            )
+
+        priorities = []
+
+        async def background():
+            priorities.append(self.store._get_event_fetch_priority(["$event"]))
+            with LoggingContext("nested", parent_context=current_context()):
+                priorities.append(self.store._get_event_fetch_priority(["$event"]))
+
+        run_as_background_process("test", background)
+        self.assertEqual(priorities, [EventFetchPriority.BACKGROUND] * 2)
+
+    def _queue(self, priority):
+        self.store._event_fetch_lists[priority].append((["$event"], None, 0))
+
+    def test_next_priority(self):
+        """Interactive requests are preferred, but background requests are served
+        between them.
+        """
+        self.store._event_fetch_max_background = 2
+        next_priority = self.store._next_event_fetch_priority
+
+        self.assertIsNone(next_priority(None))
+
+        self._queue(EventFetchPriority.BACKGROUND)
+        self.assertEqual(next_priority(None), EventFetchPriority.BACKGROUND)
+
+        self._queue(EventFetchPriority.INTERACTIVE)
+        self.assertEqual(next_priority(None), EventFetchPriority.INTERACTIVE)
+        self.assertEqual(
+            next_priority(EventFetchPriority.BACKGROUND),
+            EventFetchPriority.INTERACTIVE,
+        )
+        self.assertEqual(
+            next_priority(EventFetchPriority.INTERACTIVE),
+            EventFetchPriority.BACKGROUND,
+        )
+
+    def test_background_limit(self):
+        """Background requests aren't served by every thread at once."""
+        self.store._event_fetch_max_background = 2
+        self.store._event_fetch_background_ongoing = 2
+        next_priority = self.store._next_event_fetch_priority
+
+        self._queue(EventFetchPriority.BACKGROUND)
+        self.assertIsNone(next_priority(None))
+
+        self._queue(EventFetchPriority.INTERACTIVE)
+        self.assertEqual(
+            next_priority(EventFetchPriority.INTERACTIVE),
+            EventFetchPriority.INTERACTIVE,
+        )
+
+    def test_fetch(self):
+        """Events can be fetched at either priority."""
+        with LoggingContext("request"):
+            self.assertEqual(self.get_success(self.store._enqueue_events(["$a"])), {})
+
+        d = run_as_background_process("test", self.store._enqueue_events, ["$a"])
+        self.assertEqual(self.get_success(d), {})
+        self.assertEqual(self.store._event_fetch_background_ongoing, 0)
@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+# Copyright 2021 The Matrix.org Foundation C.I.C.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from mock import patch
+
+from synapse.config.cache import properties
+from synapse.util.caches import caches_by_name
+from synapse.util.caches.autotune import CacheAutoTuner
+from synapse.util.caches.lrucache import (
+    LruCache,
+    _evicted_key_tracking_config,
+    enable_evicted_key_tracking,
+)
+
+from tests import unittest
+from tests.unittest import override_config
+
+
+class CacheAutoTunerTestCase(unittest.HomeserverTestCase):
+    def prepare(self, reactor, clock, hs):
+        enable_evicted_key_tracking()
+        self.addCleanup(setattr, _evicted_key_tracking_config, "enabled", False)
+
+        # Only tune the caches created by the test.
+        patcher = patch.dict(caches_by_name, clear=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(properties.auto_tuned_factors.clear)
+
+        self.hot_cache = LruCache(100, cache_name="test_autotune_hot")
+        self.cold_cache = LruCache(100, cache_name="test_autotune_cold")
+        self.tuner = CacheAutoTuner(hs)
+
+    def _thrash(self, cache: LruCache) -> None:
+        """Cycle through more keys than the cache can hold, so that every read
+        misses a recently evicted key.
+        """
+        for _ in range(2):
+            for i in range(cache.max_size + 10):
+                if cache.get(i) is None:
+                    cache[i] = i
+
+    @override_config({"caches": {"global_factor": 1.0}})
+    def test_moves_space_to_cache_with_ghost_hits(self):
+        """Entries are moved from caches without ghost hits to those with them,
+        keeping the total the same.
+        """
+        self._thrash(self.hot_cache)
+        self.cold_cache["key"] = 1
+
+        self.tuner.tune()
+
+        self.assertEqual(self.hot_cache.max_size, 110)
+        self.assertEqual(self.cold_cache.max_size, 90)
+
+        # Nothing changes if there have been no more ghost hits.
+        self.tuner.tune()
+        self.assertEqual(self.hot_cache.max_size, 110)
+        self.assertEqual(self.cold_cache.max_size, 90)
+
+    @override_config(
+        {"caches": {"global_factor": 1.0, "auto_tune": {"min_factor": 0.95}}}
+    )
+    def test_min_factor(self):
+        """Caches aren't shrunk below the minimum factor."""
+        self._thrash(self.hot_cache)
+
+        self.tuner.tune()
+
+        self.assertEqual(self.hot_cache.max_size, 105)
+        self.assertEqual(self.cold_cache.max_size, 95)
+
+    @override_config(
+        {
+            "caches": {
+                "global_factor": 1.0,
+                "per_cache_factors": {"test_autotune_cold": 1},
+            }
+        }
+    )
+    def test_ignores_configured_caches(self):
+        """Caches with a factor set in the config aren't tuned."""
+        self._thrash(self.hot_cache)
+
+        self.tuner.tune()
+
+        self.assertEqual(self.hot_cache.max_size, 100)
+        self.assertEqual(self.cold_cache.max_size, 100)
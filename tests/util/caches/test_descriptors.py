@@ -28,10 +28,12 @@ from synapse.logging.context import (
     current_context,
     make_deferred_yieldable,
 )
+from synapse.util.async_helpers import maybe_awaitable
 from synapse.util.caches import descriptors
 from synapse.util.caches.descriptors import cached, lru_cache
 
 from tests import unittest
+from tests.server import get_clock
 from tests.test_utils import get_awaitable_result
 
 logger = logging.getLogger(__name__)
@@ -738,3 +740,231 @@ class CachedListDescriptorTestCase(unittest.TestCase):
         obj.fn.invalidate((10, 2))
         invalidate0.assert_called_once()
         invalidate1.assert_called_once()
+
+
+class CachedListCoalescingTestCase(unittest.TestCase):
+    def setUp(self):
+        self.reactor, clock = get_clock()
+
+        hs = mock.Mock()
+        hs.get_clock.return_value = clock
+
+        class Cls:
+            def __init__(self):
+                self.hs = hs
+                self.calls = []
+
+            @descriptors.cached()
+            def fn(self, arg1, arg2):
+                pass
+
+            @descriptors.cachedList("fn", "args1", coalesce_window_ms=0)
+            async def list_fn(self, args1, arg2):
+                self.calls.append((sorted(args1), arg2))
+                return {arg: arg * arg2 for arg in args1}
+
+        self.obj = Cls()
+
+    def test_coalesce(self):
+        """Misses from concurrent calls are fetched with a single call."""
+        d1 = defer.ensureDeferred(self.obj.list_fn([1, 2], 10))
+        d2 = defer.ensureDeferred(self.obj.list_fn([2, 3], 10))
+        d3 = defer.ensureDeferred(self.obj.list_fn([4], 100))
+
+        self.assertEqual(self.obj.calls, [])
+        self.reactor.pump([0])
+
+        # Calls with the same non-list arguments are batched together.
+        self.assertCountEqual(self.obj.calls, [([1, 2, 3], 10), ([4], 100)])
+
+        self.assertEqual(self.successResultOf(d1), {1: 10, 2: 20})
+        self.assertEqual(self.successResultOf(d2), {2: 20, 3: 30})
+        self.assertEqual(self.successResultOf(d3), {4: 400})
+
+        # The results should have been cached.
+        self.obj.calls = []
+        d = defer.ensureDeferred(self.obj.list_fn([1, 2, 3], 10))
+        self.assertEqual(self.successResultOf(d), {1: 10, 2: 20, 3: 30})
+        self.assertEqual(self.obj.calls, [])
+
+
+class _FakeExternalCache:
+    """An in-memory stand-in for `ExternalCache`."""
+
+    def __init__(self):
+        self.data = {}
+
+    def is_enabled(self):
+        return True
+
+    async def get_many(self, cache_name, keys):
+        return {
+            key: self.data[(cache_name, key)]
+            for key in keys
+            if (cache_name, key) in self.data
+        }
+
+    async def set(self, cache_name, key, value, expiry_ms):
+        self.data[(cache_name, key)] = value
+
+    async def incr(self, cache_name, key, expiry_ms=None):
+        value = self.data.get((cache_name, key), 0) + 1
+        self.data[(cache_name, key)] = value
+        return value
+
+    async def delete(self, cache_name, key):
+        self.data.pop((cache_name, key), None)
+
+
+class ExternalCacheTierTestCase(unittest.TestCase):
+    def setUp(self):
+        self.external_cache = _FakeExternalCache()
+
+        hs = mock.Mock()
+        hs.get_external_cache.return_value = self.external_cache
+        hs.config.caches.redis_second_level_cache = True
+        self.hs = hs
+
+        class Cls:
+            def __init__(self):
+                self.hs = hs
+                self.mock = mock.Mock()
+
+            @descriptors.cached(external_cache_expiry_ms=60000)
+            async def fn(self, arg1):
+                return await maybe_awaitable(self.mock(arg1))
+
+            @descriptors.cachedList("fn", "args1")
+            async def list_fn(self, args1):
+                return self.mock(args1)
+
+        # Two objects with separate in-memory caches, but sharing an external
+        # cache, like two workers.
+        self.obj1 = Cls()
+        self.obj2 = Cls()
+
+    @defer.inlineCallbacks
+    def test_shared_results(self):
+        """A miss on one worker is satisfied by another worker's result."""
+        self.obj1.mock.return_value = ["fish"]
+        r = yield self.obj1.fn("a")
+        self.assertEqual(r, ["fish"])
+        self.obj1.mock.assert_called_once_with("a")
+
+        r = yield self.obj2.fn("a")
+        self.assertEqual(r, ["fish"])
+        self.obj2.mock.assert_not_called()
+
+    @defer.inlineCallbacks
+    def test_none_is_cached(self):
+        """`None` results are shared too."""
+        self.obj1.mock.return_value = None
+        yield self.obj1.fn("a")
+
+        r = yield self.obj2.fn("a")
+        self.assertIsNone(r)
+        self.obj2.mock.assert_not_called()
+
+    @defer.inlineCallbacks
+    def test_invalidate(self):
+        """Invalidating the in-memory cache invalidates the entry in the external
+        cache.
+        """
+        self.obj1.mock.return_value = "fish"
+        yield self.obj1.fn("a")
+
+        self.obj1.fn.invalidate(("a",))
+
+        self.obj2.mock.return_value = "chips"
+        r = yield self.obj2.fn("a")
+        self.assertEqual(r, "chips")
+        self.obj2.mock.assert_called_once_with("a")
+
+        self.obj2.fn.invalidate_all()
+
+        self.obj1.mock.return_value = "peas"
+        r = yield self.obj1.fn("a")
+        self.assertEqual(r, "peas")
+
+    @defer.inlineCallbacks
+    def test_invalidated_during_fetch(self):
+        """Results which were invalidated while being fetched aren't stored in the
+        external cache.
+        """
+        d = defer.Deferred()
+        self.obj1.mock.return_value = d
+
+        fetch = self.obj1.fn("a")
+        self.obj1.fn.invalidate(("a",))
+        d.callback("fish")
+        r = yield fetch
+
+        self.assertEqual(r, "fish")
+        self.assertNotIn(("fn", '"a"'), self.external_cache.data)
+
+    @defer.inlineCallbacks
+    def test_stale_result_from_other_worker(self):
+        """A result fetched before an invalidation, and written to the external
+        cache by a worker which hasn't processed the invalidation yet, isn't used by
+        workers which have.
+        """
+        d = defer.Deferred()
+        self.obj1.mock.return_value = d
+        fetch = self.obj1.fn("a")
+
+        # The second worker processes the invalidation before the first one has
+        # written its result.
+        self.obj2.fn.invalidate(("a",))
+        d.callback("stale")
+        r = yield fetch
+        self.assertEqual(r, "stale")
+
+        self.obj2.mock.return_value = "fresh"
+        r = yield self.obj2.fn("a")
+        self.assertEqual(r, "fresh")
+        self.obj2.mock.assert_called_once_with("a")
+
+    @defer.inlineCallbacks
+    def test_disabled_by_config(self):
+        """The external cache isn't used unless enabled in the config."""
+        self.hs.config.caches.redis_second_level_cache = False
+
+        class Cls:
+            def __init__(self, hs):
+                self.hs = hs
+
+            @descriptors.cached(external_cache_expiry_ms=60000)
+            async def fn(self, arg1):
+                return arg1
+
+        obj = Cls(self.hs)
+        r = yield obj.fn("a")
+        self.assertEqual(r, "a")
+        self.assertIsNone(obj.fn.external_tier)
+        self.assertEqual(self.external_cache.data, {})
+
+    def test_cache_context(self):
+        """The external cache can't be used with a cache context."""
+        with self.assertRaises(ValueError):
+
+            @descriptors.cached(cache_context=True, external_cache_expiry_ms=60000)
+            async def fn(self, arg1, cache_context):
+                pass
+
+    @defer.inlineCallbacks
+    def test_cached_list(self):
+        """Batch lookups consult the external cache before calling the function."""
+        self.obj1.mock.return_value = {10: "fish"}
+        r = yield self.obj1.list_fn([10])
+        self.assertEqual(r, {10: "fish"})
+
+        self.obj2.mock.return_value = {20: "chips"}
+        r = yield self.obj2.list_fn([10, 20, 30])
+        self.assertEqual(r, {10: "fish", 20: "chips", 30: None})
+        self.obj2.mock.assert_called_once_with([20, 30])
+
+        # The results should now be shared with the first object.
+        self.obj1.mock.reset_mock()
+        r = yield self.obj1.fn(20)
+        self.assertEqual(r, "chips")
+        self.obj1.mock.assert_not_called()
@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+# Copyright 2021 The Matrix.org Foundation C.I.C.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import json
+import os
+import shutil
+import tempfile
+
+from mock import Mock
+
+from twisted.internet import defer
+
+import synapse.rest.admin
+from synapse.rest.client.v1 import login, room
+
+from tests import unittest
+
+
+class CacheSnapshotTestCase(unittest.HomeserverTestCase):
+    servlets = [
+        synapse.rest.admin.register_servlets_for_client_rest_resource,
+        room.register_servlets,
+        login.register_servlets,
+    ]
+
+    def make_homeserver(self, reactor, clock):
+        self.snapshot_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.snapshot_dir)
+        self.snapshot_path = os.path.join(self.snapshot_dir, "snapshot.json")
+
+        config = self.default_config()
+        config["event_cache_size"] = 100
+        config["caches"] = {
+            "snapshot": {
+                "path": self.snapshot_path,
+                "caches": [
+                    "*getEvent*",
+                    "get_users_in_room",
+                    "_get_joined_profile_from_event_id",
+                ],
+                "restore_timeout": "10s",
+            }
+        }
+        return self.setup_test_homeserver(config=config)
+
+    def prepare(self, reactor, clock, hs):
+        self.store = hs.get_datastore()
+        self.snapshotter = hs.get_cache_snapshotter()
+
+        self.user_id = self.register_user("user", "pass")
+        self.tok = self.login("user", "pass")
+        self.room_id = self.helper.create_room_as(self.user_id, tok=self.tok)
+        self.event_id = self.helper.send(self.room_id, "hi", tok=self.tok)["event_id"]
+
+    def test_save_and_restore(self):
+        """Entries saved in the snapshot are fetched into the caches again when it
+        is restored.
+        """
+        self.get_success(self.store.get_users_in_room(self.room_id))
+        self.get_success(self.store.get_event(self.event_id))
+
+        self.snapshotter.save()
+
+        with open(self.snapshot_path) as f:
+            snapshot = json.load(f)
+        self.assertIn([self.event_id], snapshot["caches"]["*getEvent*"])
+        self.assertIn(self.room_id, snapshot["caches"]["get_users_in_room"])
+
+        self.store.get_users_in_room.invalidate_all()
+        self.store._get_event_cache.clear()
+
+        self.get_success(self.snapshotter.restore())
+
+        self.assertIsNotNone(self.store.get_users_in_room.cache.get(self.room_id, None))
+        self.assertIsNotNone(self.store._get_event_cache.get((self.event_id,)))
+
+    def test_restore_missing_snapshot(self):
+        """Restoring without a snapshot file leaves the caches cold."""
+        self.store._get_event_cache.clear()
+        self.get_success(self.snapshotter.restore())
+        self.assertIsNone(self.store._get_event_cache.get((self.event_id,)))
+
+    def test_restore_corrupt_snapshot(self):
+        """A corrupt snapshot is ignored."""
+        with open(self.snapshot_path, "w") as f:
+            f.write("{not json")
+
+        self.get_success(self.snapshotter.restore())
+
+    def test_restore_with_cached_list(self):
+        """Caches with a `@cachedList` method are restored in batches with it."""
+        state = self.get_success(self.store.get_current_state_ids(self.room_id))
+        member_event_id = state[("m.room.member", self.user_id)]
+
+        with open(self.snapshot_path, "w") as f:
+            json.dump(
+                {
+                    "version": 1,
+                    "caches": {"_get_joined_profile_from_event_id": [member_event_id]},
+                },
+                f,
+            )
+
+        list_method = Mock(side_effect=self.store._get_joined_profiles_from_event_ids)
+        self.store._get_joined_profiles_from_event_ids = list_method
+
+        self.get_success(self.snapshotter.restore())
+
+        list_method.assert_called_once_with(event_ids=[member_event_id])
+        cache = self.store._get_joined_profile_from_event_id.cache
+        self.assertIsNotNone(cache.get(member_event_id, None))
+
+    def test_restore_timeout(self):
+        """Restoring gives up if it takes too long."""
+        self.get_success(self.store.get_users_in_room(self.room_id))
+        self.snapshotter.save()
+
+        never = defer.Deferred()
+        self.snapshotter._get_loader = Mock(return_value=lambda keys: never)
+
+        self.get_success(self.snapshotter.restore(), by=1)
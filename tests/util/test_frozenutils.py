@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+# Copyright 2021 The Matrix.org Foundation C.I.C.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from canonicaljson import encode_canonical_json
+
+from synapse.util import json_encoder
+from synapse.util.frozenutils import FrozenDictView, unfreeze
+
+from .. import unittest
+
+
+class FrozenDictViewTestCase(unittest.TestCase):
+    def setUp(self):
+        self.d = {"a": {"b": [1, {"c": 2}]}, "d": "e"}
+        self.view = FrozenDictView(self.d)
+
+    def test_read(self):
+        """Nested values are returned as read-only views without copying."""
+        self.assertEqual(self.view["d"], "e")
+        self.assertIsInstance(self.view["a"], FrozenDictView)
+        self.assertIs(self.view["a"].get_underlying_dict(), self.d["a"])
+        self.assertEqual(self.view["a"]["b"], (1, FrozenDictView({"c": 2})))
+        self.assertEqual(self.view, self.d)
+
+    def test_nested_views_are_reused(self):
+        """Reading a nested value twice doesn't convert it again."""
+        self.assertIs(self.view["a"], self.view["a"])
+        self.assertIs(self.view["a"]["b"], self.view["a"]["b"])
+
+    def test_read_only(self):
+        """Views can't be modified."""
+        with self.assertRaises(TypeError):
+            self.view["d"] = "f"
+        with self.assertRaises(TypeError):
+            self.view["a"]["b"] = []
+        with self.assertRaises(AttributeError):
+            self.view["a"]["b"].append(3)
+
+    def test_encode(self):
+        """Views can be encoded as JSON."""
+        self.assertEqual(json_encoder.encode(self.view), json_encoder.encode(self.d))
+        self.assertEqual(
+            encode_canonical_json({"view": self.view}),
+            encode_canonical_json({"view": self.d}),
+        )
+
+    def test_unfreeze(self):
+        """Unfreezing a view gives a copy of the underlying dict."""
+        d = unfreeze(self.view)
+        self.assertEqual(d, self.d)
+        self.assertIsNot(d, self.d)
@@ -16,7 +16,17 @@
 
 from mock import Mock
 
-from synapse.util.caches.lrucache import LruCache
+from synapse.util.caches import EvictionReason
+from synapse.util.caches.lrucache import (
+    LruCache,
+    _evicted_key_tracking_config,
+    _expiry_config,
+    _get_size_of,
+    _memory_tracker,
+    enable_evicted_key_tracking,
+    setup_cache_memory_limit,
+    setup_expire_lru_cache_entries,
+)
 from synapse.util.caches.treecache import TreeCache
 
 from tests import unittest
@@ -110,6 +120,21 @@ class LruCacheCallbacksTestCase(unittest.HomeserverTestCase):
         cache.set("key", "value")
         self.assertEquals(m.call_count, 1)
 
+    def test_callbacks_not_shared(self):
+        """Callbacks added to one entry aren't run when another entry is removed."""
+        m = Mock()
+        cache = LruCache(2)
+
+        cache.setdefault("key1", "value1")
+        cache.setdefault("key2", "value2")
+        cache.get("key1", callbacks=[m])
+
+        cache.pop("key2")
+        self.assertFalse(m.called)
+
+        cache.pop("key1")
+        self.assertEquals(m.call_count, 1)
+
     def test_multi_get(self):
         m = Mock()
         cache = LruCache(1)
@@ -261,3 +286,187 @@ class LruCacheSizedTestCase(unittest.HomeserverTestCase):
         self.assertEquals(cache["key3"], [3])
         self.assertEquals(cache["key4"], [4])
         self.assertEquals(cache["key5"], [5, 6])
+
+
+class LruCacheMemoryLimitTestCase(unittest.HomeserverTestCase):
+    def default_config(self):
+        config = super().default_config()
+        # Allow room for roughly three of the entries used in these tests.
+        entry_size = _get_size_of("key1") + _get_size_of("x" * 1000)
+        config["caches"] = {"global_max_bytes": entry_size * 3 + 100}
+        return config
+
+    def prepare(self, reactor, clock, homeserver):
+        setup_cache_memory_limit(homeserver)
+
+    def tearDown(self):
+        _memory_tracker.reset()
+
+    def test_evicts_coldest_across_caches(self):
+        """Entries are evicted in least recently used order across all caches once
+        the global memory limit is exceeded.
+        """
+        cache1 = LruCache(10)
+        cache2 = LruCache(10)
+
+        cache1["key1"] = "x" * 1000
+        cache2["key2"] = "x" * 1000
+        cache1["key3"] = "x" * 1000
+        cache2["key4"] = "x" * 1000
+
+        # Touch the first entry, so that the entry in cache2 is now the coldest.
+        self.assertEqual(cache1["key1"], "x" * 1000)
+
+        self.reactor.advance(10)
+
+        self.assertIn("key1", cache1)
+        self.assertNotIn("key2", cache2)
+        self.assertIn("key3", cache1)
+        self.assertIn("key4", cache2)
+        self.assertLessEqual(
+            _memory_tracker.total_bytes, self.hs.config.caches.global_max_bytes
+        )
+
+    def test_removed_entries_are_untracked(self):
+        """Entries removed from a cache no longer count towards the limit."""
+        cache = LruCache(10, keylen=2, cache_type=TreeCache)
+
+        cache[("a", "b")] = "x" * 1000
+        cache[("a", "c")] = "x" * 1000
+        cache[("d", "e")] = "x" * 1000
+        self.assertGreater(_memory_tracker.total_bytes, 0)
+
+        cache.pop(("d", "e"))
+        cache.del_multi(("a",))
+        self.assertEqual(_memory_tracker.total_bytes, 0)
+
+        cache[("f", "g")] = "x" * 1000
+        cache.clear()
+        self.assertEqual(_memory_tracker.total_bytes, 0)
+
+    def test_metrics(self):
+        """Named caches report their estimated memory usage."""
+        cache = LruCache(10, cache_name="test_memory_metrics")
+
+        cache["key1"] = "x" * 1000
+        self.assertEqual(cache.metrics.memory_usage, _memory_tracker.total_bytes)
+
+        cache["key1"] = "x" * 10
+        self.assertEqual(cache.metrics.memory_usage, _memory_tracker.total_bytes)
+
+        cache.pop("key1")
+        self.assertEqual(cache.metrics.memory_usage, 0)
+
+
+class TimeEvictionTestCase(unittest.HomeserverTestCase):
+    def prepare(self, reactor, clock, homeserver):
+        setup_expire_lru_cache_entries(homeserver)
+
+    def tearDown(self):
+        _expiry_config.default_expiry_ms = None
+        _expiry_config.clock = None
+        _expiry_config.started = False
+
+    def test_evict(self):
+        """Entries which haven't been accessed within the expiry time are dropped."""
+        cache = LruCache(5, clock=self.clock, expiry_ms=60 * 1000)
+
+        cache["key1"] = 1
+        cache["key2"] = 2
+
+        self.reactor.advance(45)
+        cache["key3"] = 3
+        # Reading an entry resets its expiry time.
+        self.assertEqual(cache["key1"], 1)
+
+        self.reactor.advance(45)
+        self.assertEqual(cache.get("key1"), 1)
+        self.assertEqual(cache.get("key2"), None)
+        self.assertEqual(cache.get("key3"), 3)
+
+        self.reactor.advance(120)
+        self.assertEqual(len(cache), 0)
+
+    @override_config({"caches": {"expiry_time": "1m"}})
+    def test_default_expiry(self):
+        """Caches without their own expiry time use the configured default."""
+        cache = LruCache(5, clock=self.clock)
+        cache["key"] = 1
+
+        self.reactor.advance(45)
+        self.assertEqual(cache.get("key"), 1)
+
+        self.reactor.advance(120)
+        self.assertEqual(cache.get("key"), None)
+
+    def test_no_expiry(self):
+        """Entries aren't expired if no expiry time has been configured."""
+        cache = LruCache(5, clock=self.clock)
+        cache["key"] = 1
+
+        self.reactor.advance(24 * 60 * 60)
+        self.assertEqual(cache.get("key"), 1)
+
+        # We don't record access times if nothing expires.
+        self.assertIsNone(cache.get_last_access_ts_ms("key"))
+
+    def test_metrics(self):
+        """Expired entries are counted separately to entries evicted for size."""
+        cache = LruCache(
+            1, cache_name="test_time_eviction", clock=self.clock, expiry_ms=1000
+        )
+
+        cache["key1"] = 1
+        cache["key2"] = 2
+        self.reactor.advance(60)
+
+        self.assertEqual(cache.metrics.eviction_size_by_reason[EvictionReason.size], 1)
+        self.assertEqual(cache.metrics.eviction_size_by_reason[EvictionReason.time], 1)
+
+
+class EvictedKeyTrackingTestCase(unittest.TestCase):
+    def setUp(self):
+        enable_evicted_key_tracking()
+
+    def tearDown(self):
+        _evicted_key_tracking_config.enabled = False
+
+    def test_ghost_hits(self):
+        """Misses on keys which were evicted for space are counted as ghost hits."""
+        cache = LruCache(2, cache_name="test_ghost_hits")
+
+        cache["key1"] = 1
+        cache["key2"] = 2
+        cache["key3"] = 3
+        cache["key4"] = 4
+
+        self.assertIsNone(cache.get("key1"))
+        self.assertIsNone(cache.get("other"))
+        self.assertEqual(cache.metrics.misses, 2)
+        self.assertEqual(cache.metrics.ghost_hits, 1)
+
+        # Each evicted key is only counted once.
+        self.assertIsNone(cache.get("key1"))
+        self.assertEqual(cache.metrics.ghost_hits, 1)
+
+    def test_invalidated_keys_not_counted(self):
+        """Misses on keys which were invalidated aren't counted as ghost hits."""
+        cache = LruCache(1, cache_name="test_ghost_hits_invalidated")
+
+        cache["key1"] = 1
+        cache["key2"] = 2
+        cache.invalidate("key1")
+
+        self.assertIsNone(cache.get("key1"))
+        self.assertEqual(cache.metrics.ghost_hits, 0)
+
+    def test_disabled(self):
+        """Ghost hits aren't counted unless evicted key tracking is enabled."""
+        _evicted_key_tracking_config.enabled = False
+        cache = LruCache(1, cache_name="test_ghost_hits_disabled")
+
+        cache["key1"] = 1
+        cache["key2"] = 2
+
+        self.assertIsNone(cache.get("key1"))
+        self.assertEqual(cache.metrics.ghost_hits, 0)
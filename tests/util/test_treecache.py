@@ -83,3 +83,14 @@ class TreeCacheTestCase(unittest.TestCase):
         cache[("a",)] = "A"
         self.assertTrue(("a",) in cache)
         self.assertFalse(("b",) in cache)
+
+    def test_dict_values(self):
+        """Values which are themselves dicts are not mistaken for subtrees."""
+        cache = TreeCache()
+        cache[("a", "a")] = {"x": 1}
+        cache[("a", "b")] = {}
+        self.assertEquals(cache.get(("a", "a")), {"x": 1})
+        self.assertEquals(cache.get(("a",)), None)
+        self.assertEquals(len(cache), 2)
+        self.assertEquals(cache.pop(("a",)), {"a": {"x": 1}, "b": {}})
+        self.assertEquals(len(cache), 0)